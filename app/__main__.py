@@ -0,0 +1,43 @@
+import sys
+import json
+import logging
+import argparse
+from app.db import load_environment, connection_settings, create_client
+
+logger = logging.getLogger(__name__)
+
+
+def run_etl() -> int:
+    """
+    Run the ETL pipeline once on the collection of the environment, as the scheduled job of the API would.
+
+    Returns:
+        int: The exit status, 0 if the run succeeded and 1 if it failed.
+    """
+    from app.pipeline import etl_pipeline
+    cluster_uri, database_name, collection_name = connection_settings()
+    client = create_client(cluster_uri)
+    stages, spans = {}, {}
+    try:
+        counts = etl_pipeline(client[database_name][collection_name], stages, spans=spans)
+    except Exception:
+        return 1
+    finally:
+        client.close()
+    print(json.dumps({'counts': counts, 'stages': stages, 'spans': spans}, indent=4))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app', description='Run the ETL pipeline without the API.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('etl', help='Extract, transform and load the input files once, then exit.')
+    parser.parse_args(argv)
+
+    load_environment()
+    logging.basicConfig(level=logging.INFO)
+    return run_etl()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
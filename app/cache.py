@@ -0,0 +1,148 @@
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+# A serialized response, as stored in the cache
+CachedResponse = namedtuple('CachedResponse', ['status_code', 'content', 'media_type', 'headers'])
+
+# Generation marker of a cache that has not read the marker of its collection yet
+UNSEEN = object()
+
+
+class ResponseCache:
+    """
+    Bounded in-process LRU cache of serialized responses, with an optional time to live.
+
+    The cache holds the responses of the current load generation only. invalidate() starts a new generation
+    and empties the cache, and responses computed during the previous generation are refused by put(). Loads
+    committed by other processes are detected with the generation marker they write (see
+    app.load.mark_generation): the marker is read again at most every 'check_interval' seconds, and
+    observe() invalidates the cache when it changed.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 0, max_entry_bytes: int = 1000000,
+                 check_interval: float = 1.0):
+        """
+        Args:
+            maxsize (int): The maximum number of cached responses. 0 disables the cache.
+            ttl (float): The number of seconds a response stays valid. 0 keeps it until it is evicted or a new
+                         generation is observed.
+            max_entry_bytes (int): The size above which a response is not cached.
+            check_interval (float): The number of seconds between two reads of the generation marker. 0 reads
+                                    it on every lookup.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.marker = UNSEEN
+        self.checked_at = None
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def configure(self, maxsize: int = 256, ttl: float = 0, max_entry_bytes: int = 1000000,
+                  check_interval: float = 1.0):
+        """
+        Change the limits of the cache, which is emptied. The arguments are those of the constructor.
+        """
+        with self.lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self.max_entry_bytes = max_entry_bytes
+            self.check_interval = check_interval
+            self.entries.clear()
+            self.marker = UNSEEN
+            self.checked_at = None
+
+    def check_due(self) -> bool:
+        """
+        Tell whether the generation marker must be read, and if so claim the check, so that concurrent lookups
+        read it only once per 'check_interval'.
+
+        Returns:
+            bool: True when the caller must read the marker and pass it to observe().
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.checked_at is not None and now - self.checked_at < self.check_interval:
+                return False
+            self.checked_at = now
+            return True
+
+    def observe(self, marker):
+        """
+        Invalidate the cache if the generation marker of the collection changed since it was last read.
+
+        Args:
+            marker: The generation marker read from the database, None when no load wrote one yet.
+        """
+        with self.lock:
+            changed = self.marker is not UNSEEN and marker != self.marker
+            self.marker = marker
+        if changed:
+            self.invalidate()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key):
+        """
+        Look up a response.
+
+        Args:
+            key: The key of the response, built from the request path and query parameters.
+
+        Returns:
+            CachedResponse or None: The cached response, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                self.counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def put(self, key, response: CachedResponse, generation: int = None):
+        """
+        Store a response, evicting the least recently used ones beyond 'maxsize'.
+
+        Args:
+            key: The key of the response.
+            response (CachedResponse): The serialized response.
+            generation (int, optional): The generation the response was computed in. The response is
+                                        discarded if a new generation started since then.
+        """
+        if not self.enabled or len(response.content) > self.max_entry_bytes:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (response, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self):
+        """Start a new load generation and drop every cached response."""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.counters['invalidations'] += 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: The hit, miss, eviction, expiration and invalidation counters and the current size.
+        """
+        with self.lock:
+            return dict(self.counters, size=len(self.entries), generation=self.generation)
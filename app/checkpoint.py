@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import logging
+from app.snapshot import hash_file
+
+logger = logging.getLogger(__name__)
+
+# Version of the manifest format, part of what a resumed run must match
+CHECKPOINT_VERSION = 1
+
+# Suffix of the run manifests
+MANIFEST_SUFFIX = '.checkpoint.json'
+
+
+def fingerprint_inputs(inputs: dict, known: dict = None) -> dict:
+    """
+    Fingerprint the input files of a run.
+
+    Args:
+        inputs (dict): Mapping of the input names to the paths of their shards, e.g. {'assets': [...]}.
+        known (dict, optional): The fingerprints of a previous manifest. The content hash of a shard whose size
+                                and modification time did not change is taken from it instead of being
+                                computed again.
+
+    Returns:
+        dict: Mapping of the input names to the 'path', 'size', 'mtime_ns' and 'sha256' of every shard.
+    """
+    previous = {shard['path']: shard for shards in (known or {}).values() for shard in shards}
+    fingerprints = {}
+    for name, paths in inputs.items():
+        fingerprints[name] = []
+        for file_path in paths:
+            stat = os.stat(file_path)
+            shard = {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            seen = previous.get(shard['path'])
+            if seen and seen['size'] == shard['size'] and seen['mtime_ns'] == shard['mtime_ns']:
+                shard['sha256'] = seen['sha256']
+            else:
+                shard['sha256'] = hash_file(file_path)
+            fingerprints[name].append(shard)
+    return fingerprints
+
+
+def input_contents(fingerprints: dict) -> dict:
+    """
+    Returns:
+        dict: The path, size and content hash of every shard, without the modification times, so that a file
+              touched but not changed still matches.
+    """
+    return {name: [(shard['path'], shard['size'], shard['sha256']) for shard in shards]
+            for name, shards in fingerprints.items()}
+
+
+def read_manifest(file_path: str) -> dict:
+    """
+    Returns:
+        dict: The run manifest, or an empty dictionary when it is missing or unreadable.
+    """
+    try:
+        with open(file_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest: dict, file_path: str):
+    """Write a run manifest atomically, so that an interrupted write leaves the previous one."""
+    temporary = f'{file_path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temporary, file_path)
+
+
+class RunCheckpoint:
+    """
+    Manifest of a load in progress, recording the inputs and settings of the run and the number of batches
+    committed so far.
+
+    A run whose inputs have the same content and whose settings are the same as those of the manifest left by
+    an interrupted run resumes it: the transform produces the same batches, and the batches the interrupted run
+    committed are not loaded again. Any other run starts over and replaces the manifest. The manifest is
+    removed once the load is finished.
+    """
+
+    def __init__(self, file_path: str, inputs: dict, settings: dict):
+        """
+        Args:
+            file_path (str): Path of the manifest, whose directory is created if needed.
+            inputs (dict): Mapping of the input names to the paths of their shards.
+            settings (dict): The settings that determine the batches and how they are loaded.
+        """
+        self.file_path = file_path
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        previous = read_manifest(file_path)
+        self.manifest = {'version': CHECKPOINT_VERSION, 'settings': settings,
+                         'inputs': fingerprint_inputs(inputs, previous.get('inputs')),
+                         'committed': 0, 'records': 0, 'updated': time.time()}
+        if (previous.get('version') == CHECKPOINT_VERSION and previous.get('settings') == settings
+                and input_contents(previous.get('inputs', {})) == input_contents(self.manifest['inputs'])):
+            self.manifest['committed'] = previous.get('committed', 0)
+            self.manifest['records'] = previous.get('records', 0)
+        self.resumed = self.manifest['committed']
+        if self.resumed:
+            logger.info(f"Resuming the interrupted load at batch {self.resumed}: {self.manifest['records']} "
+                        f"records were already committed.")
+        write_manifest(self.manifest, file_path)
+
+    def commit(self, records: int):
+        """
+        Record that the next batch was committed.
+
+        Args:
+            records (int): The number of records of the batch.
+        """
+        self.manifest['committed'] += 1
+        self.manifest['records'] += records
+        self.manifest['updated'] = time.time()
+        write_manifest(self.manifest, self.file_path)
+
+    def restart(self):
+        """Start the load over, when what the interrupted run committed is no longer there."""
+        self.resumed = self.manifest['committed'] = self.manifest['records'] = 0
+        write_manifest(self.manifest, self.file_path)
+
+    def clear(self):
+        """Remove the manifest of a finished load."""
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+
+class CheckpointedSink:
+    """
+    Record every batch a sink commits in a run checkpoint, and skip the batches of a resumed load that the
+    interrupted run already committed.
+
+    A batch is committed once the apply() of the sink returns. The skipped batches go to the skip() method of
+    the sink, which accounts for them without loading them again.
+    """
+
+    def __init__(self, sink, checkpoint: RunCheckpoint):
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.batches = 0
+
+    def apply(self, records: list):
+        if self.batches < self.checkpoint.resumed:
+            self.sink.skip(records)
+        else:
+            self.sink.apply(records)
+            self.checkpoint.commit(len(records))
+        self.batches += 1
+
+    def finish(self, stats: list = None) -> dict:
+        """
+        Returns:
+            dict: The counts of the sink, with the number of 'resumed_batches' skipped when the load was resumed.
+
+        Raises:
+            RuntimeError: If the run produced fewer batches than the interrupted run committed. The manifest is
+                          removed, so that the next run starts over.
+        """
+        if self.batches < self.checkpoint.resumed:
+            self.checkpoint.clear()
+            raise RuntimeError(f"The run produced {self.batches} batches but the interrupted run committed "
+                               f"{self.checkpoint.resumed}.")
+        counts = self.sink.finish(stats)
+        self.checkpoint.clear()
+        if self.checkpoint.resumed:
+            counts['resumed_batches'] = self.checkpoint.resumed
+        return counts
+
+    def abort(self):
+        self.sink.abort()
+
+
+def checkpoint_path(directory: str, collection) -> str:
+    """
+    Returns:
+        str: The path of the run manifest of a collection in a checkpoint directory.
+    """
+    return os.path.join(directory, f'{collection.database.name}.{collection.name}{MANIFEST_SUFFIX}')
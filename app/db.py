@@ -0,0 +1,84 @@
+import os
+from dotenv import load_dotenv
+from pymongo import MongoClient, AsyncMongoClient
+
+
+def load_environment():
+    """
+    Load the variables of the .env file into the environment. Variables already set are not overridden.
+
+    It is called when the application or the command line starts, rather than when a module is imported.
+    """
+    load_dotenv()
+
+
+def connection_settings() -> tuple:
+    """
+    Read the MongoDB connection settings from the environment.
+
+    Returns:
+        tuple: The URI of the cluster (CLUSTER_URI), the database name (MONGODB_DATABASE) and the name of the
+               collection served by the API (MONGODB_COLLECTION).
+    """
+    return os.getenv("CLUSTER_URI"), os.getenv("MONGODB_DATABASE"), os.getenv("MONGODB_COLLECTION")
+
+
+def client_options() -> dict:
+    """
+    Read the MongoDB connection pool settings from the environment.
+
+    Returns:
+        dict: Keyword arguments for MongoClient and AsyncMongoClient.
+
+    The following environment variables are read, usually from the .env file:
+    - MONGODB_MAX_POOL_SIZE: Maximum number of connections per server (default 100).
+    - MONGODB_MIN_POOL_SIZE: Number of connections kept open while idle (default 0).
+    - MONGODB_MAX_IDLE_TIME_MS: Time after which an idle connection is closed.
+    - MONGODB_WAIT_QUEUE_TIMEOUT_MS: Maximum wait for a free connection when the pool is exhausted.
+    - MONGODB_SERVER_SELECTION_TIMEOUT_MS: Maximum wait for a suitable server (default 30000).
+    - MONGODB_CONNECT_TIMEOUT_MS: Timeout of a new connection.
+    - MONGODB_SOCKET_TIMEOUT_MS: Timeout of a single network round-trip.
+    - MONGODB_READ_PREFERENCE: primary, primaryPreferred, secondary, secondaryPreferred or nearest (default primary).
+    """
+    options = {
+        'maxPoolSize': int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+        'minPoolSize': int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+        'serverSelectionTimeoutMS': int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "30000")),
+        'readPreference': os.getenv("MONGODB_READ_PREFERENCE", "primary"),
+    }
+    optional = {
+        'maxIdleTimeMS': "MONGODB_MAX_IDLE_TIME_MS",
+        'waitQueueTimeoutMS': "MONGODB_WAIT_QUEUE_TIMEOUT_MS",
+        'connectTimeoutMS': "MONGODB_CONNECT_TIMEOUT_MS",
+        'socketTimeoutMS': "MONGODB_SOCKET_TIMEOUT_MS",
+    }
+    for option, variable in optional.items():
+        if os.getenv(variable):
+            options[option] = int(os.getenv(variable))
+    return options
+
+
+def create_client(cluster_uri: str) -> MongoClient:
+    """
+    Create the synchronous MongoDB client used by the ETL pipeline.
+
+    Args:
+        cluster_uri (str): URI of the MongoDB cluster.
+
+    Returns:
+        MongoClient: The client, configured with client_options().
+    """
+    return MongoClient(cluster_uri, **client_options())
+
+
+def create_async_client(cluster_uri: str) -> AsyncMongoClient:
+    """
+    Create the asynchronous MongoDB client used by the API endpoints.
+
+    Args:
+        cluster_uri (str): URI of the MongoDB cluster.
+
+    Returns:
+        AsyncMongoClient: The client, configured with client_options().
+    """
+    return AsyncMongoClient(cluster_uri, **client_options())
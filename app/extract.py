@@ -1,13 +1,76 @@
+import os
+import glob
 import pandas as pd
 from tabulate import tabulate
 import csv
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from concurrent.futures import ThreadPoolExecutor
+from app.schema import ENGINES, read_options, arrow_column_types, is_categorical
 
-def load_csv(file_path):
+# Suffix of the manifest files, which list the shards of a table
+MANIFEST_SUFFIX = '.manifest'
+
+# Extensions of the compressed files, which are decompressed as they are parsed
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.zst', '.lz4')
+
+# Number of shards read at the same time by default
+DEFAULT_READ_WORKERS = 4
+
+
+def resolve_shards(source):
+    """
+    Resolve the source of a table into the list of its shard files.
+
+    Args:
+    source (str or list): A file path, a glob pattern (e.g. '/dataset/assets-*.csv.gz'), a manifest file or a
+                          list of those. A manifest, named '*.manifest', lists one path or glob pattern per line,
+                          relative to its own directory; blank lines and lines starting with '#' are ignored.
+
+    Returns:
+    list: The shard paths, in order. The files matched by a glob pattern are sorted by name.
+    """
+    sources = [source] if isinstance(source, (str, os.PathLike)) else list(source)
+    shards = []
+    for pattern in map(os.fspath, sources):
+        if pattern.endswith(MANIFEST_SUFFIX):
+            with open(pattern) as manifest:
+                lines = [line.strip() for line in manifest]
+            directory = os.path.dirname(pattern)
+            shards += resolve_shards([os.path.join(directory, line) for line in lines
+                                      if line and not line.startswith('#')])
+        elif glob.has_magic(pattern):
+            shards += sorted(glob.glob(pattern))
+        else:
+            shards.append(pattern)
+    return shards
+
+
+def open_input(file_path):
+    """
+    Open a CSV file for the pandas parser, decompressing it as a stream when it is compressed.
+
+    Args:
+    file_path (str): The path to the CSV file.
+
+    Returns:
+    str or pa.NativeFile: The path of an uncompressed file, or a stream of the decompressed content, so that
+                          gzip and zstd files are read the same way without the optional Python codecs.
+    """
+    if isinstance(file_path, str) and file_path.endswith(COMPRESSED_SUFFIXES):
+        return pa.input_stream(file_path, compression='detect')
+    return file_path
+
+
+def load_csv(file_path, schema=None, engine=None):
     """
     Load a CSV file into a DataFrame.
 
     Args:
     file_path (str): The path to the CSV file.
+    schema (dict, optional): The declared column types of the file (see app.schema). Without a schema,
+                             every column is read and its type is inferred.
+    engine (str, optional): The CSV parser used with a schema, 'pyarrow' (default) or 'c'.
 
     Returns:
     pd.DataFrame or FileNotFoundError or pd.errors.EmptyDataError:
@@ -16,7 +79,12 @@ def load_csv(file_path):
         Returns pd.errors.EmptyDataError if the CSV file specified by 'file_path' is empty.
     """
     try:
-        df = pd.read_csv(file_path)
+        if not schema:
+            df = pd.read_csv(open_input(file_path))
+        elif (engine or 'pyarrow') == 'pyarrow':
+            df = load_csv_arrow(file_path, schema)
+        else:
+            df = pd.read_csv(open_input(file_path), **read_options(schema))
         print("File Successfully turned into a DF")
         return df 
     except FileNotFoundError as error:
@@ -26,6 +94,33 @@ def load_csv(file_path):
         print(f"There is No data in {file_path}")
         return empty_data_error
 
+def load_csv_arrow(file_path, schema):
+    """
+    Load a CSV file into a DataFrame with the multi-threaded pyarrow CSV reader.
+
+    Args:
+    file_path (str or file-like): The path to the CSV file. Compressed files are decompressed as they are read.
+    schema (dict): The declared column types of the file (see app.schema).
+
+    Returns:
+    pd.DataFrame: The declared columns of the file. Rows with more fields than the header are skipped.
+
+    Raises:
+    pd.errors.EmptyDataError: If the file is empty.
+    """
+    try:
+        table = pa_csv.read_csv(
+            file_path,
+            parse_options=pa_csv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+            convert_options=pa_csv.ConvertOptions(column_types=arrow_column_types(schema),
+                                                  include_columns=list(schema), strings_can_be_null=True),
+        )
+    except pa.ArrowInvalid as error:
+        if 'Empty CSV file' in str(error):
+            raise pd.errors.EmptyDataError(str(error))
+        raise
+    return table.to_pandas()
+
 def print_tabulated_data(data_frame):
     """
     Print tabulated data from a DataFrame.
@@ -38,18 +133,139 @@ def print_tabulated_data(data_frame):
     """
     print(tabulate(data_frame, headers='keys', tablefmt='psql'))
 
-def extract_data(file_path):
+def load_csv_chunks(file_path, chunksize, schema=None):
     """
-    Extract asset records from a CSV file.
+    Lazily load a CSV file as a sequence of DataFrame chunks.
+
+    Args:
+    file_path (str): The path to the CSV file.
+    chunksize (int): The maximum number of rows per chunk.
+    schema (dict, optional): The declared column types of the file, used to select its columns.
+
+    Returns:
+    Iterator[pd.DataFrame]: Yields DataFrames of at most 'chunksize' rows.
+
+    Every column is read as text so that the inferred dtypes do not depend on where
+    the chunk boundaries fall. An empty file yields no chunks.
+    """
+    try:
+        options = read_options(schema, chunked=True) if schema else {'dtype': str}
+        reader = pd.read_csv(open_input(file_path), chunksize=chunksize, **options)
+    except pd.errors.EmptyDataError:
+        print(f"There is No data in {file_path}")
+        return
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def concat_shards(frames):
+    """
+    Concatenate the DataFrames of the shards of a table.
+
+    Args:
+    frames (list): The DataFrames, with the same columns.
+
+    Returns:
+    pd.DataFrame: The rows of every shard, in order, indexed from 0. The categorical columns stay categorical,
+                  with the union of the categories of every shard.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    categorical = [column for column in frames[0].columns if is_categorical(frames[0][column])]
+    combined = pd.concat([frame.drop(columns=categorical) for frame in frames], ignore_index=True)
+    unified = {}
+    for column in categorical:
+        # A column without any value in a shard has categories of another dtype, which cannot be combined
+        dtypes = [frame[column].cat.categories.dtype for frame in frames if len(frame[column].cat.categories)]
+        dtype = dtypes[0] if dtypes else frames[0][column].cat.categories.dtype
+        unified[column] = pd.api.types.union_categoricals([
+            pd.Categorical.from_codes(frame[column].cat.codes, frame[column].cat.categories.astype(dtype))
+            for frame in frames
+        ])
+    return combined.assign(**unified)[list(frames[0].columns)]
+
+
+def load_shards(shards, schema=None, engine=None, workers=None):
+    """
+    Load the shards of a table concurrently into a single DataFrame.
 
     Args:
-    file_path (str): The path to the CSV file containing asset records.
+    shards (list): The paths to the shard files.
+    schema (dict, optional): The declared column types of the files (see app.schema).
+    engine (str, optional): The CSV parser used with a schema, 'pyarrow' (default) or 'c'.
+    workers (int, optional): The number of shards parsed at the same time. Defaults to DEFAULT_READ_WORKERS.
 
     Returns:
     pd.DataFrame or FileNotFoundError or pd.errors.EmptyDataError:
+        Returns a DataFrame containing the data of every shard if successful. Empty shards are skipped.
+        Returns FileNotFoundError if a shard does not exist or no shard was found.
+        Returns pd.errors.EmptyDataError if every shard is empty.
+    """
+    if len(shards) == 1:
+        return load_csv(shards[0], schema, engine)
+    if not shards:
+        print("There is No file matching the source")
+        return FileNotFoundError("No shard found.")
+    with ThreadPoolExecutor(max_workers=min(workers or DEFAULT_READ_WORKERS, len(shards))) as executor:
+        results = list(executor.map(lambda shard: load_csv(shard, schema, engine), shards))
+    for result in results:
+        if isinstance(result, FileNotFoundError):
+            return result
+    frames = [result for result in results if isinstance(result, pd.DataFrame)]
+    if not frames:
+        return results[0]
+    return concat_shards(frames)
+
+
+def load_shard_chunks(shards, chunksize, schema=None):
+    """
+    Lazily load the shards of a table, one after the other, as a sequence of DataFrame chunks.
+
+    Args:
+    shards (list): The paths to the shard files.
+    chunksize (int): The maximum number of rows per chunk.
+    schema (dict, optional): The declared column types of the files, used to select their columns.
+
+    Returns:
+    Iterator[pd.DataFrame]: Yields DataFrames of at most 'chunksize' rows, indexed in a single sequence
+                            across the shards.
+    """
+    offset = 0
+    for shard in shards:
+        rows = 0
+        for chunk in load_csv_chunks(shard, chunksize, schema):
+            chunk.index += offset
+            rows += len(chunk)
+            yield chunk
+        offset += rows
+
+
+def extract_data(file_path, chunksize=None, schema=None, engine=None, workers=None):
+    """
+    Extract asset records from a CSV file.
+
+    Args:
+    file_path (str or list): The path to the CSV file containing asset records, or the shards of the table:
+                             a glob pattern, a manifest or a list of paths (see resolve_shards). Files ending
+                             in '.gz', '.bz2', '.zst' or '.lz4' are decompressed as they are read.
+    chunksize (int, optional): When given, stream the file instead of loading it at once, with the C parser.
+    schema (dict, optional): The declared column types of the file (see app.schema).
+    engine (str, optional): The CSV parser used when the file is loaded at once with a schema, 'pyarrow'
+                            (default) or 'c'.
+    workers (int, optional): The number of shards parsed at the same time when the table is loaded at once.
+
+    Returns:
+    pd.DataFrame or FileNotFoundError or pd.errors.EmptyDataError or Iterator[pd.DataFrame]:
         Returns a DataFrame containing the asset records from the CSV file if successful.
         Returns FileNotFoundError if the file specified by 'file_path' does not exist.
         Returns pd.errors.EmptyDataError if the CSV file specified by 'file_path' is empty.
+        Returns an iterator of DataFrame chunks if 'chunksize' is given.
     """
-    return load_csv(file_path)
+    if engine is not None and engine not in ENGINES:
+        raise ValueError(f"Unknown CSV engine '{engine}', expected one of {ENGINES}.")
+    shards = resolve_shards(file_path)
+    if chunksize:
+        return load_shard_chunks(shards, chunksize, schema)
+    return load_shards(shards, schema, engine, workers)
 
@@ -0,0 +1,137 @@
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def utc_now():
+    """Return the current time as an ISO 8601 string in UTC."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobRunner:
+    """
+    Run the ETL pipeline as background jobs, one at a time.
+
+    Triggers are single-flight: while a run is queued or running, every new trigger returns that same run
+    instead of starting an overlapping pipeline. Only the most recent runs are kept for status queries.
+    """
+
+    def __init__(self, target, max_history: int = 100, on_finish=None):
+        """
+        Args:
+            target (callable): Function running the pipeline. It receives the stage timings dict and the stage
+                               spans dict of the run, to update in place, and returns the load counts.
+            max_history (int): The number of runs kept for status queries.
+            on_finish (callable, optional): Function called with the status of every finished run.
+        """
+        self.target = target
+        self.max_history = max_history
+        self.on_finish = on_finish
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='etl')
+        self.runs = OrderedDict()
+        self.current = None
+        self.lock = threading.Lock()
+
+    def trigger(self) -> dict:
+        """
+        Start a pipeline run, or join the one in flight.
+
+        Returns:
+            dict: The status of the run serving this trigger.
+        """
+        with self.lock:
+            if self.current is not None and self.current['status'] in ('queued', 'running'):
+                return self.snapshot(self.current)
+            run = {
+                'id': uuid.uuid4().hex,
+                'status': 'queued',
+                'requested_at': utc_now(),
+                'started_at': None,
+                'finished_at': None,
+                'stages': {},
+                'spans': {},
+                'counts': None,
+                'error': None,
+            }
+            self.runs[run['id']] = run
+            while len(self.runs) > self.max_history:
+                self.runs.popitem(last=False)
+            self.current = run
+        self.executor.submit(self._execute, run)
+        return self.snapshot(run)
+
+    def get(self, run_id: str):
+        """
+        Look up a run.
+
+        Args:
+            run_id (str): The identifier returned by trigger().
+
+        Returns:
+            dict or None: The status of the run, or None if it is unknown.
+        """
+        run = self.runs.get(run_id)
+        return self.snapshot(run) if run is not None else None
+
+    @staticmethod
+    def snapshot(run: dict) -> dict:
+        """Copy a run, so that it can be serialized while the pipeline keeps updating it."""
+        spans = {name: dict(span, rejected=dict(span['rejected'])) for name, span in list(run['spans'].items())}
+        return dict(run, stages=dict(run['stages']), spans=spans)
+
+    def _execute(self, run: dict):
+        run['status'] = 'running'
+        run['started_at'] = utc_now()
+        try:
+            run['counts'] = self.target(run['stages'], run['spans'])
+            run['status'] = 'succeeded'
+        except Exception as e:
+            run['error'] = str(e)
+            run['status'] = 'failed'
+        finally:
+            run['finished_at'] = utc_now()
+            logger.info(f"ETL run {run['id']} {run['status']}.")
+            if self.on_finish is not None:
+                try:
+                    self.on_finish(self.snapshot(run))
+                except Exception:
+                    logger.exception(f"Could not report the end of ETL run {run['id']}.")
+
+    def shutdown(self):
+        """Stop accepting runs, without waiting for the one in flight."""
+        self.executor.shutdown(wait=False)
+
+
+class IntervalScheduler:
+    """
+    Trigger a JobRunner at a fixed interval from a daemon thread.
+    """
+
+    def __init__(self, runner: JobRunner, interval: float):
+        """
+        Args:
+            runner (JobRunner): The runner to trigger.
+            interval (float): The number of seconds between two triggers. The first one fires immediately.
+        """
+        self.runner = runner
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name='etl-scheduler', daemon=True)
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            self.runner.trigger()
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        """Start triggering runs."""
+        self.thread.start()
+
+    def stop(self):
+        """Stop triggering runs."""
+        self.stopped.set()
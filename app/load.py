@@ -1,8 +1,22 @@
-import pandas as pd
-from pymongo import MongoClient
-from typing import List
+import json
+import time
+import uuid
+import logging
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pymongo import MongoClient, ReplaceOne, DeleteMany
+from pymongo.errors import BulkWriteError
+from typing import TYPE_CHECKING, Iterable, Iterator, List
 
-def convert_df_to_json(df: pd.DataFrame) -> List[dict]:
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Fields of the records loaded and published by the pipeline
+RECORD_FIELDS = ['cherry_asset_id', 'cityCode', 'catasto', 'sezione', 'foglio', 'particella', 'subalterno', 'ownerships']
+
+def convert_df_to_json(df: 'pd.DataFrame') -> List[dict]:
     """
     Convert DataFrame to a list of dictionaries in JSON format.
 
@@ -13,9 +27,10 @@ def convert_df_to_json(df: pd.DataFrame) -> List[dict]:
         List[dict]: List of dictionaries representing the DataFrame in JSON format.
 
     This function selects specific columns from the input DataFrame and converts them into a list of dictionaries,
-    with each dictionary representing a row of data in JSON format.
+    with each dictionary representing a row of data in JSON format. The 'ownerships' field is either a single
+    owner dictionary or, for DataFrames produced by aggregate_ownerships, a list of owner dictionaries.
     """
-    df_json = df[['cherry_asset_id', 'cityCode', 'catasto', 'sezione', 'foglio', 'particella', 'subalterno', 'ownerships']]
+    df_json = df[RECORD_FIELDS]
     json_data = df_json.to_dict(orient='records')
     return json_data
 
@@ -30,13 +45,685 @@ def delete_records(collection: str):
     collection.delete_many({})
 
 
-def insert_records(collection: str, records: list):
+class BulkLoadError(Exception):
+    """
+    Raised when some batches of a bulk insert failed. The 'result' attribute holds the bulk_insert report,
+    including how many documents of every batch were inserted and the write errors.
+    """
+
+    def __init__(self, result: dict):
+        super().__init__(f"{len(result['errors'])} batch(es) failed, {result['inserted']} documents inserted")
+        self.result = result
+
+
+def iter_record_batches(records: Iterable[dict], batch_size: int, copy: bool = True) -> Iterator[list]:
+    """
+    Group records into fixed-size batches.
+
+    Args:
+        records (Iterable[dict]): The records, possibly a generator.
+        batch_size (int): The number of records per batch.
+        copy (bool): Copy the records, unless the caller already made copies of its own.
+
+    Returns:
+        Iterator[list]: Batches of shallow copies of the records, so that the '_id' added by the insert does not
+                        leak into the caller's records. Only one batch is copied at a time.
+    """
+    batch = []
+    for record in records:
+        batch.append(dict(record) if copy else record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Code of the write error of a document whose '_id' is already in the collection
+DUPLICATE_KEY_ERROR = 11000
+
+
+def insert_batch(collection, number: int, batch: list, skip_existing: bool = False) -> dict:
+    """
+    Insert one batch with an unordered insert_many.
+
+    Args:
+        collection: The MongoDB collection to insert records into.
+        number (int): The position of the batch in the load.
+        batch (list): The records of the batch.
+        skip_existing (bool): Count the documents whose '_id' is already in the collection as 'existing' instead
+                              of failing the batch, which makes the insert of records with deterministic '_id'
+                              values idempotent.
+
+    Returns:
+        dict: The batch report: its 'size', the number of documents 'inserted' and already 'existing', the
+              'seconds' it took, its throughput in 'docs_per_second', and the 'error' details of a partially
+              failed batch.
+    """
+    start = time.perf_counter()
+    error = None
+    existing = 0
+    try:
+        collection.insert_many(batch, ordered=False)
+        inserted = len(batch)
+    except BulkWriteError as bulk_error:
+        inserted = bulk_error.details.get('nInserted', 0)
+        write_errors = bulk_error.details.get('writeErrors', [])
+        if skip_existing:
+            existing = sum(1 for write_error in write_errors if write_error.get('code') == DUPLICATE_KEY_ERROR)
+            write_errors = [write_error for write_error in write_errors
+                            if write_error.get('code') != DUPLICATE_KEY_ERROR]
+        if write_errors:
+            error = {'batch': number, 'nInserted': inserted, 'writeErrors': write_errors}
+    seconds = time.perf_counter() - start
+    return {'batch': number, 'size': len(batch), 'inserted': inserted, 'existing': existing, 'seconds': seconds,
+            'docs_per_second': inserted / seconds if seconds else float('inf'), 'error': error}
+
+
+def bulk_insert(collection, records: Iterable[dict], batch_size: int = 1000, workers: int = 4,
+                max_pending: int = None, skip_existing: bool = False, copy: bool = True) -> dict:
+    """
+    Insert records in fixed-size unordered batches spread over a small thread pool.
+
+    Args:
+        collection: The MongoDB collection to insert records into.
+        records (Iterable[dict]): The records, possibly a generator.
+        batch_size (int): The number of records per insert_many call.
+        workers (int): The number of batches written concurrently.
+        max_pending (int, optional): The maximum number of batches built but not yet written. Defaults to twice
+                                     the number of workers. Reading the records pauses when it is reached, which
+                                     bounds the memory used by the load.
+        skip_existing (bool): Skip the documents whose '_id' is already in the collection (see insert_batch).
+        copy (bool): Insert copies of the records (see iter_record_batches).
+
+    Returns:
+        dict: The number of documents 'inserted' and already 'existing', the per-batch reports in 'batches' and
+              the 'errors' of the partially failed batches.
+
+    Raises:
+        BulkLoadError: If any batch failed. Every other batch is still written.
+    """
+    max_pending = max_pending or 2 * workers
+    result = {'inserted': 0, 'existing': 0, 'batches': [], 'errors': []}
+
+    def collect(futures):
+        for future in futures:
+            report = future.result()
+            result['inserted'] += report['inserted']
+            result['existing'] += report['existing']
+            result['batches'].append(report)
+            if report['error'] is not None:
+                result['errors'].append(report['error'])
+            logger.debug(f"Batch {report['batch']}: {report['inserted']} documents, "
+                         f"{report['docs_per_second']:.0f} documents/s.")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-insert') as executor:
+        pending = set()
+        for number, batch in enumerate(iter_record_batches(records, batch_size, copy)):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(insert_batch, collection, number, batch, skip_existing))
+        collect(wait(pending).done)
+    result['batches'].sort(key=lambda report: report['batch'])
+
+    if result['batches']:
+        seconds = time.perf_counter() - start
+        rates = [report['docs_per_second'] for report in result['batches']]
+        logger.info(f"Inserted {result['inserted']} documents in {len(rates)} batches of {batch_size} "
+                    f"with {workers} workers: {result['inserted'] / seconds:.0f} documents/s overall, "
+                    f"{min(rates):.0f} to {max(rates):.0f} documents/s per batch.")
+    if result['errors']:
+        raise BulkLoadError(result)
+    return result
+
+
+def insert_records(collection: str, records: list, batch_size: int = 1000, workers: int = 4,
+                   skip_existing: bool = False, copy: bool = True) -> dict:
     """
     Insert records into a MongoDB collection.
 
     Args:
         collection (str): The name of the MongoDB collection to insert records into.
-        records (list): List of dictionaries representing the records to be inserted.
+        records (list): List or iterator of dictionaries representing the records to be inserted.
+        batch_size (int): The number of records per insert_many call.
+        workers (int): The number of batches written concurrently.
+        skip_existing (bool): Skip the documents whose '_id' is already in the collection (see insert_batch).
+        copy (bool): Insert copies of the records (see iter_record_batches).
+
+    Returns:
+        dict: The bulk_insert report.
+    """
+    return bulk_insert(collection, records, batch_size, workers, skip_existing=skip_existing, copy=copy)
+
+
+# Secondary indexes of the served collection, built before it is swapped into place. The lookup fields are
+# compound with '_id' so that the paginated lookups, which sort on '_id', are served by the index alone.
+INDEXES = [
+    [('cherry_asset_id', 1)],
+    [('cityCode', 1), ('_id', 1)],
+    [('ownerships.taxCode', 1), ('_id', 1)],
+    [('ownerships.vatCode', 1), ('_id', 1)],
+]
+
+
+def create_indexes(collection):
+    """
+    Create the secondary indexes of a MongoDB collection.
+
+    Args:
+        collection: The MongoDB collection to index.
+    """
+    for keys in INDEXES:
+        collection.create_index(keys)
+
+
+# Collection holding the generation marker of every served collection, replaced whenever a load commits
+GENERATIONS_COLLECTION = 'etl_generations'
+
+
+def mark_generation(collection) -> str:
+    """
+    Record that a new generation of a collection was committed.
+
+    Args:
+        collection: The MongoDB collection served to readers.
+
+    Returns:
+        str: The identifier of the new generation, stored under the name of the collection in
+             GENERATIONS_COLLECTION. Readers in other processes compare it with the one they last saw to find
+             out that the data changed.
+    """
+    generation = uuid.uuid4().hex
+    collection.database[GENERATIONS_COLLECTION].replace_one(
+        {'_id': collection.name}, {'_id': collection.name, 'generation': generation, 'committed_at': time.time()},
+        upsert=True)
+    return generation
+
+
+def stats_name(collection_name: str) -> str:
+    """
+    Returns:
+        str: The name of the collection holding the per-city statistics of a collection.
+    """
+    return f"{collection_name}_stats"
+
+
+def write_stats(collection, documents: list):
+    """
+    Replace the content of a statistics collection.
+
+    Args:
+        collection: The MongoDB collection to write, dropped first.
+        documents (list): The statistics documents, e.g. from app.transform.city_statistics.
+
+    The collection is created even when there is no document, so that it can always be renamed.
+    """
+    collection.drop()
+    collection.database.create_collection(collection.name)
+    if documents:
+        collection.insert_many([dict(document) for document in documents])
+
+
+def copy_collection(collection, name: str):
+    """
+    Copy a collection with its secondary indexes, on the server.
+
+    Args:
+        collection: The MongoDB collection to copy.
+        name (str): The name of the copy, replaced if it exists.
+
+    Returns:
+        The copy, created even when the collection is empty.
+    """
+    database = collection.database
+    database[name].drop()
+    collection.aggregate([{'$match': {}}, {'$out': name}])
+    if name not in database.list_collection_names():
+        database.create_collection(name)
+    copy = database[name]
+    for index_name, index in collection.index_information().items():
+        if index_name != '_id_':
+            copy.create_index(index['key'], name=index_name)
+    return copy
+
+
+def swap_collection(staging, target_name: str, previous_name: str = None):
+    """
+    Replace a collection and its statistics with a fully loaded staging collection and its statistics.
+
+    Args:
+        staging: The loaded and indexed staging collection.
+        target_name (str): The name of the collection served to readers.
+        previous_name (str, optional): The name under which the current generation is kept.
+
+    The records are swapped by a single rename of the staging collection over the target, which readers see
+    atomically: the target exists at every step. The current generation is copied with its indexes before the
+    swap, when it is kept, and the copy is renamed to 'previous_name' once the swap succeeded, so that
+    rollback_collection only has to rename it back. The statistics (see stats_name) are copied and renamed into
+    place right before the records; if the rename of the records fails, the statistics are restored from their
+    copy, so the records and the statistics are never left from different generations.
+    """
+    database = staging.database
+    names = database.list_collection_names()
+    replaced_name = f"{target_name}_replaced"
+    target_stats, staged_stats, replaced_stats = (stats_name(name) for name in
+                                                  (target_name, staging.name, replaced_name))
+    if previous_name is not None and target_name in names:
+        copy_collection(database[target_name], replaced_name)
+    if target_stats in names:
+        copy_collection(database[target_stats], replaced_stats)
+
+    try:
+        if staged_stats in names:
+            database[staged_stats].rename(target_stats, dropTarget=True)
+        staging.rename(target_name, dropTarget=True)
+    except Exception:
+        if replaced_stats in database.list_collection_names():
+            database[replaced_stats].rename(target_stats, dropTarget=True)
+        elif staged_stats in names:
+            database[target_stats].drop()
+        database[replaced_name].drop()
+        raise
+    if previous_name is None:
+        database[replaced_stats].drop()
+        return
+    if replaced_name in database.list_collection_names():
+        database[replaced_name].rename(previous_name, dropTarget=True)
+    if replaced_stats in database.list_collection_names():
+        database[replaced_stats].rename(stats_name(previous_name), dropTarget=True)
+    elif target_name in names:
+        database[stats_name(previous_name)].drop()
+
+
+def replace_stats(collection, documents: list):
+    """
+    Replace the per-city statistics of a collection loaded in place.
+
+    Args:
+        collection: The MongoDB collection served to readers.
+        documents (list): The statistics documents.
+
+    The statistics are written to a staging collection first and renamed into place, so readers never see
+    them partially written.
+    """
+    staging = collection.database[stats_name(f"{collection.name}_staging")]
+    write_stats(staging, documents)
+    staging.rename(stats_name(collection.name), dropTarget=True)
+
+
+def rollback_collection(database, target_name: str, previous_name: str):
+    """
+    Restore the previous generation of a collection, and of its statistics if they were kept.
+
+    Args:
+        database: The MongoDB database holding both collections.
+        target_name (str): The name of the collection served to readers.
+        previous_name (str): The name of the collection holding the previous generation.
+
+    The previous generation was copied by swap_collection with its indexes, so restoring it is a single rename.
+    A new generation is marked, as the served data changed.
+    """
+    database[previous_name].rename(target_name, dropTarget=True)
+    if stats_name(previous_name) in database.list_collection_names():
+        database[stats_name(previous_name)].rename(stats_name(target_name), dropTarget=True)
+    mark_generation(database[target_name])
+
+
+def insert_idempotent(collection, records: list, batch_size: int, workers: int, assigned: set,
+                      skip_existing: bool = False) -> dict:
+    """
+    Insert records under their deterministic '_id' (see assign_document_ids), for the loads that can be resumed.
+
+    Args:
+        collection: The MongoDB collection to insert records into.
+        records (list): The records of a batch, which are not modified.
+        batch_size (int): The number of records per insert_many call.
+        workers (int): The number of batches written concurrently.
+        assigned (set): The ids assigned to the previous batches of the run, updated in place.
+        skip_existing (bool): Skip the documents already in the collection, when resuming an interrupted load
+                              whose last batch may have been partially inserted.
+
+    Returns:
+        dict: The number of documents 'inserted' and, when skip_existing is set, already 'existing'.
+    """
+    documents = assign_document_ids([dict(record) for record in records], assigned)
+    result = insert_records(collection, documents, batch_size, workers, skip_existing=skip_existing, copy=False)
+    return {'inserted': result['inserted'], 'existing': result['existing']}
+
+
+def load_counts(inserted: int, existing: int) -> dict:
+    """
+    Returns:
+        dict: The number of documents 'inserted', with those a resumed load found 'existing' when there are any.
+    """
+    counts = {'inserted': inserted}
+    if existing:
+        counts['existing'] = existing
+    return counts
+
+
+class FullLoader:
+    """
+    Replace the content of a collection in place with delete_records and insert_records.
+
+    The documents of a resumable load get the deterministic '_id' of assign_document_ids; the others get the
+    ObjectId of the driver, which costs no hashing and no memory for the run. When resuming an interrupted load,
+    the collection is not emptied, the batches the interrupted load committed are skipped and the documents it
+    inserted from the batch it did not commit are counted as 'existing'.
+    """
+
+    def __init__(self, collection, batch_size: int = 1000, workers: int = 4, resume: bool = False,
+                 resumable: bool = False):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.workers = workers
+        self.resume = resume
+        self.assigned = set() if resumable or resume else None
+        self.inserted = 0
+        self.existing = 0
+        if not resume:
+            delete_records(collection)
+
+    def apply(self, records: list):
+        if self.assigned is None:
+            result = insert_records(self.collection, records, self.batch_size, self.workers)
+        else:
+            result = insert_idempotent(self.collection, records, self.batch_size, self.workers, self.assigned,
+                                       self.resume)
+        self.inserted += result['inserted']
+        self.existing += result['existing']
+
+    def skip(self, records: list):
+        """Account for a batch of records that an interrupted load already committed."""
+        for record in records:
+            unique_document_id(record, self.assigned)
+        self.inserted += len(records)
+
+    def finish(self, stats: list = None) -> dict:
+        create_indexes(self.collection)
+        if stats is not None:
+            replace_stats(self.collection, stats)
+        mark_generation(self.collection)
+        return load_counts(self.inserted, self.existing)
+
+    def abort(self):
+        pass
+
+
+class SwapLoader:
+    """
+    Load the records into a staging collection and swap it into place once it is complete.
+
+    The staging collection is named after the target with a '_staging' suffix, and the replaced generation
+    is kept with a '_previous' suffix so that rollback_collection can restore it instantly. The statistics
+    given to finish() are staged and swapped together with the records.
+
+    The documents of a resumable load get the deterministic '_id' of assign_document_ids; the others get the
+    ObjectId of the driver. A resumable load leaves the staging collection in place when it is aborted, and
+    resuming it keeps loading that staging collection, counting the documents the interrupted load inserted
+    from the batch it did not commit as 'existing'.
+    """
+
+    def __init__(self, collection, keep_previous: bool = True, batch_size: int = 1000, workers: int = 4,
+                 resume: bool = False, resumable: bool = False):
+        self.target_name = collection.name
+        self.previous_name = f"{collection.name}_previous" if keep_previous else None
+        self.staging = collection.database[f"{collection.name}_staging"]
+        if not resume:
+            self.staging.drop()
+        self.batch_size = batch_size
+        self.workers = workers
+        self.resume = resume
+        self.resumable = resumable
+        self.assigned = set() if resumable or resume else None
+        self.inserted = 0
+        self.existing = 0
+
+    def apply(self, records: list):
+        if self.assigned is None:
+            result = insert_records(self.staging, records, self.batch_size, self.workers)
+        else:
+            result = insert_idempotent(self.staging, records, self.batch_size, self.workers, self.assigned,
+                                       self.resume)
+        self.inserted += result['inserted']
+        self.existing += result['existing']
+
+    def skip(self, records: list):
+        """Account for a batch of records that an interrupted load already staged."""
+        for record in records:
+            unique_document_id(record, self.assigned)
+        self.inserted += len(records)
+
+    def finish(self, stats: list = None) -> dict:
+        create_indexes(self.staging)
+        if stats is not None:
+            write_stats(self.staging.database[stats_name(self.staging.name)], stats)
+        swap_collection(self.staging, self.target_name, self.previous_name)
+        mark_generation(self.staging.database[self.target_name])
+        return load_counts(self.inserted, self.existing)
+
+    def abort(self):
+        if self.resumable:
+            return
+        self.staging.drop()
+        self.staging.database[stats_name(self.staging.name)].drop()
+
+
+def document_key(record: dict) -> str:
+    """
+    Build the business key of a record.
+
+    Args:
+        record (dict): A record produced by convert_df_to_json.
+
+    Returns:
+        str: The 'cherry_asset_id' followed by the owner 'entity_id', or the 'cherry_asset_id' alone when
+             'ownerships' is a list aggregated per asset.
+    """
+    ownerships = record['ownerships']
+    if isinstance(ownerships, dict):
+        return f"{record['cherry_asset_id']}|{ownerships['entity_id']}"
+    return str(record['cherry_asset_id'])
+
+
+def fingerprint_record(record: dict) -> str:
+    """
+    Compute a content hash of a record.
+
+    Args:
+        record (dict): A record produced by convert_df_to_json.
+
+    Returns:
+        str: The SHA-1 hex digest of the canonical JSON form of the record, ignoring '_id' and '_fingerprint'.
+    """
+    content = {key: value for key, value in record.items() if key not in ('_id', '_fingerprint')}
+    payload = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def unique_document_id(record: dict, assigned: set, fingerprint: str = None) -> str:
+    """
+    Pick the '_id' of a record that no other record of the run has.
+
+    Args:
+        record (dict): A record produced by convert_df_to_json, which is not modified.
+        assigned (set): The ids assigned so far in the run, updated in place.
+        fingerprint (str, optional): The fingerprint of the record, computed when needed if not given.
+
+    Returns:
+        str: The document key. A record whose key was already assigned in the run, such as the same owner
+             listed twice on an asset with different shares, gets the start of its fingerprint appended, and an
+             ordinal if that is taken as well.
+    """
+    key = document_key(record)
+    document_id = key
+    ordinal = 1
+    while document_id in assigned:
+        fingerprint = fingerprint or fingerprint_record(record)
+        document_id = f"{key}#{fingerprint[:12]}" if ordinal == 1 else f"{key}#{fingerprint[:12]}#{ordinal}"
+        ordinal += 1
+    assigned.add(document_id)
+    return document_id
+
+
+def assign_document_ids(records: list, assigned: set = None) -> list:
+    """
+    Give every record a deterministic '_id' and its '_fingerprint'.
+
+    Args:
+        records (list): List of dictionaries representing the records.
+        assigned (set, optional): The ids assigned to the previous batches of the run, updated in place.
+
+    Returns:
+        list: The same records, updated in place, whose '_id' is unique across all the batches of the run
+              (see unique_document_id).
+    """
+    assigned = set() if assigned is None else assigned
+    for record in records:
+        fingerprint = fingerprint_record(record)
+        record['_id'] = unique_document_id(record, assigned, fingerprint)
+        record['_fingerprint'] = fingerprint
+    return records
+
+
+class IncrementalLoader:
+    """
+    Apply only the differences between the records of a run and what the previous run loaded.
+
+    The fingerprints of the loaded documents are read once when the loader is created. Every call to apply()
+    upserts the added and changed records of a batch, and finish() deletes the documents that no batch produced.
+    """
+
+    def __init__(self, collection, batch_size: int = 1000):
+        """
+        Args:
+            collection: The MongoDB collection to synchronize.
+            batch_size (int): The maximum number of operations sent in a single bulk write.
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.loaded = {document['_id']: document.get('_fingerprint')
+                       for document in collection.find({}, {'_fingerprint': 1})}
+        self.seen = set()
+        self.counts = {'unchanged': 0, 'changed': 0, 'added': 0, 'removed': 0}
+
+    def _bulk_write(self, operations: list):
+        for start in range(0, len(operations), self.batch_size):
+            self.collection.bulk_write(operations[start:start + self.batch_size], ordered=False)
+
+    def apply(self, records: list):
+        """
+        Upsert the records of a batch that are new or whose content changed.
+
+        Args:
+            records (list): List of dictionaries representing the records.
+        """
+        operations = []
+        for record in assign_document_ids(records, self.seen):
+            document_id = record['_id']
+            if document_id not in self.loaded:
+                self.counts['added'] += 1
+            elif self.loaded[document_id] == record['_fingerprint']:
+                self.counts['unchanged'] += 1
+                continue
+            else:
+                self.counts['changed'] += 1
+            operations.append(ReplaceOne({'_id': document_id}, record, upsert=True))
+        self._bulk_write(operations)
+
+    def skip(self, records: list):
+        """
+        Account for a batch of records that an interrupted load already committed. The batch is applied
+        again, which only finds its records unchanged, so that finish() knows they are still produced.
+        """
+        self.apply(records)
+
+    def finish(self, stats: list = None) -> dict:
+        """
+        Delete the documents that were loaded previously but are no longer produced.
+
+        Args:
+            stats (list, optional): The per-city statistics of the run, which replace the previous ones.
+
+        Returns:
+            dict: The number of 'unchanged', 'changed', 'added' and 'removed' documents.
+        """
+        removed = [document_id for document_id in self.loaded if document_id not in self.seen]
+        self._bulk_write([DeleteMany({'_id': {'$in': removed[start:start + self.batch_size]}})
+                          for start in range(0, len(removed), self.batch_size)])
+        self.counts['removed'] = len(removed)
+        create_indexes(self.collection)
+        if stats is not None:
+            replace_stats(self.collection, stats)
+        mark_generation(self.collection)
+        return dict(self.counts)
+
+    def abort(self):
+        pass
+
+
+def sync_records(collection, records: list) -> dict:
+    """
+    Incrementally synchronize a MongoDB collection with a full set of records.
+
+    Args:
+        collection: The MongoDB collection to synchronize.
+        records (list): List of dictionaries representing all the records of the run.
+
+    Returns:
+        dict: The number of 'unchanged', 'changed', 'added' and 'removed' documents.
+    """
+    loader = IncrementalLoader(collection)
+    loader.apply(records)
+    return loader.finish()
+
+
+def can_resume(collection, mode: str, records: int) -> bool:
+    """
+    Check that the documents committed by an interrupted load are still where it left them.
+
+    Args:
+        collection: The MongoDB collection served to readers.
+        mode (str): The load mode of the interrupted load.
+        records (int): The number of records it committed.
+
+    Returns:
+        bool: Whether the staging collection of a 'swap' load, or the collection of a 'full' load, holds at
+              least that many documents. An 'incremental' load can always be resumed, since it applies the
+              batches it skips again.
+    """
+    if mode == 'swap':
+        return collection.database[f"{collection.name}_staging"].estimated_document_count() >= records
+    if mode == 'full':
+        return collection.estimated_document_count() >= records
+    return True
+
+
+def make_loader(collection, mode: str = 'swap', batch_size: int = 1000, workers: int = 4, resume: bool = False,
+                resumable: bool = False):
+    """
+    Create the loader implementing a load mode.
+
+    Args:
+        collection: The MongoDB collection served to readers.
+        mode (str): 'swap' to load a staging collection and swap it into place, 'incremental' to apply only
+                    the changes since the previous run, or 'full' to delete and reinsert in place.
+        batch_size (int): The number of records per bulk write.
+        workers (int): The number of batches inserted concurrently by the 'swap' and 'full' modes.
+        resume (bool): Continue the load of an interrupted run instead of starting over (see app.checkpoint).
+        resumable (bool): Keep an unfinished load when it is aborted, so that a later run can resume it.
+
+    Returns:
+        A loader whose apply() method takes batches of records, skip() accounts for a batch an interrupted
+        load already committed, finish() commits the load, with the per-city statistics of the run if given,
+        and returns its counts, and abort() discards an unfinished load.
     """
-    records = [dict(record) for record in records]
-    collection.insert_many(records)
+    if mode == 'incremental':
+        return IncrementalLoader(collection, batch_size)
+    if mode == 'full':
+        return FullLoader(collection, batch_size, workers, resume, resumable)
+    if mode == 'swap':
+        return SwapLoader(collection, batch_size=batch_size, workers=workers, resume=resume, resumable=resumable)
+    raise ValueError(f"Unknown load mode: {mode}")
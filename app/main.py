@@ -1,143 +1,472 @@
 import os
 import json
 import logging
-import pandas as pd
-from typing import List
-from pymongo import MongoClient
-from fastapi import FastAPI, Response
-from app.extract import extract_data
-from dotenv import load_dotenv, find_dotenv
-from app.load import convert_df_to_json, delete_records, insert_records
-from app.transform import validate_assets, validate_entities, validate_join, transform_data
-
-# Load environment variables
-config = find_dotenv(".env")
-load_dotenv()
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.jobs import JobRunner, IntervalScheduler
+from app.cache import ResponseCache, CachedResponse
+from app.metrics import PipelineMetrics, RequestMetricsMiddleware, CONTENT_TYPE
+from app.db import load_environment, connection_settings, create_client, create_async_client
+from app.load import stats_name, GENERATIONS_COLLECTION
+from app.query import find_documents, aiter_json_array, aiter_ndjson, json_array_items, ndjson_lines
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# MongoDB connection parameters
-cluster_uri = os.getenv("CLUSTER_URI")
-collection_name = os.getenv("MONGODB_COLLECTION")
-database_name = os.getenv("MONGODB_DATABASE")
+# Largest page of records returned by the paginated endpoints
+MAX_PAGE_SIZE = 10000
+
+# Cache of the serialized read responses, emptied whenever an ETL run commits new data, in this process or in
+# another one. Its limits are read from the environment when the application starts.
+response_cache = ResponseCache()
+
+# Metrics of the ETL runs and of the API requests, exposed at /metrics
+metrics = PipelineMetrics()
+
+
+def run_etl(stages: dict, spans: dict) -> dict:
+    """
+    Run the ETL pipeline on the collection of the application.
+
+    The pipeline, and pandas with it, are only imported when the first run starts, so that they do not slow
+    the start of the application down.
+    """
+    from app.pipeline import etl_pipeline
+    return etl_pipeline(app.state.etl_collection, stages, response_cache.invalidate, spans)
+
+
+def response_cache_settings() -> dict:
+    """
+    Read the response cache limits from the environment.
+
+    Returns:
+        dict: The 'maxsize' (RESPONSE_CACHE_SIZE, default 256), 'ttl' (RESPONSE_CACHE_TTL, default 0),
+              'max_entry_bytes' (RESPONSE_CACHE_MAX_BYTES, default 1000000) and 'check_interval'
+              (RESPONSE_CACHE_CHECK_SECONDS, default 1) of ResponseCache.
+    """
+    return {
+        'maxsize': int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+        'ttl': float(os.getenv("RESPONSE_CACHE_TTL", "0")),
+        'max_entry_bytes': int(os.getenv("RESPONSE_CACHE_MAX_BYTES", "1000000")),
+        'check_interval': float(os.getenv("RESPONSE_CACHE_CHECK_SECONDS", "1")),
+    }
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load the .env file, connect to MongoDB and create the background runner executing one ETL run at a time,
+    with the optional ETL scheduler, then stop the background jobs and close both clients on shutdown. A run
+    still in flight fails once the synchronous client is closed; a checkpointed load resumes at the next run.
+
+    The endpoints use the asynchronous client and the ETL runs the synchronous one. The clients and the runner
+    are created here rather than on import, so importing the application needs neither the settings nor a
+    connection, and every start of the application gets a runner of its own.
+    The scheduler runs the pipeline every ETL_INTERVAL_SECONDS seconds (0, the default, disables it).
+    """
+    load_environment()
+    cluster_uri, database_name, collection_name = connection_settings()
+    response_cache.configure(**response_cache_settings())
+    client = create_client(cluster_uri)
+    async_client = create_async_client(cluster_uri)
+    app.state.etl_collection = client[database_name][collection_name]
+    app.state.collection = async_client[database_name][collection_name]
+    app.state.stats_collection = async_client[database_name][stats_name(collection_name)]
+    app.state.generations = async_client[database_name][GENERATIONS_COLLECTION]
+    runner = app.state.runner = JobRunner(run_etl, on_finish=metrics.record_run)
+    etl_interval = float(os.getenv("ETL_INTERVAL_SECONDS", "0"))
+    scheduler = IntervalScheduler(runner, etl_interval) if etl_interval > 0 else None
+    if scheduler is not None:
+        scheduler.start()
+    yield
+    if scheduler is not None:
+        scheduler.stop()
+    runner.shutdown()
+    await async_client.close()
+    client.close()
+
 
 # Create a FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware, metrics=metrics)
 
-# Connect to MongoDB
-client = MongoClient(cluster_uri)
-db = client[database_name]
-collection = db[collection_name]
 
-def etl_pipeline():
+@app.get("/metrics")
+def get_metrics():
     """
-    Main entry point of the data pipeline.
-    
-    This function orchestrates the Extract, Transform, Load (ETL) process.
-    It extracts, validates, and transforms the data, then saves it to a MongoDB collection.
+    Expose the metrics in the Prometheus text format.
+
+    Returns:
+        Response: The ETL run counts, the duration, row counts, rejected rows and peak RSS of every pipeline
+                  stage, the latency histogram of every API route and the response cache counters.
     """
-    data_folder = '/dataset'
-    asset_file = os.path.join(data_folder, 'data engineer 2023 - input - assets.csv')
-    logger.info('data engineer 2023 - input - assets.csv File Successfully turned into a DF')
-    entity_file = os.path.join(data_folder, 'data engineer 2023 - input - entities.csv')
-    logger.info('data engineer 2023 - input - entities.csv File Successfully turned into a DF')
-    join_file = os.path.join(data_folder, 'data engineer 2023 - input - assets_entities_join.csv')
-    logger.info('data engineer 2023 - input - assets.csv File Successfully turned into a DF')
+    return Response(content=metrics.render(response_cache.stats()), media_type=CONTENT_TYPE)
 
-    try:
-        # Extract data
-        asset_records = extract_data(asset_file)
-        entity_records = extract_data(entity_file)
-        join_records = extract_data(join_file)
-        logger.info('Data extraction successful.')
-
-        # Validate data
-        asset_records = validate_assets(asset_records)
-        entity_records = validate_entities(entity_records)
-        join_records = validate_join(join_records)
-        logger.info('Data validation successful.')
-
-        # Transform data
-        transformed_data = transform_data(asset_records, entity_records, join_records)
-        logger.info('Data transformation successful.')
-
-        # Convert DataFrame to JSON
-        df_records = convert_df_to_json(transformed_data)
-        logger.info('DataFrame conversion to JSON successful.')
-
-        # Delete existing collection content
-        delete_records(collection)
-        logger.info('Existing collection content deleted.')
-
-        # Insert new records into the collection
-        insert_records(collection, df_records)
-        logger.info('Records inserted into MongoDB collection.')
-
-        logger.info("All data has been ingested.")
-    except Exception as e:
-        logger.exception("An error occurred during the data pipeline.")
 
+@app.post("/etl/runs", status_code=202)
+def start_etl_run(request: Request):
+    """
+    Trigger an ETL run in the background.
 
-@app.get("/data")
-def read_data():
+    If a run is already queued or running, no new run is started and the run in flight is returned instead.
+
+    Returns:
+        Response: JSON response containing the run status, including its 'id'.
     """
-    Retrieve all data from a specific MongoDB collection.
+    run = request.app.state.runner.trigger()
+    return Response(content=json.dumps(run, indent=4), status_code=202, media_type="application/json")
+
+
+@app.get("/etl/runs/{run_id}")
+def get_etl_run(request: Request, run_id: str):
+    """
+    Get the status of an ETL run.
 
-    This endpoint triggers the ETL process, retrieves all records from the MongoDB collection,
-    and returns them in JSON format.
+    Args:
+        run_id (str): The identifier returned when the run was triggered.
 
     Returns:
-        Response: JSON response containing all records from the MongoDB collection.
+        Response: JSON response containing the status, the per-stage timings in seconds, the per-stage spans
+                  (duration, rows in and out, rows rejected per validation rule, peak RSS) and the load counts.
     """
-    try:
-        # Trigger the ETL process
-        etl_pipeline()
+    run = request.app.state.runner.get(run_id)
+    if run is None:
+        return Response(content=json.dumps({"message": "Run not found"}), status_code=404, media_type="application/json")
+    return Response(content=json.dumps(run, indent=4), media_type="application/json")
+
+
+async def first_document(cursor):
+    """
+    Read the first document of an asynchronous cursor, leaving the cursor positioned on the next one.
+
+    Args:
+        cursor: The AsyncCursor to read.
+
+    Returns:
+        dict or None: The first document, or None if the cursor is empty.
+    """
+    async for document in cursor:
+        return document
+    return None
+
+
+async def chain_documents(first: dict, cursor):
+    """
+    Yield a document already read from an asynchronous cursor, then the rest of the cursor.
+    """
+    yield first
+    async for document in cursor:
+        yield document
 
-        # Query the database to retrieve all records
-        records = list(collection.find({}))
 
-        # Convert ObjectId to string for serialization
-        for record in records:
-            record["_id"] = str(record["_id"])
+def cached_response(cached: CachedResponse) -> Response:
+    """
+    Build a response from a cached serialized response.
+    """
+    return Response(content=cached.content, status_code=cached.status_code, media_type=cached.media_type,
+                    headers=cached.headers)
 
-        # Serialize the records to JSON with proper formatting
-        json_str = json.dumps(records, indent=4, default=str)
 
-        # Return the formatted JSON response
-        return Response(content=json_str, media_type="application/json")
+def serialized_response(content: str, media_type: str, status_code: int = 200, headers: dict = None,
+                        cache_key=None, generation: int = None) -> Response:
+    """
+    Build a response from serialized content and store it in the response cache.
+
+    Args:
+        content (str): The serialized body.
+        media_type (str): The media type of the body.
+        status_code (int): The HTTP status code.
+        headers (dict, optional): The response headers.
+        cache_key (optional): The key under which the response is cached. Nothing is cached when omitted.
+        generation (int, optional): The cache generation the response was computed in.
+
+    Returns:
+        Response: The response.
+    """
+    cached = CachedResponse(status_code, content, media_type, headers or {})
+    if cache_key is not None:
+        response_cache.put(cache_key, cached, generation)
+    return cached_response(cached)
+
+
+async def cache_stream(pieces, cache_key, generation: int, media_type: str):
+    """
+    Pass a streamed body through, and cache it once complete if it fits in a cache entry.
+
+    Args:
+        pieces: The asynchronous iterator of the body pieces.
+        cache_key: The key under which the response is cached.
+        generation (int): The cache generation the response was computed in.
+        media_type (str): The media type of the body.
+    """
+    collected, size = [], 0
+    async for piece in pieces:
+        if collected is not None:
+            collected.append(piece)
+            size += len(piece)
+            if size > response_cache.max_entry_bytes:
+                collected = None
+        yield piece
+    if collected is not None:
+        response_cache.put(cache_key, CachedResponse(200, ''.join(collected), media_type, {}), generation)
+
+
+async def cache_lookup(request: Request):
+    """
+    Look a request up in the response cache, after checking that no load committed new data since the cache
+    last read the generation marker of the collection.
+
+    Args:
+        request (Request): The request, whose path and query parameters form the cache key.
+
+    Returns:
+        tuple: The cache key (None when the cache is disabled), the current cache generation and the cached
+               response, or None on a miss.
+    """
+    if not response_cache.enabled:
+        return None, response_cache.generation, None
+    if response_cache.check_due():
+        marker = await request.app.state.generations.find_one({'_id': request.app.state.collection.name})
+        response_cache.observe(marker['generation'] if marker is not None else None)
+    generation = response_cache.generation
+    cache_key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    cached = response_cache.get(cache_key)
+    return cache_key, generation, cached_response(cached) if cached is not None else None
+
+
+async def query_response(request: Request, query: dict, limit: Optional[int], after: Optional[str],
+                         fields: Optional[str], output_format: str, not_found: bool = False):
+    """
+    Query the collection and build the paginated or streamed response, going through the response cache.
+
+    Args:
+        request (Request): The request, whose path and query parameters form the cache key.
+        query (dict): The MongoDB filter.
+        limit (int, optional): Return a page of at most 'limit' records. All the records are streamed when omitted.
+        after (str, optional): Only return the records after this '_id', taken from the previous page.
+        fields (str, optional): Comma-separated list of the fields to return.
+        output_format (str): 'json' for an indented JSON array or 'ndjson' for one JSON record per line.
+        not_found (bool): Return a 404 Not Found response when the first page is empty.
+
+    Returns:
+        Response: The records. A full page carries the 'after' value of the next page in the X-Next-After header.
+    """
+    cache_key, generation, cached = await cache_lookup(request)
+    if cached is not None:
+        return cached
+
+    cursor = find_documents(request.app.state.collection, query, limit, after, fields)
+    media_type = "application/x-ndjson" if output_format == "ndjson" else "application/json"
+    not_found_content = json.dumps({"message": "Record not found"})
+
+    if limit is None:
+        # Serialize the records batch by batch while they come off the cursor
+        first = await first_document(cursor)
+        if first is None and not_found and not after:
+            return serialized_response(not_found_content, "application/json", 404, None, cache_key, generation)
+        documents = chain_documents(first, cursor) if first is not None else cursor
+        serialize = aiter_ndjson if output_format == "ndjson" else aiter_json_array
+        pieces = serialize(documents)
+        if cache_key is not None:
+            pieces = cache_stream(pieces, cache_key, generation, media_type)
+        return StreamingResponse(pieces, media_type=media_type)
+
+    # Serialize a bounded page and point to the next one
+    records = await cursor.to_list(length=limit)
+    if not records and not_found and not after:
+        return serialized_response(not_found_content, "application/json", 404, None, cache_key, generation)
+    headers = {"X-Next-After": str(records[-1]["_id"])} if len(records) == limit else {}
+    if output_format == "ndjson":
+        content = ndjson_lines(records)
+    else:
+        content = "[" + json_array_items(records, True) + ("\n]" if records else "]")
+    return serialized_response(content, media_type, 200, headers, cache_key, generation)
+
+
+@app.get("/data")
+async def read_data(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """
+    Retrieve all data from a specific MongoDB collection.
+
+    This endpoint retrieves the records from the MongoDB collection in '_id' order and returns them in JSON format.
+    It does not run the ETL process, which is triggered with POST /etl/runs or by the scheduler.
+
+    Args:
+        limit (int, optional): Return a page of at most 'limit' records. All the records are streamed when omitted.
+        after (str, optional): Only return the records after this '_id', taken from the previous page.
+        fields (str, optional): Comma-separated list of the fields to return.
+        output_format (str): The 'format' query parameter, 'json' for an indented JSON array or 'ndjson' for one JSON record per line.
+
+    Returns:
+        Response: JSON response containing the records. A full page carries the 'after' value of the next page
+                  in the X-Next-After header. Without 'limit' the records are streamed from the MongoDB cursor
+                  as they are serialized, so memory use does not depend on the collection size.
+    """
+    try:
+        return await query_response(request, {}, limit, after, fields, output_format)
     except Exception as e:
         logger.exception("An error occurred while fetching all data from MongoDB.")
         return Response(content=json.dumps({"error": "An error occurred."}), status_code=500, media_type="application/json")
 
+
 @app.get("/data/{citycode}")
-def get_record_by_city_code(citycode: str):
+async def get_record_by_city_code(
+    request: Request,
+    citycode: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
     """
-    Get details of a record from MongoDB based on the cityCode.
+    Get all the records from MongoDB located in a city.
 
     Args:
         citycode (str): The city code to search for in the MongoDB collection.
+        limit (int, optional): Return a page of at most 'limit' records. All the records are streamed when omitted.
+        after (str, optional): Only return the records after this '_id', taken from the previous page.
+        fields (str, optional): Comma-separated list of the fields to return.
+        output_format (str): The 'format' query parameter, 'json' for an indented JSON array or 'ndjson' for one JSON record per line.
 
     Returns:
-        Response: JSON response containing the details of the record.
+        Response: JSON response containing the records of the city, served by the (cityCode, _id) index.
+                  Returns a 404 Not Found response if the city has no record.
     """
     try:
-        # Query the database to retrieve the record based on citycode
-        record = collection.find_one({"cityCode": citycode})
+        return await query_response(request, {"cityCode": citycode}, limit, after, fields, output_format, not_found=True)
+    except Exception as e:
+        logger.exception(f"An error occurred while fetching data for city code: {citycode}.")
+        return Response(content=json.dumps({"error": "An error occurred."}), status_code=500, media_type="application/json")
 
-        # If no record found, return a 404 Not Found response
-        if not record:
-            return Response(content=json.dumps({"message": "Record not found"}), status_code=404, media_type="application/json")
 
-        # Convert ObjectId to string for serialization
-        record["_id"] = str(record["_id"])
+@app.get("/owners/{taxcode}")
+async def get_records_by_tax_code(
+    request: Request,
+    taxcode: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """
+    Get all the records of the assets owned by an owner, by tax code.
 
-        # Serialize the record to JSON with proper formatting
-        json_str = json.dumps(record, indent=4, default=str)
+    Args:
+        taxcode (str): The tax code of the owner.
+        limit (int, optional): Return a page of at most 'limit' records. All the records are streamed when omitted.
+        after (str, optional): Only return the records after this '_id', taken from the previous page.
+        fields (str, optional): Comma-separated list of the fields to return.
+        output_format (str): The 'format' query parameter, 'json' for an indented JSON array or 'ndjson' for one JSON record per line.
 
-        # Return the formatted JSON response
-        return Response(content=json_str, media_type="application/json")
+    Returns:
+        Response: JSON response containing the records of the owner's assets with their 'ownerships', served by
+                  the (ownerships.taxCode, _id) index. Returns a 404 Not Found response if the owner has no record.
+    """
+    try:
+        return await query_response(request, {"ownerships.taxCode": taxcode}, limit, after, fields, output_format,
+                                    not_found=True)
     except Exception as e:
-        logger.exception(f"An error occurred while fetching data for city code: {citycode}.")
+        logger.exception(f"An error occurred while fetching data for tax code: {taxcode}.")
+        return Response(content=json.dumps({"error": "An error occurred."}), status_code=500, media_type="application/json")
+
+
+@app.get("/owners/vat/{vatcode}")
+async def get_records_by_vat_code(
+    request: Request,
+    vatcode: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """
+    Get all the records of the assets owned by an owner, by VAT code.
+
+    Args:
+        vatcode (str): The VAT code of the owner.
+        limit (int, optional): Return a page of at most 'limit' records. All the records are streamed when omitted.
+        after (str, optional): Only return the records after this '_id', taken from the previous page.
+        fields (str, optional): Comma-separated list of the fields to return.
+        output_format (str): The 'format' query parameter, 'json' for an indented JSON array or 'ndjson' for one JSON record per line.
+
+    Returns:
+        Response: JSON response containing the records of the owner's assets with their 'ownerships', served by
+                  the (ownerships.vatCode, _id) index. Returns a 404 Not Found response if the owner has no record.
+    """
+    try:
+        return await query_response(request, {"ownerships.vatCode": vatcode}, limit, after, fields, output_format,
+                                    not_found=True)
+    except Exception as e:
+        logger.exception(f"An error occurred while fetching data for VAT code: {vatcode}.")
+        return Response(content=json.dumps({"error": "An error occurred."}), status_code=500, media_type="application/json")
+
+
+async def stats_response(request: Request, citycode: Optional[str] = None):
+    """
+    Read the precomputed per-city statistics, going through the response cache.
+
+    Args:
+        request (Request): The request, whose path forms the cache key.
+        citycode (str, optional): The city to return. The statistics of every city are returned when omitted.
+
+    Returns:
+        Response: The statistics document of the city, or 404 Not Found if it has none, or the array of the
+                  documents of every city in city code order.
+    """
+    cache_key, generation, cached = await cache_lookup(request)
+    if cached is not None:
+        return cached
+    collection = request.app.state.stats_collection
+    if citycode is None:
+        content = json.dumps(await collection.find({}).sort('_id', 1).to_list(length=None), indent=4)
+        return serialized_response(content, "application/json", 200, None, cache_key, generation)
+    document = await collection.find_one({"_id": citycode})
+    if document is None:
+        content = json.dumps({"message": "Statistics not found"})
+        return serialized_response(content, "application/json", 404, None, cache_key, generation)
+    return serialized_response(json.dumps(document, indent=4), "application/json", 200, None, cache_key, generation)
+
+
+@app.get("/stats")
+async def read_stats(request: Request):
+    """
+    Get the per-city statistics computed by the last ETL run.
+
+    Returns:
+        Response: JSON array with, for every city, its number of assets, of distinct owners and its total
+                  ownership share, overall and for every 'catasto'.
+    """
+    try:
+        return await stats_response(request)
+    except Exception as e:
+        logger.exception("An error occurred while fetching the statistics from MongoDB.")
+        return Response(content=json.dumps({"error": "An error occurred."}), status_code=500, media_type="application/json")
+
+
+@app.get("/stats/{citycode}")
+async def get_stats_by_city_code(request: Request, citycode: str):
+    """
+    Get the statistics of a city computed by the last ETL run.
+
+    Args:
+        citycode (str): The city code, which is the '_id' of its statistics document.
+
+    Returns:
+        Response: JSON response containing the number of assets, of distinct owners and the total ownership
+                  share of the city, overall and for every 'catasto', read with a single '_id' lookup.
+                  Returns a 404 Not Found response if the city has no statistics.
+    """
+    try:
+        return await stats_response(request, citycode)
+    except Exception as e:
+        logger.exception(f"An error occurred while fetching the statistics of city code: {citycode}.")
         return Response(content=json.dumps({"error": "An error occurred."}), status_code=500, media_type="application/json")
@@ -0,0 +1,244 @@
+import time
+import bisect
+import resource
+import threading
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the stage duration histogram buckets, in seconds
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# Media type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak resident memory of the process, so that the next reading covers what follows only.
+
+    Returns:
+        bool: False if the platform does not support it, in which case the peak covers the process lifetime.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    """
+    Returns:
+        int: The peak resident memory of the process since the last reset_peak_rss(), in bytes.
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def new_span() -> dict:
+    """
+    Returns:
+        dict: An empty stage span: its duration, the rows it read and wrote, the rows rejected per validation
+              rule and the peak resident memory of the process while it ran.
+    """
+    return {'seconds': 0.0, 'rows_in': 0, 'rows_out': 0, 'rejected': {}, 'peak_rss_bytes': 0}
+
+
+@contextmanager
+def stage_span(spans, name):
+    """
+    Record the span of a pipeline stage.
+
+    Args:
+        spans (dict): Mapping of the stage names to their spans, updated in place. None discards the span.
+        name (str): The name of the stage.
+
+    Yields:
+        dict: The span of the stage, whose 'rows_in', 'rows_out' and 'rejected' counts the stage adds to.
+
+    A stage entered several times, once per chunk, accumulates its durations and row counts in one span.
+    """
+    span = new_span() if spans is None else spans.setdefault(name, new_span())
+    reset_peak_rss()
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span['seconds'] += time.perf_counter() - start
+        span['peak_rss_bytes'] = max(span['peak_rss_bytes'], peak_rss_bytes())
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+               for name, value in labels]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Histogram:
+    """
+    Prometheus histogram with labels. Observing a value only updates a few counters under a lock; the
+    cumulative buckets are computed when the metrics are rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        for label_values, counts, total in sorted(series):
+            labels = tuple(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                bucket = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{format_labels(labels + (("le", bucket),))} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {cumulative}')
+        return lines
+
+
+class Metric:
+    """
+    Prometheus counter or gauge with labels.
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str, label_names: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def set(self, value: float, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{format_labels(tuple(zip(self.label_names, label_values)))} {value}')
+        return lines
+
+
+class PipelineMetrics:
+    """
+    Metrics of the ETL runs and of the API requests, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.runs = Metric('etl_runs_total', 'Finished ETL runs.', 'counter', ('status',))
+        self.last_run = Metric('etl_last_run_timestamp_seconds', 'End time of the last ETL run.', 'gauge',
+                               ('status',))
+        self.stage_seconds = Histogram('etl_stage_duration_seconds', 'Duration of the ETL stages.', ('stage',),
+                                       STAGE_BUCKETS)
+        self.stage_rows = Metric('etl_stage_rows_total', 'Rows read and written by the ETL stages.', 'counter',
+                                 ('stage', 'direction'))
+        self.stage_peak_rss = Metric('etl_stage_peak_rss_bytes', 'Peak resident memory during the last run of '
+                                     'every ETL stage.', 'gauge', ('stage',))
+        self.rejected = Metric('etl_rejected_rows_total', 'Rows rejected by every validation rule.', 'counter',
+                               ('rule',))
+        self.requests = Histogram('http_request_duration_seconds', 'Latency of the API requests.',
+                                  ('method', 'route', 'status'), LATENCY_BUCKETS)
+
+    def record_run(self, run: dict):
+        """
+        Record a finished ETL run.
+
+        Args:
+            run (dict): The run, as reported by JobRunner, with its 'status' and its stage 'spans'.
+        """
+        self.runs.inc(1, run['status'])
+        self.last_run.set(time.time(), run['status'])
+        for stage, span in run.get('spans', {}).items():
+            self.stage_seconds.observe(span['seconds'], stage)
+            self.stage_rows.inc(span['rows_in'], stage, 'in')
+            self.stage_rows.inc(span['rows_out'], stage, 'out')
+            self.stage_peak_rss.set(span['peak_rss_bytes'], stage)
+            for rule, count in span['rejected'].items():
+                self.rejected.inc(count, rule)
+
+    def render(self, cache_stats: dict = None) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Args:
+            cache_stats (dict, optional): The ResponseCache.stats() to expose as well.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        for metric in [self.runs, self.last_run, self.stage_seconds, self.stage_rows, self.stage_peak_rss,
+                       self.rejected, self.requests]:
+            lines += metric.render()
+        if cache_stats is not None:
+            for name, value in sorted(cache_stats.items()):
+                metric_type = 'gauge' if name in ('size', 'generation') else 'counter'
+                metric_name = f'response_cache_{name}' + ('_total' if metric_type == 'counter' else '')
+                lines += [f'# HELP {metric_name} Response cache {name}.', f'# TYPE {metric_name} {metric_type}',
+                          f'{metric_name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware observing the latency of every HTTP request, labelled with its route template rather than
+    its path, so that path parameters such as the city code do not create a series per value. The latency of
+    a streamed response includes the time taken to send its whole body.
+    """
+
+    def __init__(self, app, metrics: PipelineMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            self.metrics.requests.observe(time.perf_counter() - start, scope['method'],
+                                          getattr(route, 'path', 'unmatched'), status[0])
@@ -0,0 +1,129 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from app.stream import partition_ids
+from app.transform import validate_assets, validate_entities, validate_join, transform_data
+
+
+def split_partitions(df, key, partitions):
+    """
+    Split a DataFrame into hash partitions on a key column.
+
+    Args:
+    df (pd.DataFrame): The input DataFrame.
+    key (str): The column whose values decide the partition.
+    partitions (int): The number of partitions.
+
+    Returns:
+    list: One DataFrame per partition, possibly empty, in partition order.
+    """
+    ids = partition_ids(df, key, partitions)
+    groups = dict(tuple(df.groupby(ids, sort=False)))
+    return [groups.get(partition, df.iloc[:0]) for partition in range(partitions)]
+
+
+def transform_partition(asset_data, entity_data, join_data, validated=False, join_options=None):
+    """
+    Validate and transform the assets and join records of one partition, in a worker process.
+
+    Args:
+    asset_data (pd.DataFrame): The asset records of the partition.
+    entity_data (pd.DataFrame): The validated entities referenced by the join records of the partition.
+    join_data (pd.DataFrame): The join records of the partition.
+    validated (bool): Whether the asset and join records are already validated.
+    join_options (dict, optional): The join options of transform_data.
+
+    Returns:
+    tuple: The transformed DataFrame (None if the partition has no valid join record), the entity ids referenced
+           by the valid join records, the rows rejected by every validation rule, the rejection report and the
+           per-city statistics.
+    """
+    rejections, report, stats = {}, [], []
+    if not validated:
+        asset_data = validate_assets(asset_data, rejections, report)
+        join_data = validate_join(join_data, rejections, report)
+    referenced = join_data['entity_id'].unique()
+    if join_data.empty:
+        return None, referenced, rejections, report, stats
+    entity_data = entity_data[entity_data['entity_id'].isin(referenced)]
+    transformed = transform_data(asset_data, entity_data, join_data, join_options, stats)
+    return transformed, referenced, rejections, report, stats
+
+
+def parallel_transform(asset_data, entity_data, join_data, workers, partitions=None, rejections=None,
+                       validated=False, report=None, join_options=None, stats=None):
+    """
+    Validate and transform the data on several CPU cores.
+
+    Args:
+    asset_data (pd.DataFrame): The asset records, raw or already validated.
+    entity_data (pd.DataFrame): The entity records, raw or already validated.
+    join_data (pd.DataFrame): The join records, raw or already validated.
+    workers (int): The number of worker processes.
+    partitions (int, optional): The number of hash partitions on 'asset_id'. Defaults to four per worker,
+                                so that a slow partition does not leave the other workers idle.
+    rejections (dict, optional): Mapping of the validation rules to the number of rows they rejected,
+                                 updated in place.
+    validated (bool): Whether the three tables are already validated, in which case only the merge and the
+                      transformation run in the workers.
+    report (list, optional): List the rejection reports of the validation are appended to
+                             (see app.rules.apply_rules).
+    join_options (dict, optional): The join options of transform_data, applied to every partition: 'max_rows'
+                                   bounds the rows of a partition. Only the 'outer' join is supported.
+    stats (list, optional): List the per-city statistics of every partition are appended to (see
+                            app.transform.city_stats).
+
+    Returns:
+    pd.DataFrame: The same rows, in the same order, as validating the three tables and calling transform_data.
+
+    The entities are validated once and every partition receives the ones its join records reference. The
+    assets and join records are hash-partitioned by 'asset_id', so every asset meets all of its owners in a
+    single partition, and each worker validates, merges and transforms a partition. Entities that no join
+    record references are transformed last, and the partitions are put back in the 'asset_id' order of the
+    full outer merge with a stable sort. The workers are started with 'spawn', as forking the multi-threaded
+    API process is not safe.
+    """
+    if (join_options or {}).get('how', 'outer') != 'outer':
+        raise ValueError("The partitioned transform only supports the 'outer' join.")
+    partitions = partitions or workers * 4
+    if not validated:
+        entity_data = validate_entities(entity_data, rejections, report)
+    asset_parts = split_partitions(asset_data, 'asset_id', partitions)
+    join_parts = split_partitions(join_data, 'asset_id', partitions)
+
+    results, referenced = [], []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [
+            executor.submit(transform_partition, asset_part,
+                            entity_data[entity_data['entity_id'].isin(join_part['entity_id'])], join_part, validated,
+                            join_options)
+            for asset_part, join_part in zip(asset_parts, join_parts)
+        ]
+        for future in futures:
+            transformed, entity_ids, partition_rejections, partition_report, partition_stats = future.result()
+            referenced.append(entity_ids)
+            if report is not None:
+                report.extend(partition_report)
+            if stats is not None:
+                stats.extend(partition_stats)
+            if transformed is not None:
+                results.append(transformed)
+            if rejections is not None:
+                for rule, count in partition_rejections.items():
+                    rejections[rule] = rejections.get(rule, 0) + count
+
+    asset_template = validate_assets(asset_data.iloc[:0])
+    join_template = validate_join(join_data.iloc[:0])
+    if results:
+        combined = pd.concat(results, ignore_index=True).sort_values('asset_id', kind='stable', ignore_index=True)
+    else:
+        combined = transform_data(asset_template.copy(), entity_data.iloc[:0], join_template.copy(), join_options)
+
+    referenced = np.concatenate([np.asarray(ids, dtype=object) for ids in referenced])
+    orphans = entity_data[~entity_data['entity_id'].isin(referenced)]
+    if not orphans.empty:
+        orphaned = transform_data(asset_template.copy(), orphans, join_template.copy(), join_options)
+        combined = pd.concat([combined, orphaned], ignore_index=True)
+    return combined
@@ -0,0 +1,569 @@
+import os
+import time
+import logging
+import pandas as pd
+from contextlib import contextmanager
+from app.extract import extract_data, resolve_shards
+from app.stream import stream_transform
+from app.parallel import parallel_transform
+from app.sql_engine import sql_transform
+from app.snapshot import SnapshotCache
+from app.checkpoint import RunCheckpoint, CheckpointedSink, checkpoint_path
+from app.schema import ASSET_SCHEMA, ENTITY_SCHEMA, JOIN_SCHEMA
+from app.metrics import stage_span, new_span
+from app.rules import rejection_report, write_rejection_report
+from app.load import convert_df_to_json, can_resume
+from app.sinks import make_sink, parse_sinks, record_batches, DEFAULT_BATCH_ROWS
+from app.transform import validate_assets, validate_entities, validate_join, transform_data, aggregate_ownerships
+from app.transform import city_statistics
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed_stage(stages, name, spans=None):
+    """
+    Measure the wall time spent in a pipeline stage, and record its span.
+
+    Args:
+        stages (dict): Mapping of stage names to seconds, updated in place.
+        name (str): The name of the stage.
+        spans (dict, optional): Mapping of stage names to their spans (see app.metrics.stage_span), updated in place.
+
+    Yields:
+        dict: The span of the stage, to add its row counts to.
+
+    Time is accumulated, so a stage entered once per chunk reports its total duration.
+    """
+    start = time.perf_counter()
+    try:
+        with stage_span(spans, name) as span:
+            yield span
+    finally:
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def load_settings():
+    """
+    Read the bulk load settings from the environment.
+
+    Returns:
+        tuple: The number of records per bulk write (ETL_BATCH_SIZE, default 1000) and the number of batches
+               written concurrently (ETL_LOAD_WORKERS, default 4).
+    """
+    return int(os.getenv("ETL_BATCH_SIZE", "1000")), int(os.getenv("ETL_LOAD_WORKERS", "4"))
+
+
+def written_rows(counts):
+    """
+    Count the documents written by a load.
+
+    Args:
+        counts (dict): The counts reported by the loader or sink.
+
+    Returns:
+        int: The documents inserted, the records written to a file, or for an incremental load the documents
+             added and changed. The counts of a fan-out add those of all its sinks.
+    """
+    if 'sinks' in counts:
+        return sum(written_rows(sink_counts) for sink_counts in counts['sinks'].values())
+    if 'written' in counts:
+        return counts['written']
+    return counts.get('inserted', counts.get('added', 0) + counts.get('changed', 0))
+
+
+def sink_settings():
+    """
+    Read the sinks of the records from the environment.
+
+    Returns:
+        str: ETL_SINKS, the comma-separated sinks the records are written to (see app.sinks.parse_sinks).
+             Defaults to 'mongo', the collection served by the API.
+    """
+    return os.getenv("ETL_SINKS", "mongo")
+
+
+def snapshot_settings():
+    """
+    Read the snapshot cache settings from the environment.
+
+    Returns:
+        tuple: The snapshot cache, or None when ETL_SNAPSHOT_DIR is not set, and whether the snapshots must be
+               rebuilt (ETL_SNAPSHOT_REFRESH). The cache keeps at most ETL_SNAPSHOT_MAX_ENTRIES snapshots
+               (default 12) and ETL_SNAPSHOT_MAX_BYTES bytes (default 0, unlimited).
+    """
+    directory = os.getenv("ETL_SNAPSHOT_DIR")
+    if not directory:
+        return None, False
+    snapshots = SnapshotCache(directory, max_entries=int(os.getenv("ETL_SNAPSHOT_MAX_ENTRIES", "12")),
+                              max_bytes=int(os.getenv("ETL_SNAPSHOT_MAX_BYTES", "0")))
+    return snapshots, os.getenv("ETL_SNAPSHOT_REFRESH", "").lower() in ("1", "true", "yes")
+
+
+def input_sources(data_folder):
+    """
+    Read the sources of the input tables from the environment.
+
+    Args:
+        data_folder (str): The folder of the default input files.
+
+    Returns:
+        tuple: The shard paths of the assets (ETL_ASSETS_SOURCE), entities (ETL_ENTITIES_SOURCE) and join records
+               (ETL_JOIN_SOURCE). A source is a file path, a glob pattern or a manifest (see
+               app.extract.resolve_shards), and defaults to the single file of the table in 'data_folder'.
+    """
+    return tuple(
+        resolve_shards(os.getenv(variable, os.path.join(data_folder, f'data engineer 2023 - input - {name}.csv')))
+        for variable, name in [("ETL_ASSETS_SOURCE", 'assets'), ("ETL_ENTITIES_SOURCE", 'entities'),
+                               ("ETL_JOIN_SOURCE", 'assets_entities_join')]
+    )
+
+
+def source_name(shards):
+    """
+    Returns:
+        str: The file name of the first shard of an input, followed by the number of other shards if any.
+    """
+    if not shards:
+        return 'no shard'
+    name = os.path.basename(shards[0])
+    return name if len(shards) == 1 else f'{name} (+{len(shards) - 1} shards)'
+
+
+# Transform engines of the streaming mode
+TRANSFORM_ENGINES = ['pandas', 'sqlite']
+
+# Number of rows read at a time by the SQLite engine when ETL_CHUNKSIZE is not set
+DEFAULT_SQL_CHUNKSIZE = 100000
+
+
+def transform_engine():
+    """
+    Read the transform engine of the streaming mode from the environment.
+
+    Returns:
+        str: ETL_TRANSFORM_ENGINE, 'pandas' (default, on-disk hash partitions) or 'sqlite' (embedded database).
+    """
+    engine = os.getenv("ETL_TRANSFORM_ENGINE", "pandas")
+    if engine not in TRANSFORM_ENGINES:
+        raise ValueError(f"Unknown transform engine '{engine}', expected one of {TRANSFORM_ENGINES}.")
+    return engine
+
+
+def join_settings():
+    """
+    Read the join settings from the environment.
+
+    Returns:
+        dict: The join options of transform_data: the join type (ETL_JOIN_HOW, default 'outer'), whether every
+              entity and asset id must be unique (ETL_JOIN_VALIDATE) and the largest number of rows a join may
+              produce (ETL_JOIN_MAX_ROWS, default 0, unlimited).
+    """
+    max_rows = int(os.getenv("ETL_JOIN_MAX_ROWS", "0"))
+    return {
+        'how': os.getenv("ETL_JOIN_HOW", "outer"),
+        'validate': os.getenv("ETL_JOIN_VALIDATE", "").lower() in ("1", "true", "yes"),
+        'max_rows': max_rows or None,
+    }
+
+
+def run_checkpoint(collection, sources, chunksize):
+    """
+    Open the checkpoint of the run, when ETL_CHECKPOINT_DIR is set.
+
+    Args:
+        collection: The MongoDB collection to load.
+        sources (tuple): The shard paths of the assets, entities and join records.
+        chunksize (int): The number of rows read at a time, 0 when the data is loaded at once.
+
+    Returns:
+        app.checkpoint.RunCheckpoint: The checkpoint, resuming the load interrupted by a previous run with the
+                                      same inputs and settings, or None when ETL_CHECKPOINT_DIR is not set.
+    """
+    directory = os.getenv("ETL_CHECKPOINT_DIR")
+    if not directory:
+        return None
+    settings = {
+        'collection': f'{collection.database.name}.{collection.name}',
+        'chunksize': chunksize,
+        'engine': transform_engine(),
+        'partitions': int(os.getenv("ETL_PARTITIONS", "16")),
+        'transform_workers': int(os.getenv("ETL_TRANSFORM_WORKERS", "1")),
+        'join': join_settings(),
+        'output_mode': os.getenv("ETL_OUTPUT_MODE", "owner"),
+        'load_mode': os.getenv("ETL_LOAD_MODE", "swap"),
+        'sinks': sink_settings(),
+        'batch_rows': DEFAULT_BATCH_ROWS,
+    }
+    inputs = dict(zip(['assets', 'entities', 'join'], sources))
+    return RunCheckpoint(checkpoint_path(directory, collection), inputs, settings)
+
+
+def open_sink(collection, load_mode, checkpoint):
+    """
+    Create the sinks of the run (see app.sinks.make_sink), checkpointed when a checkpoint is given.
+
+    Args:
+        collection: The MongoDB collection to load.
+        load_mode (str): The load mode of the collection.
+        checkpoint (app.checkpoint.RunCheckpoint): The checkpoint of the run, or None.
+
+    Returns:
+        The sink, which resumes the interrupted load of the checkpoint, unless the documents it committed are
+        missing, and keeps its own load resumable.
+    """
+    if checkpoint is None:
+        return make_sink(collection, sink_settings(), load_mode, *load_settings())
+    if (checkpoint.resumed and any(kind == 'mongo' for kind, _ in parse_sinks(sink_settings()))
+            and not can_resume(collection, load_mode, checkpoint.manifest['records'])):
+        logger.warning('The documents of the interrupted load are missing, starting the load over.')
+        checkpoint.restart()
+    sink = make_sink(collection, sink_settings(), load_mode, *load_settings(), resume=bool(checkpoint.resumed),
+                     resumable=True)
+    return CheckpointedSink(sink, checkpoint)
+
+
+def rejection_report_settings():
+    """
+    Read the rejection report settings from the environment.
+
+    Returns:
+        tuple: The path of the rejection report (ETL_REJECTION_REPORT), or None when it is not set, and the list
+               the reports of the validations are collected in, or None when no report is written.
+    """
+    file_path = os.getenv("ETL_REJECTION_REPORT")
+    return (file_path, []) if file_path else (None, None)
+
+
+def save_rejection_report(file_path, report):
+    """
+    Write the collected rejection report, if one was requested.
+
+    Args:
+        file_path (str): Path of the report, or None.
+        report (list): The reports collected by the validations.
+    """
+    if file_path:
+        rejected = write_rejection_report(report, file_path)
+        logger.info(f'Rejection report written to {file_path}: {rejected} rows.')
+
+
+def validation_metadata(rejected, report):
+    """
+    Returns:
+        dict: The outcome of the validation of an input in a JSON-serializable form, stored with its snapshot:
+              the rows rejected per rule under 'rejected' and the 'row' and 'rule' of the rejection report under
+              'report'.
+    """
+    rows = rejection_report(report)
+    return {'rejected': rejected, 'report': {'row': rows['row'].tolist(), 'rule': rows['rule'].astype(str).tolist()}}
+
+
+def restore_validation(validation, stages, spans=None, report=None):
+    """
+    Account for the validation of an input read back from its snapshot, which was not run again.
+
+    Args:
+        validation (dict): The outcome of the validation stored with the snapshot (see validation_metadata).
+        stages (dict): Mapping updated in place with the seconds spent in every stage.
+        spans (dict, optional): Mapping updated in place with the span of every stage, whose 'validate' span
+                                gets the stored rejected counts.
+        report (list, optional): List the stored rejection report is appended to.
+    """
+    with timed_stage(stages, 'validate', spans) as span:
+        for rule, count in validation['rejected'].items():
+            span['rejected'][rule] = span['rejected'].get(rule, 0) + count
+    if report is not None and validation['report']['row']:
+        report.append(pd.DataFrame({'row': validation['report']['row'],
+                                    'rule': pd.Categorical(validation['report']['rule'])}))
+
+
+def extract_validated(file_path, schema, validate, stages, spans=None, report=None, validation=None):
+    """
+    Extract a CSV file and validate its records, timing both stages.
+
+    Args:
+        file_path (list): The paths to the shards of the input.
+        schema (dict): The declared column types of the file, e.g. ASSET_SCHEMA.
+        validate (callable): The validation function of the file, e.g. validate_assets. None returns the
+                             records unvalidated.
+        stages (dict): Mapping updated in place with the seconds spent in every stage.
+        spans (dict, optional): Mapping updated in place with the span of every stage.
+        report (list, optional): List the rejection report of the records is appended to.
+        validation (dict, optional): Mapping updated with the outcome of the validation, to be stored with a
+                                     snapshot (see validation_metadata).
+
+    Returns:
+        pd.DataFrame: The validated records.
+    """
+    with timed_stage(stages, 'extract', spans) as span:
+        records = extract_data(file_path, schema=schema, engine=os.getenv("ETL_CSV_ENGINE"),
+                               workers=int(os.getenv("ETL_READ_WORKERS", "4")))
+        span['rows_out'] += len(records)
+    logger.info(f'{source_name(file_path)} loaded: {len(records)} rows.')
+    if validate is None:
+        return records
+    with timed_stage(stages, 'validate', spans) as span:
+        if validation is None:
+            validated = validate(records, span['rejected'], report)
+        else:
+            rejected, parts = {}, []
+            validated = validate(records, rejected, parts)
+            validation.update(validation_metadata(rejected, parts))
+            for rule, count in rejected.items():
+                span['rejected'][rule] = span['rejected'].get(rule, 0) + count
+            if report is not None:
+                report.extend(parts)
+        span['rows_in'] += len(records)
+        span['rows_out'] += len(validated)
+    return validated
+
+
+def load_validated(snapshots, name, file_path, schema, validate, stages, spans=None, report=None, refresh=False):
+    """
+    Read the validated records of an input from its snapshot, or extract and validate them when it has none.
+
+    Args:
+        snapshots (app.snapshot.SnapshotCache): The snapshots of the validated inputs.
+        name (str): The name of the input, e.g. 'assets'.
+        file_path (list): The paths to the shards of the input.
+        schema (dict): The declared column types of the file, e.g. ASSET_SCHEMA.
+        validate (callable): The validation function of the file, e.g. validate_assets.
+        stages (dict): Mapping updated in place with the seconds spent in every stage.
+        spans (dict, optional): Mapping updated in place with the span of every stage.
+        report (list, optional): List the rejection report of the records is appended to.
+        refresh (bool): Extract and validate the input even if it has a snapshot.
+
+    Returns:
+        pd.DataFrame: The validated records. The outcome of the validation is stored with the snapshot and
+                      restored when it is read back, so that the rejection report and the rejected counts are
+                      the same whether the input was validated again or not.
+    """
+    validation, built = {}, []
+
+    def build(path):
+        built.append(path)
+        return extract_validated(path, schema, validate, stages, spans, report, validation)
+
+    records = snapshots.load(name, file_path, build, refresh, validation)
+    if not built:
+        restore_validation(validation, stages, spans, report)
+    return records
+
+
+def etl_pipeline(collection, stages=None, on_commit=None, spans=None):
+    """
+    Main entry point of the data pipeline.
+
+    This function orchestrates the Extract, Transform, Load (ETL) process.
+    It extracts, validates, and transforms the data, then saves it to a MongoDB collection.
+    The inputs are read from ETL_ASSETS_SOURCE, ETL_ENTITIES_SOURCE and ETL_JOIN_SOURCE, each a file, a glob pattern
+    or a manifest of shards, which default to the three files of /dataset.
+    When ETL_CHUNKSIZE is set, or ETL_TRANSFORM_ENGINE is 'sqlite', the data is streamed chunk by chunk instead
+    of being loaded at once.
+    Otherwise, when ETL_SNAPSHOT_DIR is set, the validated inputs are cached there and unchanged files are
+    neither parsed nor validated again. When ETL_TRANSFORM_WORKERS is above 1, the data is validated and
+    transformed by that many processes, each handling a partition of the assets. When ETL_REJECTION_REPORT is
+    set, the row and reason code of every record rejected by the validation are written to that file. The
+    per-city statistics of the transformed rows are loaded together with the records (see app.load.stats_name).
+    The records are converted and written by batches to the sinks of ETL_SINKS: the collection, NDJSON files and
+    Parquet files, all fed by the same run. When ETL_CHECKPOINT_DIR is set, every committed batch is recorded
+    in a run manifest there, and a run with the same inputs and settings as an interrupted one resumes its load
+    at the first batch it did not commit (see app.checkpoint).
+
+    Args:
+        collection: The MongoDB collection to load.
+        stages (dict, optional): Mapping updated in place with the seconds spent in every stage.
+        on_commit (callable, optional): Function called as soon as the new data is committed to the collection.
+        spans (dict, optional): Mapping updated in place with the span of every stage: its duration, the rows
+                                it read and wrote, the rows rejected per validation rule and the peak RSS.
+
+    Returns:
+        dict: The counts reported by the sink.
+    """
+    stages = {} if stages is None else stages
+    chunksize = int(os.getenv("ETL_CHUNKSIZE", "0"))
+    if not chunksize and transform_engine() == 'sqlite':
+        chunksize = DEFAULT_SQL_CHUNKSIZE
+    data_folder = '/dataset'
+    asset_file, entity_file, join_file = input_sources(data_folder)
+
+    try:
+        checkpoint = run_checkpoint(collection, (asset_file, entity_file, join_file), chunksize)
+        if chunksize:
+            return streaming_etl_pipeline(collection, asset_file, entity_file, join_file, chunksize, stages, on_commit,
+                                          spans, checkpoint)
+
+        report_file, report = rejection_report_settings()
+
+        inputs = [(asset_file, ASSET_SCHEMA, validate_assets), (entity_file, ENTITY_SCHEMA, validate_entities),
+                  (join_file, JOIN_SCHEMA, validate_join)]
+        snapshots, refresh = snapshot_settings()
+        workers = int(os.getenv("ETL_TRANSFORM_WORKERS", "1"))
+        if snapshots is None:
+            # Extract and validate data. With several transform workers, the records are validated by the
+            # workers, within the transform stage.
+            asset_records, entity_records, join_records = [
+                extract_validated(file_path, schema, None if workers > 1 else validate, stages, spans, report)
+                for file_path, schema, validate in inputs
+            ]
+            logger.info('Data extraction and validation successful.')
+        else:
+            # Read the validated data from the snapshots of the unchanged files. The 'snapshot' stage
+            # accounts for fingerprinting, reading and writing the snapshots, without the extract and
+            # validate stages of the changed files.
+            rebuilt = stages.get('extract', 0.0) + stages.get('validate', 0.0)
+            with timed_stage(stages, 'snapshot', spans) as span:
+                asset_records, entity_records, join_records = [
+                    load_validated(snapshots, name, file_path, schema, validate, stages, spans, report, refresh)
+                    for name, (file_path, schema, validate) in zip(['assets', 'entities', 'join'], inputs)
+                ]
+                span['rows_out'] += len(asset_records) + len(entity_records) + len(join_records)
+            stages['snapshot'] -= stages.get('extract', 0.0) + stages.get('validate', 0.0) - rebuilt
+            logger.info('Data extraction and validation successful.')
+
+        # Transform data
+        stats = []
+        with timed_stage(stages, 'transform', spans) as span:
+            span['rows_in'] += len(asset_records) + len(entity_records) + len(join_records)
+            if workers > 1:
+                transformed_data = parallel_transform(asset_records, entity_records, join_records, workers,
+                                                      rejections=span['rejected'], validated=snapshots is not None,
+                                                      report=report, join_options=join_settings(), stats=stats)
+            else:
+                transformed_data = transform_data(asset_records, entity_records, join_records, join_settings(),
+                                                  stats)
+            if os.getenv("ETL_OUTPUT_MODE", "owner") == 'asset':
+                transformed_data = aggregate_ownerships(transformed_data)
+            span['rows_out'] += len(transformed_data)
+        logger.info(f'Data transformation successful: {len(transformed_data)} rows.')
+        save_rejection_report(report_file, report)
+
+        # Convert the DataFrame to JSON and write the records to the sinks, one batch at a time
+        load_mode = os.getenv("ETL_LOAD_MODE", "swap")
+        with timed_stage(stages, 'load', spans):
+            sink = open_sink(collection, load_mode, checkpoint)
+        try:
+            batches = record_batches(transformed_data)
+            while True:
+                with timed_stage(stages, 'convert', spans) as span:
+                    df_records = next(batches, None)
+                    if df_records is None:
+                        break
+                    span['rows_in'] += len(df_records)
+                    span['rows_out'] += len(df_records)
+                with timed_stage(stages, 'load', spans) as span:
+                    sink.apply(df_records)
+                    span['rows_in'] += len(df_records)
+            logger.info('DataFrame conversion to JSON successful.')
+            with timed_stage(stages, 'load', spans) as span:
+                counts = sink.finish(city_statistics(stats))
+                span['rows_out'] += written_rows(counts)
+        except Exception:
+            sink.abort()
+            raise
+        if on_commit is not None:
+            on_commit()
+        logger.info(f'Records loaded into {sink_settings()} ({load_mode}): {counts}.')
+
+        logger.info("All data has been ingested.")
+        return counts
+    except Exception as e:
+        logger.exception("An error occurred during the data pipeline.")
+        raise
+
+
+def streaming_etl_pipeline(collection, asset_file, entity_file, join_file, chunksize, stages, on_commit=None,
+                           spans=None, checkpoint=None):
+    """
+    Run the ETL process chunk by chunk with bounded memory.
+
+    Args:
+        collection: The MongoDB collection to load.
+        asset_file (str or list): Path to the assets CSV file, or its shards.
+        entity_file (str or list): Path to the entities CSV file, or its shards.
+        join_file (str or list): Path to the assets/entities join CSV file, or its shards.
+        chunksize (int): The number of rows read at a time.
+        stages (dict): Mapping updated in place with the seconds spent in every stage.
+        on_commit (callable, optional): Function called as soon as the new data is committed to the collection.
+        spans (dict, optional): Mapping updated in place with the span of every stage.
+        checkpoint (app.checkpoint.RunCheckpoint, optional): The checkpoint recording every committed partition
+                                                             or batch.
+
+    Returns:
+        dict: The counts reported by the sink.
+
+    Only the entities are fully loaded, as the lookup side of the join. Assets and join records are read
+    in chunks of ETL_CHUNKSIZE rows, partitioned into ETL_PARTITIONS partitions on disk, and every
+    transformed partition is converted and inserted before the next one is processed. With the 'sqlite'
+    ETL_TRANSFORM_ENGINE, they are staged into an SQLite database on disk instead (in ETL_SQL_DIR, default the
+    temporary directory), which joins and deduplicates them, and the transformed rows are converted and
+    inserted by batches of 'chunksize' rows. The per-city statistics of every partition or batch are combined
+    and loaded with the last one. Reading, validating and partitioning or staging the assets and join
+    records is accounted to the transform stage, and the rows they reject to its span.
+    """
+    partitions = int(os.getenv("ETL_PARTITIONS", "16"))
+    engine = transform_engine()
+    report_file, report = rejection_report_settings()
+    output_mode = os.getenv("ETL_OUTPUT_MODE", "owner")
+    load_mode = os.getenv("ETL_LOAD_MODE", "swap")
+
+    with timed_stage(stages, 'extract', spans) as span:
+        entity_records = pd.concat(extract_data(entity_file, chunksize=chunksize, schema=ENTITY_SCHEMA),
+                                   ignore_index=True)
+        span['rows_out'] += len(entity_records)
+    logger.info(f'{source_name(entity_file)} loaded: {len(entity_records)} rows.')
+    with timed_stage(stages, 'validate', spans) as span:
+        span['rows_in'] += len(entity_records)
+        entity_records = validate_entities(entity_records, span['rejected'], report)
+        span['rows_out'] += len(entity_records)
+    logger.info('Entity records validated.')
+
+    asset_chunks = extract_data(asset_file, chunksize=chunksize, schema=ASSET_SCHEMA)
+    join_chunks = extract_data(join_file, chunksize=chunksize, schema=JOIN_SCHEMA)
+    rejections, stats = {}, []
+    if engine == 'sqlite':
+        partitioned = sql_transform(asset_chunks, entity_records, join_chunks, chunksize, os.getenv("ETL_SQL_DIR"),
+                                    rejections=rejections, report=report, join_options=join_settings(), stats=stats)
+    else:
+        partitioned = stream_transform(asset_chunks, entity_records, join_chunks, partitions, rejections=rejections,
+                                       report=report, join_options=join_settings(), stats=stats)
+
+    with timed_stage(stages, 'load', spans):
+        sink = open_sink(collection, load_mode, checkpoint)
+    try:
+        processed = 0
+        while True:
+            with timed_stage(stages, 'transform', spans) as span:
+                transformed_data = next(partitioned, None)
+                if transformed_data is None:
+                    break
+                if output_mode == 'asset':
+                    transformed_data = aggregate_ownerships(transformed_data)
+                span['rows_out'] += len(transformed_data)
+            with timed_stage(stages, 'convert', spans) as span:
+                df_records = convert_df_to_json(transformed_data)
+                span['rows_in'] += len(transformed_data)
+                span['rows_out'] += len(df_records)
+            with timed_stage(stages, 'load', spans) as span:
+                sink.apply(df_records)
+                span['rows_in'] += len(df_records)
+            processed += len(df_records)
+            logger.info(f'{processed} records processed.')
+        with timed_stage(stages, 'load', spans) as span:
+            counts = sink.finish(city_statistics(stats))
+            span['rows_out'] += written_rows(counts)
+    except Exception:
+        sink.abort()
+        raise
+    finally:
+        if spans is not None:
+            transform_span = spans.setdefault('transform', new_span())
+            for rule, count in rejections.items():
+                transform_span['rejected'][rule] = transform_span['rejected'].get(rule, 0) + count
+    if on_commit is not None:
+        on_commit()
+    logger.info(f'Records loaded into {sink_settings()} ({load_mode}): {counts}.')
+    save_rejection_report(report_file, report)
+    logger.info("All data has been ingested.")
+    return counts
@@ -0,0 +1,192 @@
+import json
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+from bson import ObjectId
+
+# Number of documents fetched from MongoDB and serialized together while streaming
+BATCH_SIZE = 1000
+
+# Internal fields that are never returned to the API clients
+HIDDEN_FIELDS = ['_fingerprint']
+
+
+def parse_cursor(after: str):
+    """
+    Convert the 'after' query parameter back into an '_id' value.
+
+    Args:
+        after (str): The '_id' of the last document of the previous page, as returned to the client.
+
+    Returns:
+        ObjectId or str: The '_id' value, as an ObjectId when the string is one.
+    """
+    return ObjectId(after) if ObjectId.is_valid(after) else after
+
+
+def build_projection(fields: Optional[str]) -> dict:
+    """
+    Build the MongoDB projection for the 'fields' query parameter.
+
+    Args:
+        fields (str, optional): Comma-separated list of the fields to return.
+
+    Returns:
+        dict: Projection returning only the requested fields plus '_id', or every field but the internal ones.
+    """
+    names = [field.strip() for field in (fields or '').split(',')]
+    projection = {name: 1 for name in names if name and name not in HIDDEN_FIELDS}
+    return projection or {field: 0 for field in HIDDEN_FIELDS}
+
+
+def find_documents(collection, query: dict, limit: Optional[int] = None, after: Optional[str] = None,
+                   fields: Optional[str] = None):
+    """
+    Query a page of documents in '_id' order.
+
+    Args:
+        collection: The MongoDB collection to query.
+        query (dict): The MongoDB filter.
+        limit (int, optional): The maximum number of documents to return. All the documents when omitted.
+        after (str, optional): Only return the documents whose '_id' comes after this one (keyset pagination).
+        fields (str, optional): Comma-separated list of the fields to return.
+
+    Returns:
+        Cursor or AsyncCursor: A cursor of the same kind as the collection over the matching documents, fetched
+                               in batches of BATCH_SIZE.
+    """
+    if after:
+        query = {**query, '_id': {'$gt': parse_cursor(after)}}
+    cursor = collection.find(query, build_projection(fields)).sort('_id', 1).batch_size(BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def json_array_items(documents: list, first: bool) -> str:
+    """
+    Serialize a batch of documents as items of an indented JSON array.
+
+    Args:
+        documents (list): The documents of the batch.
+        first (bool): Whether the batch starts the array.
+
+    Returns:
+        str: The items, each preceded by its separator, with every '_id' converted to a string.
+    """
+    pieces = []
+    for document in documents:
+        document['_id'] = str(document['_id'])
+        text = json.dumps(document, indent=4, default=str).replace('\n', '\n    ')
+        pieces.append(('\n    ' if first else ',\n    ') + text)
+        first = False
+    return ''.join(pieces)
+
+
+def ndjson_lines(documents: list) -> str:
+    """
+    Serialize a batch of documents as newline-delimited JSON.
+
+    Args:
+        documents (list): The documents of the batch.
+
+    Returns:
+        str: One compact JSON document per line, with every '_id' converted to a string.
+    """
+    pieces = []
+    for document in documents:
+        document['_id'] = str(document['_id'])
+        pieces.append(json.dumps(document, default=str) + '\n')
+    return ''.join(pieces)
+
+
+def iter_batches(documents: Iterable[dict]) -> Iterator[list]:
+    """
+    Group documents into lists of BATCH_SIZE documents.
+
+    Args:
+        documents (Iterable[dict]): The documents, typically a MongoDB cursor.
+
+    Returns:
+        Iterator[list]: The batches of documents.
+    """
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def aiter_batches(documents: AsyncIterable[dict]) -> AsyncIterator[list]:
+    """
+    Group the documents of an asynchronous cursor into lists of BATCH_SIZE documents.
+
+    Args:
+        documents (AsyncIterable[dict]): The documents, typically an AsyncCursor.
+
+    Returns:
+        AsyncIterator[list]: The batches of documents.
+    """
+    batch = []
+    async for document in documents:
+        batch.append(document)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_json_array(documents: Iterable[dict]) -> Iterator[str]:
+    """
+    Serialize documents as an indented JSON array, a batch of documents at a time.
+
+    Args:
+        documents (Iterable[dict]): The documents, typically a MongoDB cursor.
+
+    Returns:
+        Iterator[str]: Pieces of text that concatenate to json.dumps(list(documents), indent=4, default=str),
+                       with every '_id' converted to a string.
+    """
+    yield '['
+    empty = True
+    for batch in iter_batches(documents):
+        yield json_array_items(batch, empty)
+        empty = False
+    yield ']' if empty else '\n]'
+
+
+def iter_ndjson(documents: Iterable[dict]) -> Iterator[str]:
+    """
+    Serialize documents as newline-delimited JSON, a batch of documents at a time.
+
+    Args:
+        documents (Iterable[dict]): The documents, typically a MongoDB cursor.
+
+    Returns:
+        Iterator[str]: Pieces of text holding one compact JSON document per line, with every '_id' converted
+                       to a string.
+    """
+    for batch in iter_batches(documents):
+        yield ndjson_lines(batch)
+
+
+async def aiter_json_array(documents: AsyncIterable[dict]) -> AsyncIterator[str]:
+    """
+    Asynchronous counterpart of iter_json_array, for an AsyncCursor.
+    """
+    yield '['
+    empty = True
+    async for batch in aiter_batches(documents):
+        yield json_array_items(batch, empty)
+        empty = False
+    yield ']' if empty else '\n]'
+
+
+async def aiter_ndjson(documents: AsyncIterable[dict]) -> AsyncIterator[str]:
+    """
+    Asynchronous counterpart of iter_ndjson, for an AsyncCursor.
+    """
+    async for batch in aiter_batches(documents):
+        yield ndjson_lines(batch)
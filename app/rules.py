@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+# Values of the cadastral codes accepted by the validation: digits and letters only
+ALPHANUMERIC = r'^[a-zA-Z0-9]+$'
+
+
+def required(*columns):
+    """
+    Rule rejecting the rows with a missing value in any of the columns.
+    """
+    return {'check': 'required', 'columns': list(columns)}
+
+
+def at_least_one(*columns):
+    """
+    Rule rejecting the rows with a missing value in all of the columns.
+    """
+    return {'check': 'at_least_one', 'columns': list(columns)}
+
+
+def matches(column, pattern):
+    """
+    Rule rejecting the rows whose value in the column does not match the regular expression. Missing values
+    never match.
+    """
+    return {'check': 'matches', 'columns': [column], 'pattern': pattern}
+
+
+def unique(*columns):
+    """
+    Rule rejecting the rows repeating the key of an earlier row. The key is every column when none is given.
+    """
+    return {'check': 'unique', 'columns': list(columns)}
+
+
+# Validation rules of every input table, as (reason code, rule) pairs in the order they are evaluated.
+# A rejected row is reported with the reason code of the first rule it breaks.
+ASSET_RULES = [
+    ('assets.invalid_characters.particella', matches('particella', ALPHANUMERIC)),
+    ('assets.invalid_characters.subalterno', matches('subalterno', ALPHANUMERIC)),
+    ('assets.duplicate', unique()),
+]
+
+ENTITY_RULES = [
+    ('entities.missing.entity_id', required('entity_id')),
+    ('entities.missing.vatCode_and_taxCode', at_least_one('vatCode', 'taxCode')),
+    ('entities.duplicate', unique()),
+]
+
+JOIN_RULES = [
+    ('join.missing.entity_id_or_asset_id', required('entity_id', 'asset_id')),
+    ('join.duplicate', unique()),
+]
+
+
+def rule_mask(df, rule, valid):
+    """
+    Evaluate a rule on every row of a DataFrame.
+
+    Args:
+    df (pd.DataFrame): The records.
+    rule (dict): The rule, e.g. required('entity_id').
+    valid (np.ndarray): Whether every row passed the previous rules. A uniqueness rule only compares the
+                        rows that did, so a row is not a duplicate of a rejected one.
+
+    Returns:
+    np.ndarray: Whether every row passes the rule.
+    """
+    check, columns = rule['check'], rule['columns']
+    if check == 'required':
+        return df[columns].notna().all(axis=1).to_numpy()
+    if check == 'at_least_one':
+        return df[columns].notna().any(axis=1).to_numpy()
+    if check == 'matches':
+        return df[columns[0]].str.match(rule['pattern'], na=False).to_numpy(dtype=bool)
+    if check == 'unique':
+        keys = df[columns] if columns else df
+        if valid.all():
+            return ~keys.duplicated().to_numpy()
+        passed = np.ones(len(df), dtype=bool)
+        passed[valid] = ~keys[valid].duplicated().to_numpy()
+        return passed
+    raise ValueError(f"Unknown validation check '{check}'.")
+
+
+def apply_rules(df, rules, rejections=None, report=None):
+    """
+    Validate records against a rule set with a single filter.
+
+    Args:
+    df (pd.DataFrame): The records.
+    rules (list): The (reason code, rule) pairs, e.g. ASSET_RULES.
+    rejections (dict, optional): Mapping of the reason codes to the number of rows they rejected,
+                                 updated in place.
+    report (list, optional): List the rejection report of the records is appended to, when a row is
+                             rejected: a DataFrame with the index label of every rejected 'row' and the
+                             reason code of the first 'rule' it breaks, as a categorical.
+
+    Returns:
+    pd.DataFrame: The records passing every rule, in their original order.
+
+    Every rule is evaluated as a boolean mask over the rows and the masks are combined before the records
+    are filtered once. The columns checked against a pattern are converted to text first, if they are not.
+    """
+    text = {rule['columns'][0]: df[rule['columns'][0]].astype(str) for _, rule in rules
+            if rule['check'] == 'matches' and not pd.api.types.is_string_dtype(df[rule['columns'][0]])}
+    if text:
+        df = df.assign(**text)
+
+    valid = np.ones(len(df), dtype=bool)
+    reasons = np.full(len(df), -1, dtype=np.int16)
+    for code, (name, rule) in enumerate(rules):
+        failed = valid & ~rule_mask(df, rule, valid)
+        reasons[failed] = code
+        valid &= ~failed
+        if rejections is not None:
+            rejections[name] = rejections.get(name, 0) + int(failed.sum())
+
+    if report is not None and not valid.all():
+        rejected = ~valid
+        report.append(pd.DataFrame({
+            'row': df.index[rejected],
+            'rule': pd.Categorical.from_codes(reasons[rejected], [name for name, _ in rules]),
+        }))
+    return df[valid]
+
+
+def rejection_report(report):
+    """
+    Combine the rejection reports of several validations.
+
+    Args:
+    report (list): The reports appended by apply_rules.
+
+    Returns:
+    pd.DataFrame: The 'row' and 'rule' of every rejected row, with the rules as a categorical.
+    """
+    if not report:
+        return pd.DataFrame({'row': pd.Series(dtype='int64'), 'rule': pd.Categorical([])})
+    rules = pd.api.types.union_categoricals([part['rule'] for part in report])
+    return pd.DataFrame({'row': np.concatenate([part['row'].to_numpy() for part in report]), 'rule': rules})
+
+
+def write_rejection_report(report, file_path):
+    """
+    Write a rejection report to a CSV file, compressed according to its extension (e.g. '.csv.gz').
+
+    Args:
+    report (list): The reports appended by apply_rules.
+    file_path (str): Path to the report file.
+
+    Returns:
+    int: The number of rejected rows written.
+    """
+    rejected = rejection_report(report)
+    rejected.to_csv(file_path, index=False)
+    return len(rejected)
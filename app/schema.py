@@ -0,0 +1,78 @@
+import pandas as pd
+import pyarrow as pa
+
+# Declared column types of the input CSV files. Identifiers and codes are read as text, so that values such as
+# 'foglio' or 'vatCode' keep their exact spelling (no '3.0', no lost leading zeros), and the low-cardinality
+# columns repeated on many rows are read as categoricals.
+ASSET_SCHEMA = {
+    'asset_id': str,
+    'cityCode': 'category',
+    'catasto': 'category',
+    'sezione': 'category',
+    'foglio': str,
+    'particella': str,
+    'subalterno': str,
+}
+
+ENTITY_SCHEMA = {
+    'entity_id': str,
+    'taxCode': str,
+    'vatCode': str,
+}
+
+JOIN_SCHEMA = {
+    'asset_id': str,
+    'entity_id': str,
+    'ownershipShare': str,
+}
+
+# CSV parsers accepted by extract_data() with a schema
+ENGINES = ['pyarrow', 'c']
+
+
+def read_options(schema, chunked=False):
+    """
+    Build the pd.read_csv keyword arguments of a declared schema, for the pandas C parser.
+
+    Args:
+    schema (dict): Mapping of the column names to read to their dtype, e.g. ASSET_SCHEMA.
+    chunked (bool): Whether the file is read in chunks. Categories are only consistent within a chunk,
+                    so categorical columns are read as text instead.
+
+    Returns:
+    dict: The 'usecols', 'dtype', 'engine' and 'on_bad_lines' arguments. Rows with more fields than the header
+          are skipped when every column of the file is declared; otherwise their extra fields are ignored.
+    """
+    dtypes = dict(schema)
+    if chunked:
+        dtypes = {column: str if dtype == 'category' else dtype for column, dtype in dtypes.items()}
+    return {'usecols': list(schema), 'dtype': dtypes, 'engine': 'c', 'on_bad_lines': 'skip'}
+
+
+def arrow_column_types(schema):
+    """
+    Translate a declared schema into pyarrow CSV column types.
+
+    Args:
+    schema (dict): Mapping of the column names to read to their dtype, e.g. ASSET_SCHEMA.
+
+    Returns:
+    dict: Mapping of the column names to pyarrow types. Text columns are strings and categorical columns are
+          dictionary-encoded strings, which pandas reads back as categoricals. Values are never inferred, so
+          codes keep their exact spelling.
+    """
+    return {column: pa.dictionary(pa.int32(), pa.string()) if dtype == 'category' else pa.string()
+            for column, dtype in schema.items()}
+
+
+def is_categorical(series):
+    """
+    Check whether a column is categorical.
+
+    Args:
+    series (pd.Series): The column.
+
+    Returns:
+    bool: True if the column has a categorical dtype.
+    """
+    return isinstance(series.dtype, pd.CategoricalDtype)
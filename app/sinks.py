@@ -0,0 +1,267 @@
+import os
+import json
+import logging
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, wait
+from app.load import RECORD_FIELDS, convert_df_to_json, make_loader
+
+logger = logging.getLogger(__name__)
+
+# Kinds of sinks accepted in ETL_SINKS, and whether they write to a file
+SINK_KINDS = {'mongo': False, 'ndjson': True, 'parquet': True}
+
+# Number of transformed rows converted to records and written at a time by the in-memory pipeline
+DEFAULT_BATCH_ROWS = 100000
+
+# Compression of the NDJSON files, according to the extension of their path
+NDJSON_COMPRESSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.zst': 'zstd', '.lz4': 'lz4'}
+
+# Compression of the Parquet files
+PARQUET_COMPRESSION = 'zstd'
+
+# Suffix of the files being written, renamed to their path once complete
+PARTIAL_SUFFIX = '.partial'
+
+# Parquet type of an owner dictionary
+OWNERSHIP_TYPE = pa.struct([('entity_id', pa.string()), ('vatCode', pa.string()), ('taxCode', pa.string()),
+                            ('ownershipShare', pa.float64())])
+
+
+def record_batches(df, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Convert a transformed DataFrame to records by batches.
+
+    Args:
+        df (pd.DataFrame): The transformed DataFrame, with the rows of every asset next to each other.
+        batch_rows (int): The number of rows converted at a time.
+
+    Returns:
+        Iterator[list]: Yields the records of convert_df_to_json, by batches of about 'batch_rows' records that
+                        never split the rows of an asset, so that an incremental load gives them the same '_id'
+                        as in a single batch. The rows of the entities owning no asset, whose 'asset_id' is
+                        empty, are not held together.
+    """
+    keys = df['cherry_asset_id'].to_numpy()
+    owned = (df['asset_id'].fillna('') != '').to_numpy() if 'asset_id' in df.columns else None
+    start = 0
+    while start < len(df):
+        end = min(start + batch_rows, len(df))
+        while end < len(df) and keys[end] == keys[end - 1] and (owned is None or owned[end]):
+            end += 1
+        yield convert_df_to_json(df.iloc[start:end])
+        start = end
+
+
+def record_fields(record: dict) -> dict:
+    """
+    Returns:
+        dict: The RECORD_FIELDS of a record, without the fields a loader may add to it, such as '_id'. The
+              record is read by key only, so a loader of a fan-out may add its fields at the same time.
+    """
+    return {field: record[field] for field in RECORD_FIELDS}
+
+
+class NdjsonSink:
+    """
+    Write the records to a newline-delimited JSON file, compressed according to its extension (e.g. '.ndjson.gz'
+    or '.ndjson.zst').
+
+    The file is written next to its path with a '.partial' suffix and renamed into place by finish(), so
+    readers only ever see complete files.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.partial_path = file_path + PARTIAL_SUFFIX
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        compression = NDJSON_COMPRESSIONS.get(os.path.splitext(file_path)[1])
+        self.stream = pa.output_stream(self.partial_path, compression=compression)
+        self.written = 0
+
+    def apply(self, records: list):
+        lines = ''.join(json.dumps(record_fields(record), default=str) + '\n' for record in records)
+        self.stream.write(lines.encode('utf-8'))
+        self.written += len(records)
+
+    def skip(self, records: list):
+        """Write a batch that an interrupted run already committed, since every run writes the file anew."""
+        self.apply(records)
+
+    def finish(self, stats: list = None) -> dict:
+        self.stream.close()
+        os.replace(self.partial_path, self.file_path)
+        return {'written': self.written, 'bytes': os.path.getsize(self.file_path)}
+
+    def abort(self):
+        self.stream.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+class ParquetSink:
+    """
+    Write the records to a Parquet file, one row group per batch.
+
+    The owners are a struct column, or a list of structs when the records are aggregated per asset, and the
+    missing ownership shares are nulls. The file is written with a '.partial' suffix and renamed into place by
+    finish(), like NdjsonSink.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.partial_path = file_path + PARTIAL_SUFFIX
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.writer = None
+        self.written = 0
+
+    def open_writer(self, aggregated: bool):
+        ownerships = pa.list_(OWNERSHIP_TYPE) if aggregated else OWNERSHIP_TYPE
+        schema = pa.schema([(field, pa.string()) for field in RECORD_FIELDS[:-1]] + [('ownerships', ownerships)])
+        self.writer = pq.ParquetWriter(self.partial_path, schema, compression=PARQUET_COMPRESSION)
+
+    def apply(self, records: list):
+        if not records:
+            return
+        if self.writer is None:
+            self.open_writer(isinstance(records[0]['ownerships'], list))
+
+        def owner(ownership):
+            share = ownership['ownershipShare']
+            return {**ownership, 'ownershipShare': None if share == '' else share}
+
+        columns = {field: [record[field] for record in records] for field in RECORD_FIELDS[:-1]}
+        columns['ownerships'] = [[owner(item) for item in record['ownerships']]
+                                 if isinstance(record['ownerships'], list) else owner(record['ownerships'])
+                                 for record in records]
+        self.writer.write_table(pa.Table.from_pydict(columns, schema=self.writer.schema))
+        self.written += len(records)
+
+    def skip(self, records: list):
+        """Write a batch that an interrupted run already committed, like NdjsonSink.skip."""
+        self.apply(records)
+
+    def finish(self, stats: list = None) -> dict:
+        if self.writer is None:
+            self.open_writer(False)
+        self.writer.close()
+        os.replace(self.partial_path, self.file_path)
+        return {'written': self.written, 'bytes': os.path.getsize(self.file_path)}
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+class FanOutSink:
+    """
+    Write every batch of records to several sinks at once, so that a single transform run feeds all of them.
+
+    Every sink writes the batch in its own thread, and apply() returns once they all wrote it, so only one
+    batch is held in memory. A sink failing to commit does not undo the sinks that already committed.
+    """
+
+    def __init__(self, sinks: dict):
+        """
+        Args:
+            sinks (dict): Mapping of the sink names to the sinks.
+        """
+        self.sinks = sinks
+        self.executor = ThreadPoolExecutor(max_workers=len(sinks), thread_name_prefix='sink')
+
+    def _call(self, method: str, *args) -> dict:
+        futures = {name: self.executor.submit(getattr(sink, method), *args) for name, sink in self.sinks.items()}
+        wait(futures.values())
+        return {name: future.result() for name, future in futures.items()}
+
+    def apply(self, records: list):
+        self._call('apply', records)
+
+    def skip(self, records: list):
+        self._call('skip', records)
+
+    def finish(self, stats: list = None) -> dict:
+        """
+        Returns:
+            dict: The counts of every sink, by name, in 'sinks'.
+        """
+        try:
+            return {'sinks': self._call('finish', stats)}
+        finally:
+            self.executor.shutdown()
+
+    def abort(self):
+        for name, sink in self.sinks.items():
+            try:
+                sink.abort()
+            except Exception:
+                logger.exception(f"The {name} sink could not be aborted.")
+        self.executor.shutdown()
+
+
+def parse_sinks(spec: str) -> list:
+    """
+    Parse a list of sinks.
+
+    Args:
+        spec (str): Comma-separated sinks, each a kind of SINK_KINDS followed, for a file, by ':' and its path,
+                    e.g. 'mongo,ndjson:/output/assets.ndjson.gz,parquet:/output/assets.parquet'.
+
+    Returns:
+        list: The (kind, path) of every sink, with a path of None for MongoDB.
+    """
+    sinks = []
+    for item in filter(None, (item.strip() for item in spec.split(','))):
+        kind, _, path = item.partition(':')
+        if kind not in SINK_KINDS:
+            raise ValueError(f"Unknown sink '{kind}', expected one of {list(SINK_KINDS)}.")
+        if SINK_KINDS[kind] != bool(path):
+            raise ValueError(f"The {kind} sink {'needs' if SINK_KINDS[kind] else 'takes no'} file path: '{item}'.")
+        sinks.append((kind, path or None))
+    if not sinks:
+        raise ValueError("No sink given.")
+    return sinks
+
+
+def make_sink(collection, spec: str = 'mongo', mode: str = 'swap', batch_size: int = 1000, workers: int = 4,
+              resume: bool = False, resumable: bool = False):
+    """
+    Create the sinks the records of a run are written to.
+
+    Args:
+        collection: The MongoDB collection served to readers, loaded by the 'mongo' sink.
+        spec (str): The sinks (see parse_sinks).
+        mode (str): The load mode of the 'mongo' sink (see app.load.make_loader).
+        batch_size (int): The number of records per bulk write of the 'mongo' sink.
+        workers (int): The number of batches inserted concurrently by the 'mongo' sink.
+        resume (bool): Continue the load of an interrupted run in the 'mongo' sink. The files are always
+                       written anew.
+        resumable (bool): Keep the unfinished load of the 'mongo' sink when it is aborted.
+
+    Returns:
+        A sink, or a FanOutSink of several, with the interface of the loaders: apply() takes batches of
+        records, skip() takes the batches an interrupted run already committed, finish() commits them and
+        returns the counts, and abort() discards an unfinished write. The per-city statistics given to
+        finish() are only kept by the 'mongo' sink.
+    """
+    named = [(kind if path is None else f'{kind}:{path}', kind, path) for kind, path in parse_sinks(spec)]
+    names = [name for name, _, _ in named]
+    if len(set(names)) != len(names):
+        raise ValueError(f"A sink is given twice: {names}.")
+    sinks = {}
+    for name, kind, path in named:
+        if kind == 'mongo':
+            sinks[name] = make_loader(collection, mode, batch_size, workers, resume, resumable)
+        elif kind == 'ndjson':
+            sinks[name] = NdjsonSink(path)
+        else:
+            sinks[name] = ParquetSink(path)
+    if len(sinks) == 1:
+        return next(iter(sinks.values()))
+    return FanOutSink(sinks)
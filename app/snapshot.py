@@ -0,0 +1,253 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+# Version of the snapshot contents, part of every key. Bump it whenever the parsing or the validation
+# of the inputs changes, so that the snapshots written by the previous code are never read back.
+SNAPSHOT_VERSION = 3
+
+# File remembering the content hash of the source files, to avoid hashing unchanged files again
+INDEX_FILE = 'index.json'
+
+# Suffix of the snapshot files
+SNAPSHOT_SUFFIX = '.arrow'
+
+# Suffix of the metadata stored next to a snapshot
+METADATA_SUFFIX = '.json'
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 hash of a file's content.
+
+    Args:
+        file_path (str): Path to the file.
+        block_size (int): The number of bytes read at a time.
+
+    Returns:
+        str: The hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_snapshot(df: pd.DataFrame, file_path: str):
+    """
+    Write a DataFrame to an uncompressed Arrow IPC file, atomically.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to write, index included.
+        file_path (str): Path to the snapshot file.
+
+    The file is uncompressed so it can be memory-mapped when read back.
+    """
+    temporary = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=True), temporary, compression='uncompressed')
+        os.replace(temporary, file_path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def metadata_path(file_path: str) -> str:
+    """
+    Returns:
+        str: The path of the metadata stored next to a snapshot file.
+    """
+    return file_path[:-len(SNAPSHOT_SUFFIX)] + METADATA_SUFFIX
+
+
+def write_metadata(metadata: dict, file_path: str):
+    """Write the metadata of a snapshot file, atomically."""
+    temporary = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(metadata, file)
+    os.replace(temporary, file_path)
+
+
+def read_snapshot(file_path: str) -> pd.DataFrame:
+    """
+    Read a snapshot written by write_snapshot(), memory-mapping the file.
+
+    Args:
+        file_path (str): Path to the snapshot file.
+
+    Returns:
+        pd.DataFrame: The DataFrame, with its original index.
+    """
+    with pa.memory_map(file_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+class SnapshotCache:
+    """
+    On-disk cache of validated input DataFrames, stored as Arrow IPC files.
+
+    A snapshot is keyed by the size, the modification time and the content hash of its source file, so an
+    unchanged input is read back from the snapshot without being parsed and validated again. The content
+    hash of a file is only computed again when its size or modification time changed.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 12, max_bytes: int = 0):
+        """
+        Args:
+            directory (str): The directory holding the snapshots, created if needed.
+            max_entries (int): The maximum number of snapshots kept. 0 keeps them all.
+            max_bytes (int): The maximum total size of the snapshots. 0 does not limit it.
+
+        When a limit is exceeded, the least recently used snapshots are removed first.
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def read_index(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def write_index(self, index: dict):
+        file_path = os.path.join(self.directory, INDEX_FILE)
+        temporary = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(index, file, indent=4)
+        os.replace(temporary, file_path)
+
+    def fingerprint(self, file_path: str) -> dict:
+        """
+        Fingerprint a source file.
+
+        Args:
+            file_path (str): Path to the source file.
+
+        Returns:
+            dict: The 'size', 'mtime_ns' and 'sha256' of the file.
+        """
+        stat = os.stat(file_path)
+        path = os.path.abspath(file_path)
+        with self.lock:
+            index = self.read_index()
+            known = index.get(path)
+            if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                return known
+        fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': hash_file(file_path)}
+        with self.lock:
+            index = self.read_index()
+            index[path] = fingerprint
+            self.write_index(index)
+        return fingerprint
+
+    def snapshot_path(self, name: str, file_path) -> str:
+        """
+        Get the path of the snapshot of a source file.
+
+        Args:
+            name (str): The name of the input, e.g. 'assets'.
+            file_path (str or list): Path to the source file, or the paths to the shards of the input.
+
+        Returns:
+            str: The path of the snapshot, which only exists if the file was already snapshotted unchanged.
+                 Adding, removing or changing a shard changes the path.
+        """
+        if isinstance(file_path, str):
+            fingerprint = self.fingerprint(file_path)
+        else:
+            fingerprint = [self.fingerprint(path) for path in file_path]
+        key = hashlib.sha256(json.dumps([SNAPSHOT_VERSION, name, fingerprint], sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.directory, f'{name}-{key[:32]}{SNAPSHOT_SUFFIX}')
+
+    def load(self, name: str, file_path: str, build, refresh: bool = False, metadata: dict = None) -> pd.DataFrame:
+        """
+        Get the validated DataFrame of a source file, from its snapshot when the file is unchanged.
+
+        Args:
+            name (str): The name of the input, e.g. 'assets'.
+            file_path (str or list): Path to the source file, or the paths to the shards of the input.
+            build (callable): Function parsing and validating the file, called with 'file_path' on a miss.
+            refresh (bool): Build the DataFrame and rewrite its snapshot even if a snapshot exists.
+            metadata (dict, optional): Mapping that 'build' fills with JSON-serializable data about the
+                                       DataFrame, such as the outcome of its validation. It is stored next to
+                                       the snapshot and filled from it when the snapshot is read back.
+
+        Returns:
+            pd.DataFrame: The validated DataFrame.
+        """
+        snapshot = self.snapshot_path(name, file_path)
+        if not refresh and os.path.exists(snapshot):
+            try:
+                if metadata is not None:
+                    with open(metadata_path(snapshot)) as file:
+                        stored = json.load(file)
+                df = read_snapshot(snapshot)
+                if metadata is not None:
+                    metadata.update(stored)
+                os.utime(snapshot)
+                logger.info(f'{name} read from snapshot {snapshot}.')
+                return df
+            except (OSError, ValueError, pa.ArrowException):
+                logger.warning(f'Unreadable snapshot {snapshot}, rebuilding it.')
+
+        df = build(file_path)
+        write_snapshot(df, snapshot)
+        if metadata is not None:
+            write_metadata(metadata, metadata_path(snapshot))
+        logger.info(f'{name} snapshot written to {snapshot}.')
+        self.evict()
+        return df
+
+    def entries(self) -> list:
+        """
+        Returns:
+            list: The (path, size, last use) of every snapshot, least recently used first.
+        """
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(SNAPSHOT_SUFFIX):
+                file_path = os.path.join(self.directory, file_name)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((file_path, stat.st_size, stat.st_mtime_ns))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Remove the least recently used snapshots beyond 'max_entries' or 'max_bytes'."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and ((self.max_entries and len(entries) > self.max_entries)
+                           or (self.max_bytes and total > self.max_bytes)):
+            file_path, size, _ = entries.pop(0)
+            for path in [file_path, metadata_path(file_path)]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logger.info(f'Snapshot {file_path} evicted.')
+
+    def clear(self):
+        """Remove every snapshot and the fingerprint index."""
+        for file_path, _, _ in self.entries():
+            os.remove(file_path)
+            if os.path.exists(metadata_path(file_path)):
+                os.remove(metadata_path(file_path))
+        index = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(index):
+            os.remove(index)
@@ -0,0 +1,283 @@
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+from app.transform import (validate_assets, validate_join, convert_ownership_shares_to_float, create_ownerships_column,
+                           city_stats, JoinCardinalityError)
+
+# Name of the database file, in the working directory of the engine
+DATABASE_FILE = 'transform.sqlite'
+
+# Number of staged rows inserted per statement
+INSERT_BATCH_SIZE = 10000
+
+# Staged column holding the converted ownership share, next to the original text used to find duplicates
+SHARE_COLUMN = 'ownershipShare_value'
+
+
+def quote(name):
+    """
+    Returns:
+        str: The name quoted as an SQL identifier.
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def filled(expression):
+    """
+    Returns:
+        str: The SQL expression replacing a missing value, 'NaN' or 'nan' with an empty string, like
+             fill_missing_values.
+    """
+    return f"CASE WHEN {expression} IS NULL OR {expression} IN ('NaN', 'nan') THEN '' ELSE {expression} END"
+
+
+def connect(file_path):
+    """
+    Open the database of the engine, tuned for a disposable bulk workload.
+
+    Args:
+        file_path (str): Path to the database file.
+
+    Returns:
+        sqlite3.Connection: The connection. Sorts and temporary tables spill to files next to the database
+                            rather than to memory.
+    """
+    connection = sqlite3.connect(file_path)
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute('PRAGMA temp_store = FILE')
+    return connection
+
+
+def stage(connection, table, df, columns=None):
+    """
+    Append the rows of a DataFrame to a staging table, created on the first call.
+
+    Args:
+        connection (sqlite3.Connection): The database.
+        table (str): The name of the table.
+        df (pd.DataFrame): The rows. Their index label is stored in the 'row' column.
+        columns (list, optional): The columns of the table, when it already exists.
+
+    Returns:
+        list: The columns of the table, in the order of the DataFrame. The columns are declared without a
+              type, so every value keeps the type it was inserted with.
+
+    The rowid of the staged rows follows the order in which they were appended.
+    """
+    if columns is None:
+        columns = list(df.columns)
+        connection.execute(f"CREATE TABLE {quote(table)} (row, {', '.join(map(quote, columns))})")
+    values = df[columns].astype(object)
+    values = values.where(df[columns].notna(), None)
+    statement = (f"INSERT INTO {quote(table)} (row, {', '.join(map(quote, columns))}) "
+                 f"VALUES ({', '.join(['?'] * (len(columns) + 1))})")
+    for start in range(0, len(values), INSERT_BATCH_SIZE):
+        batch = values.iloc[start:start + INSERT_BATCH_SIZE]
+        connection.executemany(statement, zip(batch.index.tolist(), *[batch[column].tolist() for column in columns]))
+    return columns
+
+
+def stage_chunks(connection, table, chunks, prepare=None):
+    """
+    Stage a stream of DataFrame chunks into a table.
+
+    Args:
+        connection (sqlite3.Connection): The database.
+        table (str): The name of the table.
+        chunks (Iterable[pd.DataFrame]): The chunks.
+        prepare (callable, optional): Function applied to every chunk before it is staged.
+
+    Returns:
+        list: The columns of the table, or None if the stream was empty, in which case no table is created.
+    """
+    columns = None
+    for chunk in chunks:
+        if prepare is not None:
+            chunk = prepare(chunk)
+        columns = stage(connection, table, chunk, columns)
+    return columns
+
+
+def remove_staged_duplicates(connection, table, columns, rule, rejections=None, report=None):
+    """
+    Delete the staged rows repeating an earlier row, which chunked validation could not see.
+
+    Args:
+        connection (sqlite3.Connection): The database.
+        table (str): The name of the table.
+        columns (list): The columns compared.
+        rule (str): The name of the validation rule, e.g. 'assets.duplicate'.
+        rejections (dict, optional): Mapping of the validation rules to the number of rows they rejected,
+                                     updated in place.
+        report (list, optional): List the rejection report of the deleted rows is appended to.
+    """
+    duplicates = (f"SELECT rowid FROM {quote(table)} EXCEPT "
+                  f"SELECT MIN(rowid) FROM {quote(table)} GROUP BY {', '.join(map(quote, columns))}")
+    if report is not None:
+        rows = [row for (row,) in connection.execute(
+            f"SELECT row FROM {quote(table)} WHERE rowid IN ({duplicates}) ORDER BY rowid")]
+        if rows:
+            report.append(pd.DataFrame({'row': rows, 'rule': pd.Categorical([rule] * len(rows))}))
+    deleted = connection.execute(f"DELETE FROM {quote(table)} WHERE rowid IN ({duplicates})").rowcount
+    if rejections is not None:
+        rejections[rule] = rejections.get(rule, 0) + deleted
+
+
+def check_unique(connection, table, key):
+    """
+    Raise JoinCardinalityError if a key is repeated in a staged table.
+    """
+    repeated = connection.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {quote(table)} GROUP BY {quote(key)} "
+                                  f"HAVING COUNT(*) > 1)").fetchone()[0]
+    if repeated:
+        raise JoinCardinalityError(f"'{key}' is not unique on the right side of the join: "
+                                   f"{repeated} key(s) repeated.")
+
+
+def merge_statement(join_columns, entity_columns, asset_columns):
+    """
+    Build the statement materializing the merged rows of transform_data into the 'merged' table.
+
+    Args:
+        join_columns (list): The columns of the join records, including 'asset_id' and 'entity_id'. The
+                             'ownershipShare' is read from its converted value.
+        entity_columns (list): The columns of the entities other than 'entity_id'.
+        asset_columns (list): The columns of the assets other than 'asset_id'.
+
+    Returns:
+        str: The INSERT statement. Its rows are those of merge_data() followed by delete_nan_rows(), in the
+             same order: by 'asset_id', then 'entity_id', missing keys last, then by the order of the join
+             records, entities and assets. Missing keys match each other, as they do in pandas.
+
+    Only the rows with an entity survive delete_nan_rows(), as 'vatCode' and 'taxCode' come from the entities.
+    So the join records are inner-joined with the entities and completed with the entities no join record
+    references, and the assets are left-joined, which gives the same rows as the two full outer joins.
+    """
+    sources = {column: SHARE_COLUMN if column == 'ownershipShare' else column for column in join_columns}
+    owned = ', '.join([f'j.{quote(sources[column])} AS {quote(column)}' for column in join_columns] +
+                      [f'e.{quote(column)}' for column in entity_columns] +
+                      ['j.rowid AS join_row', 'e.rowid AS entity_row'])
+    orphaned = ', '.join([('e.' + quote(column) if column == 'entity_id' else 'NULL') + f' AS {quote(column)}'
+                          for column in join_columns] +
+                         [f'e.{quote(column)}' for column in entity_columns] +
+                         ['NULL AS join_row', 'e.rowid AS entity_row'])
+    merged_columns = join_columns + entity_columns + asset_columns
+    selected = ', '.join([f'm.{quote(column)}' for column in join_columns + entity_columns] +
+                         [f'a.{quote(column)}' for column in asset_columns])
+    return (
+        f"INSERT INTO merged ({', '.join(map(quote, merged_columns))}) "
+        f"SELECT {selected} FROM ("
+        f"SELECT {owned} FROM join_records j JOIN entities e ON j.entity_id IS e.entity_id "
+        f"UNION ALL "
+        f"SELECT {orphaned} FROM entities e "
+        f"WHERE NOT EXISTS (SELECT 1 FROM join_records j WHERE j.entity_id IS e.entity_id)"
+        f") m LEFT JOIN assets a ON m.asset_id IS a.asset_id "
+        f"WHERE m.vatCode IS NOT NULL OR m.taxCode IS NOT NULL "
+        f"ORDER BY m.asset_id IS NULL, m.asset_id, m.entity_id IS NULL, m.entity_id, m.join_row, m.entity_row, "
+        f"a.rowid"
+    )
+
+
+def sql_transform(asset_chunks, entity_data, join_chunks, batch_size=10000, directory=None, rejections=None,
+                  report=None, join_options=None, stats=None):
+    """
+    Validate and transform chunked asset and join records out of core, in an SQLite database on disk.
+
+    Args:
+        asset_chunks (Iterable[pd.DataFrame]): Chunks of raw asset records.
+        entity_data (pd.DataFrame): The validated entity records.
+        join_chunks (Iterable[pd.DataFrame]): Chunks of raw join records.
+        batch_size (int): The number of transformed rows yielded at a time.
+        directory (str, optional): Directory for the temporary database. Defaults to a temporary directory.
+        rejections (dict, optional): Mapping of the validation rules to the number of rows they rejected,
+                                     updated in place as the chunks are validated.
+        report (list, optional): List the rejection reports are appended to (see app.rules.apply_rules).
+        join_options (dict, optional): The join options of transform_data. Only the 'outer' join is supported,
+                                       and 'max_rows' does not apply, as the join runs on disk.
+        stats (list, optional): List the per-city statistics of every batch are appended to (see
+                                app.transform.city_stats).
+
+    Returns:
+        Iterator[pd.DataFrame]: Yields the rows of transform_data, in the same order, with the same columns, in
+                                batches of about 'batch_size' rows holding all the rows of their assets. The
+                                rows of the entities owning no asset are split into batches of 'batch_size'.
+
+    The validated chunks are staged into tables as they are read, and the rows duplicated across chunks are
+    deleted there. The joins, the removal of the rows without a VAT or tax code, the deduplication, the filling
+    of the missing values and the 'cherry_asset_id' are then computed by set-based queries, whose sorts and
+    intermediate tables spill to disk, so memory only holds the entities and one batch. The inputs are expected
+    to be read with their declared schemas, so that every column but 'ownershipShare' is text.
+    """
+    join_options = join_options or {}
+    if join_options.get('how', 'outer') != 'outer':
+        raise ValueError("The SQLite transform only supports the 'outer' join.")
+
+    def prepare_join(chunk):
+        chunk = validate_join(chunk, rejections, report)
+        return chunk.assign(**{SHARE_COLUMN: convert_ownership_shares_to_float(chunk['ownershipShare'])})
+
+    with tempfile.TemporaryDirectory(dir=directory) as workdir:
+        connection = connect(os.path.join(workdir, DATABASE_FILE))
+        try:
+            entity_columns = stage(connection, 'entities', entity_data)
+            asset_columns = (stage_chunks(connection, 'assets', asset_chunks,
+                                          lambda chunk: validate_assets(chunk, rejections, report))
+                             or stage(connection, 'assets', pd.DataFrame(columns=['asset_id'])))
+            join_columns = (stage_chunks(connection, 'join_records', join_chunks, prepare_join)
+                            or stage(connection, 'join_records', pd.DataFrame(columns=['asset_id', 'entity_id'])))
+            remove_staged_duplicates(connection, 'assets', asset_columns, 'assets.duplicate', rejections, report)
+            remove_staged_duplicates(connection, 'join_records', join_columns, 'join.duplicate', rejections, report)
+            connection.execute('CREATE INDEX entities_entity_id ON entities (entity_id)')
+            connection.execute('CREATE INDEX join_records_entity_id ON join_records (entity_id)')
+            connection.execute('CREATE INDEX assets_asset_id ON assets (asset_id)')
+            if join_options.get('validate'):
+                check_unique(connection, 'entities', 'entity_id')
+                check_unique(connection, 'assets', 'asset_id')
+
+            join_columns = [column for column in join_columns if column != SHARE_COLUMN]
+            entity_columns = [column for column in entity_columns if column != 'entity_id']
+            asset_columns = [column for column in asset_columns if column != 'asset_id']
+            columns = join_columns + entity_columns + asset_columns
+            if len(set(columns)) != len(columns):
+                raise ValueError(f"The joined tables have overlapping columns: {columns}.")
+            connection.execute(f"CREATE TABLE merged (position INTEGER PRIMARY KEY, {', '.join(map(quote, columns))})")
+            connection.execute(merge_statement(join_columns, entity_columns, asset_columns))
+            connection.commit()
+
+            # Keep the first of the duplicated rows, fill the missing values and build the cherry_asset_id
+            cherry_asset_id = " || '-' || ".join(filled(quote(column)) for column in
+                                                  ['asset_id', 'cityCode', 'catasto', 'foglio', 'particella'])
+            cursor = connection.execute(
+                f"SELECT {', '.join(filled(quote(column)) for column in columns)}, {cherry_asset_id} FROM merged "
+                f"WHERE position IN (SELECT MIN(position) FROM merged GROUP BY {', '.join(map(quote, columns))}) "
+                f"ORDER BY position"
+            )
+            # The rows of an asset are contiguous, and are never split between two batches, so that every batch
+            # can be aggregated per asset on its own. The entities without assets come last, with an empty
+            # 'asset_id', and are batched like any other rows, since they are not aggregated.
+            key = columns.index('asset_id')
+            pending = []
+            while True:
+                fetched = cursor.fetchmany(batch_size)
+                rows = pending + fetched
+                if not rows:
+                    break
+                if fetched and rows[-1][key] != '':
+                    last = len(rows)
+                    while last > 0 and rows[last - 1][key] == rows[-1][key]:
+                        last -= 1
+                    if not last:
+                        pending = rows
+                        continue
+                    rows, pending = rows[:last], rows[last:]
+                else:
+                    pending = []
+                transformed = pd.DataFrame.from_records(rows, columns=columns + ['cherry_asset_id'])
+                transformed['ownerships'] = create_ownerships_column(transformed)
+                if stats is not None:
+                    stats.append(city_stats(transformed))
+                yield transformed
+        finally:
+            connection.close()
@@ -0,0 +1,124 @@
+import os
+import glob
+import tempfile
+import pandas as pd
+from app.rules import unique, apply_rules
+from app.transform import validate_assets, validate_join, transform_data
+
+
+def partition_ids(df, key, partitions):
+    """
+    Assign every row of a DataFrame to a hash partition based on a key column.
+
+    Args:
+    df (pd.DataFrame): The input DataFrame.
+    key (str): The column whose values decide the partition.
+    partitions (int): The number of partitions.
+
+    Returns:
+    np.ndarray: The partition number of every row, in row order.
+
+    Rows sharing the same key value always land in the same partition, whatever chunk they come from.
+    """
+    hashes = pd.util.hash_pandas_object(df[key], index=False).to_numpy()
+    return hashes % partitions
+
+
+def spill_partitions(chunks, key, partitions, spill_dir, prefix, prepare=None):
+    """
+    Split a stream of DataFrame chunks into hash partitions stored on disk.
+
+    Args:
+    chunks (Iterable[pd.DataFrame]): The input chunks.
+    key (str): The column used to partition the rows.
+    partitions (int): The number of partitions.
+    spill_dir (str): The directory where the partition files are written.
+    prefix (str): The file name prefix identifying the table.
+    prepare (callable, optional): Function applied to every chunk before it is partitioned.
+
+    Returns:
+    pd.DataFrame: An empty DataFrame with the columns and dtypes of the prepared chunks, or None if the stream was empty.
+
+    Only one chunk is held in memory at a time. Each chunk contributes one pickle file per non-empty partition,
+    which keeps the dtypes of the prepared chunk intact.
+    """
+    template = None
+    for number, chunk in enumerate(chunks):
+        if prepare is not None:
+            chunk = prepare(chunk)
+        template = chunk.iloc[:0]
+        for partition, part in chunk.groupby(partition_ids(chunk, key, partitions), sort=False):
+            part.to_pickle(os.path.join(spill_dir, f"{prefix}-{partition:05d}-{number:08d}.pkl"))
+    return template
+
+
+def read_partition(spill_dir, prefix, partition, template):
+    """
+    Read back all the spilled chunks of a single partition.
+
+    Args:
+    spill_dir (str): The directory holding the partition files.
+    prefix (str): The file name prefix identifying the table.
+    partition (int): The partition number.
+    template (pd.DataFrame): The empty DataFrame returned when the partition has no rows.
+
+    Returns:
+    pd.DataFrame: The rows of the partition, with the index labels of their chunks.
+    """
+    files = sorted(glob.glob(os.path.join(spill_dir, f"{prefix}-{partition:05d}-*.pkl")))
+    if not files:
+        return template if template is not None else pd.DataFrame()
+    return pd.concat([pd.read_pickle(file) for file in files])
+
+
+def stream_transform(asset_chunks, entity_data, join_chunks, partitions=16, spill_dir=None, rejections=None,
+                     report=None, join_options=None, stats=None):
+    """
+    Validate and transform chunked asset and join records with bounded memory.
+
+    Args:
+    asset_chunks (Iterable[pd.DataFrame]): Chunks of raw asset records.
+    entity_data (pd.DataFrame): The validated entity records, fully loaded as the lookup side.
+    join_chunks (Iterable[pd.DataFrame]): Chunks of raw join records.
+    partitions (int): The number of hash partitions on 'asset_id'.
+    spill_dir (str, optional): Directory for the temporary partition files. Defaults to a temporary directory.
+    rejections (dict, optional): Mapping of the validation rules to the number of rows they rejected,
+                                 updated in place as the chunks are validated.
+    report (list, optional): List the rejection reports of the chunks are appended to (see app.rules.apply_rules).
+    join_options (dict, optional): The join options of transform_data, applied to every partition: 'max_rows'
+                                   bounds the rows of a partition. Only the 'outer' join is supported.
+    stats (list, optional): List the per-city statistics of every partition are appended to (see
+                            app.transform.city_stats).
+
+    Returns:
+    Iterator[pd.DataFrame]: Yields transformed DataFrames, one per partition, with the same columns as transform_data.
+
+    Asset and join chunks are validated as they are read and spilled into partitions by 'asset_id', so every
+    asset meets all of its join rows in a single partition. Each partition is then transformed on its own
+    against the entities it references, which keeps peak memory at roughly one partition plus the entity table.
+    Entities that no join row references are emitted last, exactly as the full outer merge would produce them.
+    """
+    if (join_options or {}).get('how', 'outer') != 'outer':
+        raise ValueError("The streaming transform only supports the 'outer' join.")
+    with tempfile.TemporaryDirectory(dir=spill_dir) as workdir:
+        asset_template = spill_partitions(asset_chunks, 'asset_id', partitions, workdir, 'assets',
+                                          lambda chunk: validate_assets(chunk, rejections, report))
+        join_template = spill_partitions(join_chunks, 'asset_id', partitions, workdir, 'join',
+                                         lambda chunk: validate_join(chunk, rejections, report))
+
+        referenced = pd.Series(False, index=entity_data.index)
+        for partition in range(partitions):
+            # Rows duplicated across chunks are only found once their partition is read back
+            join_data = read_partition(workdir, 'join', partition, join_template)
+            join_data = apply_rules(join_data, [('join.duplicate', unique())], rejections, report)
+            if join_data.empty:
+                continue
+            asset_data = read_partition(workdir, 'assets', partition, asset_template)
+            asset_data = apply_rules(asset_data, [('assets.duplicate', unique())], rejections, report)
+            in_partition = entity_data['entity_id'].isin(join_data['entity_id'])
+            referenced |= in_partition
+            yield transform_data(asset_data, entity_data[in_partition], join_data, join_options, stats)
+
+        orphans = entity_data[~referenced]
+        if not orphans.empty:
+            yield transform_data(asset_template.copy(), orphans, join_template.copy(), join_options)
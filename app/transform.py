@@ -3,6 +3,8 @@ import numpy as np
 import re
 import ast
 import json
+from app.schema import is_categorical
+from app.rules import ASSET_RULES, ENTITY_RULES, JOIN_RULES, apply_rules
 
 def remove_invalid_records(df, required_fields):
     """
@@ -30,10 +32,12 @@ def remove_invalid_characters(df, columns):
 
     Returns:
     pd.DataFrame: DataFrame with records removed where specified columns contain non-alphanumeric characters.
+                  Missing values are not alphanumeric, so their records are removed as well.
     """
     for column in columns:
-        df[column] = df[column].astype(str)
-        df = df[df[column].str.match(r'^[a-zA-Z0-9]+$')]
+        if not pd.api.types.is_string_dtype(df[column]):
+            df[column] = df[column].astype(str)
+        df = df[df[column].str.match(r'^[a-zA-Z0-9]+$', na=False)]
     return df
 
 
@@ -47,6 +51,17 @@ def fill_missing_values(data):
     Returns:
     pd.DataFrame: The DataFrame with missing values filled with empty strings and 'NaN' and 'nan' replaced with blank.
     """
+    filled = {}
+    for column in data.columns:
+        if is_categorical(data[column]):
+            # Fill categorical columns through their categories, so they stay categorical
+            categories = data[column].cat.categories
+            series = data[column].cat.remove_categories(categories[categories.isin(['NaN', 'nan'])])
+            if '' not in series.cat.categories:
+                series = series.cat.add_categories([''])
+            filled[column] = series.fillna('')
+    if filled:
+        data = data.assign(**filled)
     processed_data = data.fillna('').replace(['NaN', 'nan'], '')
     return processed_data
 
@@ -98,66 +113,63 @@ def remove_duplicates(df):
     return df.drop_duplicates()
 
 
-def validate_assets(asset_data):
+def validate_assets(asset_data, rejections=None, report=None):
     """
     Perform data validation for asset records.
 
     Args:
     asset_data (pd.DataFrame): DataFrame containing asset records.
+    rejections (dict, optional): Mapping of the validation rules to the number of rows they rejected,
+                                 updated in place.
+    report (list, optional): List the rejection report of the records is appended to (see app.rules.apply_rules).
 
     Returns:
     pd.DataFrame: DataFrame with validated asset records.
 
     This function performs data validation for asset records by removing records 
-    with invalid characters in 'particella' and 'subalterno' fields and removing duplicate entries.
+    with invalid characters in 'particella' and 'subalterno' fields and removing duplicate entries,
+    as declared by app.rules.ASSET_RULES.
     """
-    # Remove records where particella and subalterno fields contain characters other than digits and letters
-    asset_data = remove_invalid_characters(asset_data, ['particella', 'subalterno'])
+    return apply_rules(asset_data, ASSET_RULES, rejections, report)
 
-    # Remove duplicate entries
-    asset_data = remove_duplicates(asset_data)
 
-    return asset_data
-
-
-def validate_entities(entity_data):
+def validate_entities(entity_data, rejections=None, report=None):
     """
     Perform data validation for entity records.
 
     Args:
     entity_data (pd.DataFrame): DataFrame containing entity records.
+    rejections (dict, optional): Mapping of the validation rules to the number of rows they rejected,
+                                 updated in place.
+    report (list, optional): List the rejection report of the records is appended to (see app.rules.apply_rules).
 
     Returns:
     pd.DataFrame: DataFrame with validated entity records.
 
     This function performs data validation for entity records by removing records with missing 'entity_id',
-    'vatCode', or 'taxCode', removing duplicate entries, and returning the cleaned DataFrame.
+    or with both 'vatCode' and 'taxCode' missing, and removing duplicate entries, as declared by
+    app.rules.ENTITY_RULES.
     """
-    entity_data = remove_invalid_records(entity_data, ['entity_id'])
-    entity_data = delete_nan_rows(entity_data, ['vatCode', 'taxCode'])
-    entity_data = remove_duplicates(entity_data)
+    return apply_rules(entity_data, ENTITY_RULES, rejections, report)
 
-    return entity_data
 
-
-def validate_join(join_data):
+def validate_join(join_data, rejections=None, report=None):
     """
     Perform data validation for join records.
 
     Args:
     join_data (pd.DataFrame): DataFrame containing join records.
+    rejections (dict, optional): Mapping of the validation rules to the number of rows they rejected,
+                                 updated in place.
+    report (list, optional): List the rejection report of the records is appended to (see app.rules.apply_rules).
 
     Returns:
     pd.DataFrame: DataFrame with validated join records.
 
     This function performs data validation for join records by removing records
-    with missing 'entity_id' or 'asset_id', removing duplicate entries, and returning the cleaned DataFrame.
+    with missing 'entity_id' or 'asset_id' and removing duplicate entries, as declared by app.rules.JOIN_RULES.
     """
-    required_fields = ['entity_id', 'asset_id']
-    join_data = remove_invalid_records(join_data, required_fields)
-    join_data = remove_duplicates(join_data)
-
-    return join_data
+    return apply_rules(join_data, JOIN_RULES, rejections, report)
 
 
 
@@ -195,7 +207,142 @@ def create_ownerships(row):
     return ownerships
 
 
-def merge_data(asset_data, entity_data, join_data):
+def create_cherry_asset_ids(df):
+    """
+    Create the unique identifiers (cherry_asset_id) of all the properties of a DataFrame at once.
+
+    Args:
+    df (pd.DataFrame): DataFrame containing the attributes of the properties.
+
+    Returns:
+    pd.Series: Series of identifiers, equal to applying create_cherry_asset_id to every row.
+    """
+    cherry_asset_ids = df['asset_id'].astype(str)
+    for column in ['cityCode', 'catasto', 'foglio', 'particella']:
+        cherry_asset_ids = cherry_asset_ids + '-' + df[column].astype(str)
+    return cherry_asset_ids
+
+
+def create_ownerships_column(df):
+    """
+    Create the ownership details of all the rows of a DataFrame at once.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing ownership information.
+
+    Returns:
+        pd.Series: Series of ownership dictionaries, equal to applying create_ownerships to every row.
+    """
+    ownerships = df[['entity_id', 'vatCode', 'taxCode', 'ownershipShare']].to_dict(orient='records')
+    return pd.Series(ownerships, index=df.index, dtype=object)
+
+
+class JoinCardinalityError(ValueError):
+    """
+    Raised by merge_data when a join would exceed its expected cardinality: a lookup key is repeated on the
+    side that must be unique, or the join would produce more rows than allowed.
+    """
+
+
+# Join types accepted by merge_data
+JOIN_TYPES = ['outer', 'inner', 'left', 'right']
+
+
+def encode_keys(left, right, key):
+    """
+    Encode the join keys of both sides of a join as integers.
+
+    Args:
+        left (pd.DataFrame): The left side of the join.
+        right (pd.DataFrame): The right side of the join.
+        key (str): The join column.
+
+    Returns:
+        tuple: The integer codes of the left keys and of the right keys, and the distinct key values. The codes
+               follow the sorted order of the values, and missing keys share the last code, so that sorting the
+               codes sorts the keys like pandas does.
+    """
+    values = pd.concat([left[key], right[key]], ignore_index=True)
+    codes, uniques = pd.factorize(values, sort=True)
+    codes = np.where(codes < 0, len(uniques), codes)
+    return codes[:len(left)], codes[len(left):], pd.Index(uniques).astype(values.dtype)
+
+
+def decode_keys(codes, uniques):
+    """
+    Decode integer join keys back into their values.
+
+    Args:
+        codes (np.ndarray): The codes returned by encode_keys.
+        uniques (pd.Index): The distinct key values returned by encode_keys.
+
+    Returns:
+        pd.api.extensions.ExtensionArray: The key values, with the dtype of the keys and NaN for the missing keys.
+    """
+    missing = codes >= len(uniques)
+    if not len(uniques):
+        return pd.Series(np.nan, index=range(len(codes)), dtype=uniques.dtype).array
+    return pd.Series(uniques.take(np.where(missing, 0, codes))).where(~missing).array
+
+
+def estimate_join_size(left_codes, right_codes, how='outer'):
+    """
+    Compute the number of rows a join produces, from the multiplicity of its keys, before running it.
+
+    Args:
+        left_codes (np.ndarray): The integer keys of the left side (see encode_keys).
+        right_codes (np.ndarray): The integer keys of the right side.
+        how (str): The join type, one of JOIN_TYPES.
+
+    Returns:
+        int: The number of rows of the join: the matched pairs of every key, plus the unmatched rows kept by
+             the join type.
+    """
+    size = max(int(left_codes.max(initial=-1)), int(right_codes.max(initial=-1))) + 1
+    left_counts = np.bincount(left_codes, minlength=size)
+    right_counts = np.bincount(right_codes, minlength=size)
+    rows = int(np.dot(left_counts, right_counts))
+    if how in ('outer', 'left'):
+        rows += int(left_counts[right_counts == 0].sum())
+    if how in ('outer', 'right'):
+        rows += int(right_counts[left_counts == 0].sum())
+    return rows
+
+
+def guarded_merge(left, right, key, how='outer', unique_right=False, max_rows=None):
+    """
+    Join two DataFrames on integer-encoded keys, after checking the size of the join.
+
+    Args:
+        left (pd.DataFrame): The left side of the join.
+        right (pd.DataFrame): The right side of the join.
+        key (str): The join column.
+        how (str): The join type, one of JOIN_TYPES.
+        unique_right (bool): Whether every key must appear at most once on the right side (many-to-one).
+        max_rows (int, optional): The largest number of rows the join may produce.
+
+    Returns:
+        pd.DataFrame: The same rows, in the same order, as pd.merge(left, right, on=key, how=how).
+
+    Raises:
+        JoinCardinalityError: If a right key is repeated while unique_right is set, or if the join would
+                              produce more than max_rows rows. Nothing is joined in that case.
+    """
+    left_codes, right_codes, uniques = encode_keys(left, right, key)
+    if unique_right:
+        repeated = np.bincount(right_codes) > 1
+        if repeated.any():
+            raise JoinCardinalityError(f"'{key}' is not unique on the right side of the join: "
+                                       f"{int(repeated.sum())} key(s) repeated.")
+    rows = estimate_join_size(left_codes, right_codes, how)
+    if max_rows is not None and rows > max_rows:
+        raise JoinCardinalityError(f"The join on '{key}' would produce {rows} rows, more than {max_rows}.")
+    merged = pd.merge(left.assign(**{key: left_codes}), right.assign(**{key: right_codes}), on=key, how=how)
+    merged[key] = decode_keys(merged[key].to_numpy(), uniques)
+    return merged
+
+
+def merge_data(asset_data, entity_data, join_data, how='outer', validate=False, max_rows=None):
     """
     Merge asset, entity, and join data into a single DataFrame.
 
@@ -203,13 +350,22 @@ def merge_data(asset_data, entity_data, join_data):
         asset_data (pd.DataFrame): DataFrame containing asset records.
         entity_data (pd.DataFrame): DataFrame containing entity records.
         join_data (pd.DataFrame): DataFrame containing join information.
+        how (str): The type of both joins, one of JOIN_TYPES. Defaults to 'outer'.
+        validate (bool): Whether every 'entity_id' and 'asset_id' must appear once in the entities and assets
+                         (join records many-to-one with both).
+        max_rows (int, optional): The largest number of rows each join may produce.
 
     Returns:
         pd.DataFrame: Merged DataFrame containing all data.
+
+    Raises:
+        JoinCardinalityError: If a join exceeds its expected cardinality (see guarded_merge).
     """
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Unknown join type '{how}', expected one of {JOIN_TYPES}.")
     # Merge asset, entity, and join data based on common columns
-    merged_data = pd.merge(join_data, entity_data, on='entity_id', how='outer')
-    merged_data = pd.merge(merged_data, asset_data, on='asset_id', how='outer')
+    merged_data = guarded_merge(join_data, entity_data, 'entity_id', how, validate, max_rows)
+    merged_data = guarded_merge(merged_data, asset_data, 'asset_id', how, validate, max_rows)
     return merged_data
 
 
@@ -242,7 +398,38 @@ def convert_ownership_share_to_float(ownership_share):
 
 
 
-def transform_data(asset_data, entity_data, join_data):
+def convert_ownership_shares_to_float(ownership_shares):
+    """
+    Convert a whole column of ownership share values to floating-point numbers.
+
+    Args:
+        ownership_shares (pd.Series): The ownership share values to be converted.
+
+    Returns:
+        pd.Series: Series of floats, rounded to 2 decimal places for fractions, with None where a value cannot be
+                   converted. Fractions are split and divided column-wise instead of value by value.
+
+    This is the vectorized equivalent of applying convert_ownership_share_to_float to every value. Malformed
+    fractions (more than one '/') and divisions by zero are treated as values that cannot be converted.
+    """
+    shares = ownership_shares.astype(object)
+    shares = shares.where(shares.isna(), shares.astype(str))
+    is_fraction = shares.str.contains('/', regex=False, na=False)
+    values = pd.to_numeric(shares.where(~is_fraction).str.strip(), errors='coerce').astype(float)
+
+    if is_fraction.any():
+        parts = shares[is_fraction].str.split('/', expand=True)
+        numerator = pd.to_numeric(parts[0].str.strip(), errors='coerce')
+        denominator = pd.to_numeric(parts[1].str.strip(), errors='coerce')
+        fractions = (numerator / denominator.where(denominator != 0)).round(2)
+        if parts.shape[1] > 2:
+            fractions = fractions.where(parts[2].isna())
+        values[is_fraction] = fractions
+
+    return values.astype(object).where(values.notna(), None)
+
+
+def transform_data(asset_data, entity_data, join_data, join_options=None, stats=None):
     """
     Transform the input data to meet specified requirements.
 
@@ -250,6 +437,8 @@ def transform_data(asset_data, entity_data, join_data):
         asset_data (pd.DataFrame): DataFrame containing asset data.
         entity_data (pd.DataFrame): DataFrame containing entity data.
         join_data (pd.DataFrame): DataFrame containing join data.
+        join_options (dict, optional): The 'how', 'validate' and 'max_rows' arguments of merge_data.
+        stats (list, optional): List the per-city statistics of the merged rows are appended to (see city_stats).
 
     Returns:
         pd.DataFrame: Transformed DataFrame.
@@ -258,22 +447,111 @@ def transform_data(asset_data, entity_data, join_data):
     1. Converts the 'ownershipShare' column in 'join_data' to float values.
     2. Merges 'asset_data', 'entity_data', and 'join_data' DataFrames.
     3. Deletes rows with NaN values in 'vatCode' and 'taxCode' columns.
-    4. Removes duplicate entries.
+    4. Removes duplicate entries, and computes the per-city statistics of the remaining rows if requested.
     5. Fills missing values with empty strings.
     6. Converts the 'foglio' column to string data type.
     7. Creates a new field 'cherry_asset_id' based on certain columns.
     8. Creates a new field 'ownerships' based on certain columns.
     """
-    join_data['ownershipShare'] = join_data['ownershipShare'].apply(convert_ownership_share_to_float)
+    join_data['ownershipShare'] = convert_ownership_shares_to_float(join_data['ownershipShare'])
 
-    merged_data = merge_data(asset_data, entity_data, join_data)
+    merged_data = merge_data(asset_data, entity_data, join_data, **(join_options or {}))
     merged_data = delete_nan_rows(merged_data, ['vatCode', 'taxCode'])
     merged_data = remove_duplicates(merged_data)
+    if stats is not None:
+        stats.append(city_stats(merged_data))
     merged_data = fill_missing_values(merged_data)
     merged_data['foglio'] = merged_data['foglio'].astype(str)
-    merged_data['cherry_asset_id'] = merged_data.apply(create_cherry_asset_id, axis=1)
-    merged_data['ownerships'] = merged_data.apply(create_ownerships, axis=1)
-    merged_data['ownerships'] = merged_data['ownerships'].apply(lambda x: eval(x) if isinstance(x, str) else x)
-    
+    merged_data['cherry_asset_id'] = create_cherry_asset_ids(merged_data)
+    merged_data['ownerships'] = create_ownerships_column(merged_data)
+
     return merged_data
 
+
+def aggregate_ownerships(df):
+    """
+    Aggregate the ownerships of every asset into a single row.
+
+    Args:
+        df (pd.DataFrame): Transformed DataFrame with one row per (asset, owner) pair.
+
+    Returns:
+        pd.DataFrame: DataFrame with one row per asset, where 'ownerships' is the list of the owner dictionaries.
+
+    The rows are grouped on 'cherry_asset_id' together with the other asset fields, so that no asset attribute
+    is lost, and the groups keep the order in which the assets first appear. The rows of the entities owning no
+    asset are left out: they describe no asset, and their empty asset fields would group every one of them
+    into a single, ever growing row.
+    """
+    asset_columns = ['cherry_asset_id', 'cityCode', 'catasto', 'sezione', 'foglio', 'particella', 'subalterno']
+    owned = df[df['asset_id'].fillna('') != '']
+    grouped = owned.groupby(asset_columns, sort=False, dropna=False, observed=True)['ownerships'].agg(list)
+    return grouped.reset_index()
+
+
+# Columns the per-city statistics are broken down by
+STATS_KEYS = ['cityCode', 'catasto']
+
+
+def stats_text(series):
+    """
+    Returns:
+    pd.Series: The values of a column as text, with the missing values, 'NaN' and 'nan' as empty strings, as
+               fill_missing_values writes them.
+    """
+    return series.astype(object).where(series.notna(), '').astype(str).replace(['NaN', 'nan'], '')
+
+
+def city_stats(df):
+    """
+    Compute the partial per-city statistics of merged rows.
+
+    Args:
+    df (pd.DataFrame): Rows holding one (asset, owner) pair each, before or after fill_missing_values.
+
+    Returns:
+    dict: 'assets', the number of distinct 'assets' and the total 'ownershipShare' of every ('cityCode', 'catasto'),
+          and 'owners', the distinct ('cityCode', 'catasto', 'entity_id') triples. Rows without a city, such as the
+          entities owning no asset, are not counted.
+
+    The partial statistics of row sets that never share an asset, such as the partitions of the streaming and
+    parallel transforms, are combined by city_statistics.
+    """
+    rows = pd.DataFrame({column: stats_text(df[column]) for column in STATS_KEYS + ['asset_id', 'entity_id']})
+    rows['ownershipShare'] = pd.to_numeric(df['ownershipShare'].astype(object), errors='coerce').to_numpy()
+    rows = rows[rows['cityCode'] != '']
+    grouped = rows.groupby(STATS_KEYS)
+    assets = pd.DataFrame({'assets': grouped['asset_id'].nunique(), 'ownershipShare': grouped['ownershipShare'].sum()})
+    owners = rows.loc[rows['entity_id'] != '', STATS_KEYS + ['entity_id']].drop_duplicates()
+    return {'assets': assets, 'owners': owners}
+
+
+def city_statistics(stats):
+    """
+    Combine partial per-city statistics into the documents of the statistics collection.
+
+    Args:
+    stats (list): The partial statistics appended by transform_data (see city_stats).
+
+    Returns:
+    list: One document per city, in city code order, with the city code as '_id', its number of 'assets',
+          of distinct 'owners' and its total 'ownershipShare', and the same figures for every 'catasto'.
+    """
+    if not stats:
+        return []
+    assets = pd.concat([part['assets'] for part in stats]).groupby(level=STATS_KEYS).sum()
+    owners = pd.concat([part['owners'] for part in stats]).drop_duplicates()
+    by_catasto = assets.join(owners.groupby(STATS_KEYS).size().rename('owners'))
+    by_city = assets.groupby(level='cityCode').sum().join(
+        owners.drop_duplicates(['cityCode', 'entity_id']).groupby('cityCode').size().rename('owners'))
+
+    def figures(row):
+        return {'assets': int(row.assets), 'owners': int(row.owners) if pd.notna(row.owners) else 0,
+                'ownershipShare': round(float(row.ownershipShare), 2)}
+
+    breakdown = {}
+    for row in by_catasto.itertuples():
+        city, catasto = row.Index
+        breakdown.setdefault(city, []).append({'catasto': catasto, **figures(row)})
+    return [{'_id': row.Index, 'cityCode': row.Index, **figures(row), 'catasto': breakdown[row.Index]}
+            for row in by_city.itertuples()]
@@ -0,0 +1,217 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# File names of the generated inputs, the same as the files read by the pipeline
+ASSET_FILE = 'data engineer 2023 - input - assets.csv'
+ENTITY_FILE = 'data engineer 2023 - input - entities.csv'
+JOIN_FILE = 'data engineer 2023 - input - assets_entities_join.csv'
+
+# Number of rows generated and written at a time, which bounds the memory used by the generator
+BLOCK_SIZE = 500000
+
+# Probability of an asset having 1, 2, 3, ... owners
+OWNER_COUNTS = [1, 2, 3, 4, 5, 8]
+OWNER_WEIGHTS = [0.62, 0.22, 0.08, 0.04, 0.03, 0.01]
+
+# Ownership shares of an asset with a given number of owners, and the invalid shares found in the real data
+SHARES = {1: ['1', '1/1', '1000/1000'], 2: ['1/2', '500/1000'], 3: ['1/3', '333/1000'], 4: ['1/4', '250/1000'],
+          5: ['1/5', '0.2'], 8: ['1/8', '125/1000']}
+INVALID_SHARES = ['', 'abc', '1/0', '1/2/3', 'n.d.']
+
+# Values of 'subalterno' and 'particella' rejected by validate_assets
+INVALID_CODES = ['1,2,3', '-', 'da 4 a 6', '12/a', '']
+
+
+def city_codes(count, rng):
+    """
+    Generate cadastral city codes: one letter and three digits, e.g. 'A024'.
+
+    Args:
+        count (int): The number of distinct codes.
+        rng (np.random.Generator): The random generator.
+
+    Returns:
+        np.ndarray: The codes.
+    """
+    letters = rng.choice(list('ABCDEFGHILM'), count)
+    numbers = rng.choice(1000, count, replace=False) if count <= 1000 else rng.integers(0, 1000, count)
+    return np.char.add(letters.astype(str), np.char.zfill(numbers.astype(str), 3))
+
+
+def with_invalid(values, rate, invalid, rng):
+    """
+    Replace a fraction of the values with invalid ones.
+
+    Args:
+        values (np.ndarray): The values, as strings.
+        rate (float): The fraction of values to replace.
+        invalid (list): The invalid values to choose from.
+        rng (np.random.Generator): The random generator.
+
+    Returns:
+        np.ndarray: The values.
+    """
+    values = values.astype(object)
+    mask = rng.random(len(values)) < rate
+    values[mask] = rng.choice(invalid, mask.sum())
+    return values
+
+
+def with_duplicates(df, rate, rng):
+    """
+    Append copies of a fraction of the rows of a block, shuffled in.
+
+    Args:
+        df (pd.DataFrame): The block of rows.
+        rate (float): The fraction of rows duplicated.
+        rng (np.random.Generator): The random generator.
+
+    Returns:
+        pd.DataFrame: The block with its duplicated rows.
+    """
+    duplicates = df.sample(frac=rate, random_state=rng) if rate else df.iloc[:0]
+    df = pd.concat([df, duplicates])
+    return df.iloc[rng.permutation(len(df))]
+
+
+def asset_block(start, stop, cities, rng, invalid_rate, duplicate_rate):
+    """
+    Generate the assets a_<start+1> to a_<stop>.
+
+    Returns:
+        pd.DataFrame: The asset rows, in the column order of the assets file.
+    """
+    count = stop - start
+    subalterno = rng.integers(1, 200, count).astype(str)
+    subalterno = np.where(rng.random(count) < 0.1, '', subalterno)
+    df = pd.DataFrame({
+        'asset_id': np.char.add('a_', np.arange(start + 1, stop + 1).astype(str)),
+        'cityCode': rng.choice(cities, count),
+        'catasto': np.where(rng.random(count) < 0.9, 'F', 'T'),
+        'sezione': np.where(rng.random(count) < 0.95, '', rng.choice(['A', 'B', 'Q'], count)),
+        'foglio': np.where(rng.random(count) < 0.01, '', rng.integers(1, 1000, count).astype(str)),
+        'particella': with_invalid(rng.integers(1, 10000, count).astype(str), invalid_rate / 4, INVALID_CODES, rng),
+        'subalterno': with_invalid(subalterno, invalid_rate, INVALID_CODES, rng),
+    })
+    return with_duplicates(df, duplicate_rate, rng)
+
+
+def entity_block(start, stop, rng, duplicate_rate):
+    """
+    Generate the entities e_<start+1> to e_<stop>: people with a tax code and companies with a VAT code.
+
+    Returns:
+        pd.DataFrame: The entity rows, in the column order of the entities file.
+    """
+    count = stop - start
+    letters = rng.choice(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'), (count, 6))
+    tax_codes = np.char.add(np.char.add(letters.view('<U6').ravel(), rng.integers(10, 99, count).astype(str)),
+                            rng.choice(list('ABCDEHLMPRST'), count))
+    tax_codes = np.char.add(tax_codes, np.char.zfill(rng.integers(0, 10 ** 7, count).astype(str), 7))
+    vat_codes = np.char.zfill(rng.integers(0, 10 ** 11, count).astype(str), 11)
+    kind = rng.random(count)
+    df = pd.DataFrame({
+        'entity_id': np.char.add('e_', np.arange(start + 1, stop + 1).astype(str)),
+        'taxCode': np.where(kind < 0.8, tax_codes, ''),
+        'vatCode': np.where((kind >= 0.8) & (kind < 0.99), vat_codes, ''),
+    })
+    return with_duplicates(df, duplicate_rate, rng)
+
+
+def join_block(start, stop, entities, rng, invalid_rate, duplicate_rate):
+    """
+    Generate the owners of the assets a_<start+1> to a_<stop>.
+
+    Returns:
+        pd.DataFrame: The join rows, in the column order of the join file. A few rows reference missing assets
+                      or entities, or have an invalid ownership share.
+    """
+    owners = rng.choice(OWNER_COUNTS, stop - start, p=OWNER_WEIGHTS)
+    asset_numbers = np.repeat(np.arange(start + 1, stop + 1), owners)
+    owner_counts = np.repeat(owners, owners)
+    count = len(asset_numbers)
+    shares = np.empty(count, dtype=object)
+    for owner_count, choices in SHARES.items():
+        mask = owner_counts == owner_count
+        shares[mask] = rng.choice(choices, mask.sum())
+    asset_ids = np.char.add('a_', asset_numbers.astype(str)).astype(object)
+    entity_ids = np.char.add('e_', rng.integers(1, entities + 1, count).astype(str)).astype(object)
+    dangling = rng.random(count) < invalid_rate / 4
+    asset_ids[dangling & (rng.random(count) < 0.5)] = ''
+    entity_ids[dangling & (rng.random(count) < 0.5)] = 'e_0'
+    df = pd.DataFrame({
+        'asset_id': asset_ids,
+        'entity_id': entity_ids,
+        'ownershipShare': with_invalid(shares, invalid_rate / 4, INVALID_SHARES, rng),
+    })
+    return with_duplicates(df, duplicate_rate, rng)
+
+
+def write_blocks(file_path, total, make_block):
+    """
+    Write a CSV file block by block.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        total (int): The number of generated rows, before duplicates.
+        make_block (callable): Function called with (start, stop) returning the DataFrame of a block.
+
+    Returns:
+        int: The number of rows written.
+    """
+    written = 0
+    for start in range(0, total, BLOCK_SIZE):
+        block = make_block(start, min(start + BLOCK_SIZE, total))
+        block.to_csv(file_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+        written += len(block)
+    return written
+
+
+def generate_dataset(directory, assets, entity_ratio=0.6, cities=8000, invalid_rate=0.02, duplicate_rate=0.01,
+                     seed=0):
+    """
+    Generate synthetic assets, entities and join files shaped like the real inputs.
+
+    Args:
+        directory (str): The directory the three CSV files are written to, created if needed.
+        assets (int): The number of assets. The join file has about 1.7 rows per asset.
+        entity_ratio (float): The number of entities per asset.
+        cities (int): The number of distinct city codes.
+        invalid_rate (float): The fraction of rows with a value rejected by the validation.
+        duplicate_rate (float): The fraction of rows written twice.
+        seed (int): The seed of the random generator, so a dataset can be generated again identically.
+
+    Returns:
+        dict: The number of rows written to every file, keyed by 'assets', 'entities' and 'join'.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    entities = max(1, int(assets * entity_ratio))
+    codes = city_codes(cities, rng)
+    return {
+        'assets': write_blocks(os.path.join(directory, ASSET_FILE), assets,
+                               lambda start, stop: asset_block(start, stop, codes, rng, invalid_rate, duplicate_rate)),
+        'entities': write_blocks(os.path.join(directory, ENTITY_FILE), entities,
+                                 lambda start, stop: entity_block(start, stop, rng, duplicate_rate)),
+        'join': write_blocks(os.path.join(directory, JOIN_FILE), assets,
+                             lambda start, stop: join_block(start, stop, entities, rng, invalid_rate, duplicate_rate)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic ETL input files.')
+    parser.add_argument('directory', help='Directory the CSV files are written to.')
+    parser.add_argument('--assets', type=int, default=10000, help='Number of assets (default 10000).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default 0).')
+    parser.add_argument('--invalid-rate', type=float, default=0.02, help='Fraction of invalid rows (default 0.02).')
+    parser.add_argument('--duplicate-rate', type=float, default=0.01, help='Fraction of duplicated rows (default 0.01).')
+    args = parser.parse_args(argv)
+    counts = generate_dataset(args.directory, args.assets, invalid_rate=args.invalid_rate,
+                              duplicate_rate=args.duplicate_rate, seed=args.seed)
+    print(f"Generated {counts} rows in {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
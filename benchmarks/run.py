@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from app.extract import extract_data
+from app.schema import ASSET_SCHEMA, ENTITY_SCHEMA, JOIN_SCHEMA
+from app.load import convert_df_to_json, insert_records
+from app.transform import validate_assets, validate_entities, validate_join, merge_data, transform_data
+from benchmarks.generate import ASSET_FILE, ENTITY_FILE, JOIN_FILE, generate_dataset
+
+# Baseline results committed with the benchmarks
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+@contextmanager
+def measured_stage(results, name, trace_memory=True):
+    """
+    Measure the wall time and the peak memory allocated during a benchmark stage.
+
+    Args:
+        results (dict): Mapping of the stage names to their measures, updated in place.
+        name (str): The name of the stage.
+        trace_memory (bool): Whether to measure the peak memory with tracemalloc, which slows the stage down.
+
+    'peak_mb' is the largest amount of memory allocated through Python on top of what was allocated when the
+    stage started, which does not include the Arrow buffers. 'max_rss_mb' is the peak resident memory of the
+    process so far, so it only grows when a stage needs more memory than all the previous ones.
+    """
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[name] = {'seconds': round(time.perf_counter() - start, 4)}
+        if trace_memory:
+            results[name]['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - before) / 1e6, 2)
+            tracemalloc.stop()
+        results[name]['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+
+def create_sink(uri=None):
+    """
+    Create the MongoDB collection the records are inserted into.
+
+    Args:
+        uri (str, optional): URI of a MongoDB server, e.g. a local mongod. An in-memory mongomock collection
+                             is used when omitted.
+
+    Returns:
+        The collection, emptied.
+    """
+    if uri:
+        from pymongo import MongoClient
+        collection = MongoClient(uri)['etl_benchmark']['assets']
+    else:
+        import mongomock
+        collection = mongomock.MongoClient()['etl_benchmark']['assets']
+    collection.delete_many({})
+    return collection
+
+
+def run_benchmark(directory, uri=None, engine=None, trace_memory=True):
+    """
+    Run every stage of the pipeline once on the files of a directory.
+
+    Args:
+        directory (str): The directory holding the assets, entities and join files.
+        uri (str, optional): URI of the MongoDB server of the insert stage. Defaults to mongomock.
+        engine (str, optional): The CSV parser, 'pyarrow' (default) or 'c'.
+        trace_memory (bool): Whether to measure the peak memory of every stage.
+
+    Returns:
+        dict: The 'seconds', 'peak_mb' and 'max_rss_mb' of every stage, and the number of 'rows' read and written.
+    """
+    stages, rows = {}, {}
+    with measured_stage(stages, 'extract', trace_memory):
+        assets = extract_data(os.path.join(directory, ASSET_FILE), schema=ASSET_SCHEMA, engine=engine)
+        entities = extract_data(os.path.join(directory, ENTITY_FILE), schema=ENTITY_SCHEMA, engine=engine)
+        join = extract_data(os.path.join(directory, JOIN_FILE), schema=JOIN_SCHEMA, engine=engine)
+    rows['input'] = len(assets) + len(entities) + len(join)
+
+    with measured_stage(stages, 'validate', trace_memory):
+        assets = validate_assets(assets)
+        entities = validate_entities(entities)
+        join = validate_join(join)
+    rows['valid'] = len(assets) + len(entities) + len(join)
+
+    with measured_stage(stages, 'merge', trace_memory):
+        rows['merged'] = len(merge_data(assets, entities, join))
+
+    with measured_stage(stages, 'transform', trace_memory):
+        transformed = transform_data(assets, entities, join)
+    rows['transformed'] = len(transformed)
+
+    with measured_stage(stages, 'convert', trace_memory):
+        records = convert_df_to_json(transformed)
+    del transformed
+
+    collection = create_sink(uri)
+    with measured_stage(stages, 'insert', trace_memory):
+        rows['inserted'] = insert_records(collection, records)['inserted']
+    collection.drop()
+
+    stages['total'] = {'seconds': round(sum(stage['seconds'] for stage in stages.values()), 4)}
+    return {'stages': stages, 'rows': rows}
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.05):
+    """
+    Compare benchmark results with a baseline.
+
+    Args:
+        results (dict): The results of run_benchmark.
+        baseline (dict): The baseline results of the same dataset size.
+        tolerance (float): The relative increase of a measure above which it is reported as a regression.
+        min_seconds (float): Stages faster than this in the baseline are not compared on time, as their
+                             timings are mostly noise.
+
+    Returns:
+        list: One message per regression. Empty if no measure regressed.
+    """
+    regressions = []
+    for name, measures in baseline['stages'].items():
+        current = results['stages'].get(name)
+        if current is None:
+            continue
+        for measure, expected in measures.items():
+            if measure not in current or (measure == 'seconds' and expected < min_seconds):
+                continue
+            if current[measure] > expected * (1 + tolerance):
+                regressions.append(f"{name} {measure}: {current[measure]} > {expected} (+{tolerance:.0%})")
+    if results['rows'] != baseline['rows']:
+        regressions.append(f"rows: {results['rows']} != {baseline['rows']}")
+    return regressions
+
+
+def read_baseline(file_path=BASELINE_FILE):
+    """
+    Returns:
+        dict: The baseline results, keyed by the number of generated assets as a string.
+    """
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path) as file:
+        return json.load(file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the ETL stages on synthetic data.')
+    parser.add_argument('--assets', type=int, nargs='+', default=[10000],
+                        help='Numbers of generated assets, from 10000 to 10000000 (default 10000).')
+    parser.add_argument('--uri', help='URI of a MongoDB server for the insert stage (default: mongomock).')
+    parser.add_argument('--engine', choices=['pyarrow', 'c'], help='CSV parser (default pyarrow).')
+    parser.add_argument('--no-memory', action='store_true', help='Do not measure the peak memory (faster).')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression (default 0.25).')
+    parser.add_argument('--update-baseline', action='store_true', help='Store the results as the new baseline.')
+    args = parser.parse_args(argv)
+
+    baseline = read_baseline()
+    regressions = []
+    for assets in args.assets:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_dataset(directory, assets)
+            results = run_benchmark(directory, args.uri, args.engine, not args.no_memory)
+        print(f"{assets} assets: {results['rows']}")
+        for name, measures in results['stages'].items():
+            print(f"  {name:<10} {measures['seconds']:>10.3f}s" +
+                  (f" {measures['peak_mb']:>10.1f}MB" if 'peak_mb' in measures else '') +
+                  (f" {measures['max_rss_mb']:>10.1f}MB RSS" if 'max_rss_mb' in measures else ''))
+        if args.update_baseline:
+            baseline[str(assets)] = results
+        elif str(assets) in baseline:
+            found = compare(results, baseline[str(assets)], args.tolerance)
+            regressions += [f"{assets} assets: {regression}" for regression in found]
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, 'w') as file:
+            json.dump(baseline, file, indent=4)
+        print(f"Baseline written to {BASELINE_FILE}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from benchmarks.generate import ASSET_FILE, ENTITY_FILE, JOIN_FILE, generate_dataset
+from benchmarks.run import compare
+
+
+class TestGenerateDataset(unittest.TestCase):
+    """Unit tests for the synthetic data generator."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, file_name):
+        return pd.read_csv(os.path.join(self.directory, file_name), dtype=str)
+
+    def test_files_have_the_input_columns(self):
+        """Test that the generated files have the columns of the real inputs."""
+        generate_dataset(self.directory, 1000)
+        for file_name in [ASSET_FILE, ENTITY_FILE, JOIN_FILE]:
+            expected = pd.read_csv(os.path.join('dataset', file_name), nrows=0).columns
+            self.assertEqual(list(self.read(file_name).columns), list(expected))
+
+    def test_dataset_is_realistic(self):
+        """Test that the data has duplicates, invalid values and assets with several owners."""
+        counts = generate_dataset(self.directory, 2000, invalid_rate=0.05, duplicate_rate=0.05)
+        assets, join = self.read(ASSET_FILE), self.read(JOIN_FILE)
+        self.assertEqual(counts['assets'], len(assets))
+        self.assertTrue(assets.duplicated().any())
+        self.assertFalse(assets['subalterno'].dropna().str.match(r'^[a-zA-Z0-9]+$').all())
+        self.assertGreater(join.groupby('asset_id').size().max(), 1)
+
+    def test_same_seed_same_dataset(self):
+        """Test that a dataset can be generated again identically."""
+        generate_dataset(self.directory, 500, seed=3)
+        first = self.read(JOIN_FILE)
+        generate_dataset(self.directory, 500, seed=3)
+        pd.testing.assert_frame_equal(self.read(JOIN_FILE), first)
+
+    def test_run_benchmark(self):
+        """Test that every stage is measured and every transformed record is inserted."""
+        from benchmarks.run import run_benchmark
+        generate_dataset(self.directory, 500)
+        results = run_benchmark(self.directory)
+        self.assertEqual(list(results['stages']),
+                         ['extract', 'validate', 'merge', 'transform', 'convert', 'insert', 'total'])
+        self.assertIn('peak_mb', results['stages']['transform'])
+        self.assertEqual(results['rows']['inserted'], results['rows']['transformed'])
+
+
+class TestCompare(unittest.TestCase):
+    """Unit tests for the comparison with the baseline."""
+
+    baseline = {'stages': {'transform': {'seconds': 1.0, 'peak_mb': 10.0}, 'extract': {'seconds': 0.01}},
+                'rows': {'input': 10}}
+
+    def test_within_tolerance(self):
+        """Test that small variations are not reported."""
+        results = {'stages': {'transform': {'seconds': 1.2, 'peak_mb': 10.0}, 'extract': {'seconds': 0.04}},
+                   'rows': {'input': 10}}
+        self.assertEqual(compare(results, self.baseline), [])
+
+    def test_regressions(self):
+        """Test that slower stages, larger peaks and different row counts are reported."""
+        results = {'stages': {'transform': {'seconds': 1.5, 'peak_mb': 20.0}, 'extract': {'seconds': 0.01}},
+                   'rows': {'input': 9}}
+        self.assertEqual(len(compare(results, self.baseline)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
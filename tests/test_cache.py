@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import patch
+from app.cache import ResponseCache, CachedResponse
+
+
+def make_response(content='[]'):
+    """Build a cached JSON response."""
+    return CachedResponse(200, content, 'application/json', {})
+
+
+class TestResponseCache(unittest.TestCase):
+    """Unit tests for the response cache."""
+
+    def test_hit_and_miss(self):
+        """Test that a stored response is returned and counted as a hit."""
+        cache = ResponseCache(maxsize=2)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', make_response())
+        self.assertEqual(cache.get('a'), make_response())
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the cache keeps at most 'maxsize' responses, dropping the least recently used."""
+        cache = ResponseCache(maxsize=2)
+        cache.put('a', make_response('a'))
+        cache.put('b', make_response('b'))
+        cache.get('a')
+        cache.put('c', make_response('c'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a').content, 'a')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        """Test that responses expire after the time to live."""
+        cache = ResponseCache(maxsize=2, ttl=10)
+        with patch('app.cache.time.monotonic', return_value=100.0):
+            cache.put('a', make_response())
+        with patch('app.cache.time.monotonic', return_value=105.0):
+            self.assertIsNotNone(cache.get('a'))
+        with patch('app.cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_invalidate_refuses_previous_generation(self):
+        """Test that invalidation empties the cache and refuses responses computed before it."""
+        cache = ResponseCache(maxsize=2)
+        generation = cache.generation
+        cache.put('a', make_response(), generation)
+        cache.invalidate()
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', make_response(), generation)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', make_response(), cache.generation)
+        self.assertIsNotNone(cache.get('a'))
+
+    def test_disabled_and_oversized(self):
+        """Test that nothing is stored when the cache is disabled or the response is too large."""
+        disabled = ResponseCache(maxsize=0)
+        disabled.put('a', make_response())
+        self.assertIsNone(disabled.get('a'))
+        cache = ResponseCache(maxsize=2, max_entry_bytes=5)
+        cache.put('a', make_response('[1, 2, 3]'))
+        self.assertIsNone(cache.get('a'))
+
+
+    def test_configure(self):
+        """Test that new limits apply at once and empty the cache."""
+        cache = ResponseCache()
+        cache.put('a', make_response())
+        cache.configure(maxsize=0)
+        self.assertFalse(cache.enabled)
+        self.assertEqual(cache.stats()['size'], 0)
+        cache.put('a', make_response())
+        self.assertIsNone(cache.get('a'))
+
+    def test_changed_marker_invalidates(self):
+        """Test that a generation marker changed by another process empties the cache, unlike an unchanged one."""
+        cache = ResponseCache()
+        cache.observe('g1')
+        cache.put('a', make_response())
+        cache.observe('g1')
+        self.assertEqual(cache.get('a'), make_response())
+        cache.observe('g2')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+    def test_marker_is_checked_once_per_interval(self):
+        """Test that only the first lookup of every interval reads the generation marker."""
+        cache = ResponseCache(check_interval=10)
+        with patch('app.cache.time.monotonic', return_value=100.0):
+            self.assertEqual([cache.check_due(), cache.check_due()], [True, False])
+        with patch('app.cache.time.monotonic', return_value=110.5):
+            self.assertTrue(cache.check_due())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+import app.load as load
+from app.checkpoint import RunCheckpoint, CheckpointedSink, checkpoint_path
+from app.load import make_loader
+from app.pipeline import etl_pipeline
+import mongomock
+
+FOLDER = "dataset/data engineer 2023 - input - "
+
+
+def make_record(asset_id, entity_id, share=1.0):
+    """Build a record shaped like the output of convert_df_to_json."""
+    return {'cherry_asset_id': f'{asset_id}-A024-F-3-203', 'cityCode': 'A024', 'catasto': 'F', 'sezione': '',
+            'foglio': '3', 'particella': '203', 'subalterno': '',
+            'ownerships': {'entity_id': entity_id, 'vatCode': '', 'taxCode': 'T', 'ownershipShare': share}}
+
+
+def fail_after(calls):
+    """Wrap insert_idempotent so that it fails once it was called 'calls' times."""
+    insert = load.insert_idempotent
+    count = [0]
+
+    def failing(*args):
+        if count[0] == calls:
+            raise RuntimeError('Connection lost')
+        count[0] += 1
+        return insert(*args)
+    return failing
+
+
+class TestRunCheckpoint(unittest.TestCase):
+    """Unit tests for the run manifest."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.directory.name, 'assets.csv')
+        with open(self.input, 'w') as file:
+            file.write('asset_id\na_1\n')
+        self.manifest = os.path.join(self.directory.name, 'checkpoints', 'db.assets.checkpoint.json')
+        self.settings = {'load_mode': 'swap'}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, settings=None):
+        return RunCheckpoint(self.manifest, {'assets': [self.input]}, settings or self.settings)
+
+    def test_identical_run_resumes(self):
+        """Test that a run with the same inputs and settings resumes after the last committed batch."""
+        checkpoint = self.open()
+        self.assertEqual(checkpoint.resumed, 0)
+        checkpoint.commit(10)
+        checkpoint.commit(5)
+        os.utime(self.input, ns=(0, 0))
+        checkpoint = self.open()
+        self.assertEqual(checkpoint.resumed, 2)
+        with open(self.manifest) as file:
+            self.assertEqual(json.load(file)['records'], 15)
+
+    def test_changed_run_starts_over(self):
+        """Test that changed input content or settings start the load over."""
+        self.open().commit(10)
+        self.assertEqual(self.open({'load_mode': 'full'}).resumed, 0)
+        self.open().commit(10)
+        with open(self.input, 'a') as file:
+            file.write('a_2\n')
+        self.assertEqual(self.open().resumed, 0)
+
+    def test_clear(self):
+        """Test that a finished load removes its manifest, so that the next run starts over."""
+        checkpoint = self.open()
+        checkpoint.commit(10)
+        checkpoint.clear()
+        self.assertFalse(os.path.exists(self.manifest))
+        self.assertEqual(self.open().resumed, 0)
+
+
+class TestResumedLoad(unittest.TestCase):
+    """Unit tests for the checkpointed sinks and the idempotent inserts."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.collection = mongomock.MongoClient().db.assets
+        self.manifest = checkpoint_path(self.directory.name, self.collection)
+        self.batches = [[make_record('a_1', 'e_1'), make_record('a_1', 'e_2')], [make_record('a_2', 'e_1')],
+                        [make_record('a_3', 'e_3')]]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_load(self, fail_at=None):
+        """Load the batches through a checkpointed swap load, failing while inserting batch 'fail_at'."""
+        checkpoint = RunCheckpoint(self.manifest, {}, {'load_mode': 'swap'})
+        loader = make_loader(self.collection, 'swap', resume=bool(checkpoint.resumed), resumable=True)
+        sink = CheckpointedSink(loader, checkpoint)
+        try:
+            with patch.object(load, 'insert_idempotent', fail_after(fail_at if fail_at is not None else -1)):
+                for records in self.batches:
+                    sink.apply(records)
+            return sink.finish()
+        except Exception:
+            sink.abort()
+            raise
+
+    def test_resume_after_failed_batch(self):
+        """Test that a rerun keeps the staged batches and loads the remaining ones."""
+        with self.assertRaises(RuntimeError):
+            self.run_load(fail_at=2)
+        self.assertEqual(self.collection.database.assets_staging.count_documents({}), 3)
+
+        counts = self.run_load()
+        self.assertEqual(counts, {'inserted': 4, 'resumed_batches': 2})
+        self.assertEqual(sorted(document['_id'] for document in self.collection.find({})),
+                         ['a_1-A024-F-3-203|e_1', 'a_1-A024-F-3-203|e_2', 'a_2-A024-F-3-203|e_1',
+                          'a_3-A024-F-3-203|e_3'])
+        self.assertFalse(os.path.exists(self.manifest))
+
+    def test_partially_inserted_batch_is_not_duplicated(self):
+        """Test that inserting a batch again skips the documents the interrupted insert already wrote."""
+        loader = make_loader(self.collection, 'full', resumable=True)
+        loader.apply(self.batches[0][:1])
+        loader = make_loader(self.collection, 'full', resume=True, resumable=True)
+        loader.apply(self.batches[0])
+        self.assertEqual(loader.finish(), {'inserted': 1, 'existing': 1})
+        self.assertEqual(self.collection.count_documents({}), 2)
+
+    def test_resumed_key_split_across_batches(self):
+        """Test that a resumed load gives a key repeated in a later batch the same id as the interrupted run."""
+        self.batches[2].append(make_record('a_1', 'e_1', 0.5))
+        with self.assertRaises(RuntimeError):
+            self.run_load(fail_at=2)
+        self.assertEqual(self.run_load(), {'inserted': 5, 'resumed_batches': 2})
+        self.assertEqual(self.collection.count_documents({}), 5)
+
+    def test_pipeline_resumes_interrupted_load(self):
+        """Test that etl_pipeline resumes at the first partition the interrupted run did not commit."""
+        environment = {'ETL_ASSETS_SOURCE': FOLDER + "assets.csv", 'ETL_ENTITIES_SOURCE': FOLDER + "entities.csv",
+                       'ETL_JOIN_SOURCE': FOLDER + "assets_entities_join.csv", 'ETL_CHUNKSIZE': '50',
+                       'ETL_PARTITIONS': '4', 'ETL_CHECKPOINT_DIR': self.directory.name}
+        with patch.dict(os.environ, environment):
+            expected = etl_pipeline(self.collection)['inserted']
+            with patch.object(load, 'insert_idempotent', fail_after(2)), self.assertRaises(RuntimeError):
+                etl_pipeline(self.collection)
+            with open(self.manifest) as file:
+                self.assertEqual(json.load(file)['committed'], 2)
+            counts = etl_pipeline(self.collection)
+        self.assertEqual(counts, {'inserted': expected, 'resumed_batches': 2})
+        self.assertEqual(self.collection.count_documents({}), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
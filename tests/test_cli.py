@@ -0,0 +1,50 @@
+import os
+import unittest
+from unittest.mock import patch
+import app.__main__ as cli
+from app.load import GENERATIONS_COLLECTION
+import mongomock
+
+FOLDER = "dataset/data engineer 2023 - input - "
+
+
+class TestCommandLine(unittest.TestCase):
+    """Unit tests for the 'python -m app' entry point."""
+
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        self.environment = {'ETL_ASSETS_SOURCE': FOLDER + "assets.csv", 'ETL_ENTITIES_SOURCE': FOLDER + "entities.csv",
+                            'ETL_JOIN_SOURCE': FOLDER + "assets_entities_join.csv", 'MONGODB_DATABASE': 'etl',
+                            'MONGODB_COLLECTION': 'assets'}
+
+    def test_etl_loads_the_collection(self):
+        """Test that the etl command runs the pipeline once and loads the records and their statistics."""
+        with patch.dict(os.environ, self.environment), patch.object(cli, 'create_client', lambda uri: self.client):
+            self.assertEqual(cli.main(['etl']), 0)
+        self.assertGreater(self.client.etl.assets.count_documents({}), 0)
+        self.assertGreater(self.client.etl.assets_stats.count_documents({}), 0)
+
+    def test_etl_marks_a_new_generation(self):
+        """Test that every run replaces the generation marker that the API caches of other processes check."""
+        markers = []
+        with patch.dict(os.environ, self.environment), patch.object(cli, 'create_client', lambda uri: self.client):
+            for _ in range(2):
+                self.assertEqual(cli.main(['etl']), 0)
+                markers.append(self.client.etl[GENERATIONS_COLLECTION].find_one({'_id': 'assets'})['generation'])
+        self.assertNotEqual(markers[0], markers[1])
+
+    def test_failed_run_exits_with_an_error(self):
+        """Test that a failed run returns a non-zero exit status and leaves the collection untouched."""
+        self.environment['ETL_ASSETS_SOURCE'] = FOLDER + "missing.csv"
+        with patch.dict(os.environ, self.environment), patch.object(cli, 'create_client', lambda uri: self.client):
+            self.assertEqual(cli.main(['etl']), 1)
+        self.assertNotIn('assets', self.client.etl.list_collection_names())
+
+    def test_a_command_is_required(self):
+        """Test that the command line refuses to run without a command."""
+        with self.assertRaises(SystemExit):
+            cli.main([])
+
+
+if __name__ == '__main__':
+    unittest.main()
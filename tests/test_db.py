@@ -0,0 +1,30 @@
+import os
+import unittest
+from unittest.mock import patch
+from app.db import client_options
+
+
+class TestClientOptions(unittest.TestCase):
+    """Unit tests for the MongoDB connection pool settings."""
+
+    def test_defaults(self):
+        """Test the pool settings used when nothing is configured."""
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(client_options(), {'maxPoolSize': 100, 'minPoolSize': 0,
+                                                 'serverSelectionTimeoutMS': 30000, 'readPreference': 'primary'})
+
+    def test_settings_from_environment(self):
+        """Test that the pool size, timeouts and read preference come from the environment."""
+        environment = {'MONGODB_MAX_POOL_SIZE': '200', 'MONGODB_MIN_POOL_SIZE': '10',
+                       'MONGODB_SOCKET_TIMEOUT_MS': '5000', 'MONGODB_READ_PREFERENCE': 'secondaryPreferred'}
+        with patch.dict(os.environ, environment, clear=True):
+            options = client_options()
+        self.assertEqual(options['maxPoolSize'], 200)
+        self.assertEqual(options['minPoolSize'], 10)
+        self.assertEqual(options['socketTimeoutMS'], 5000)
+        self.assertEqual(options['readPreference'], 'secondaryPreferred')
+        self.assertNotIn('connectTimeoutMS', options)
+
+
+if __name__ == '__main__':
+    unittest.main()
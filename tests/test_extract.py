@@ -1,7 +1,13 @@
+import os
+import gzip
 import unittest
+import tempfile
 import pandas as pd
+import pyarrow as pa
 from unittest.mock import patch
-from app.extract import print_tabulated_data, load_csv
+import io
+from app.extract import print_tabulated_data, load_csv, extract_data, resolve_shards
+from app.schema import ASSET_SCHEMA, ENTITY_SCHEMA
 from pandas.testing import assert_frame_equal
 
 
@@ -33,5 +39,135 @@ class TestLoadCsv(unittest.TestCase):
         self.assertIsInstance(error, pd.errors.EmptyDataError)
 
 
+class TestSchema(unittest.TestCase):
+    """Unit tests for the schema-driven CSV reading."""
+
+    def test_declared_dtypes(self):
+        """
+        Test that codes are read as text and low-cardinality columns as categoricals.
+        """
+        df = load_csv("dataset/data engineer 2023 - input - assets.csv", ASSET_SCHEMA)
+        self.assertIsInstance(df['cityCode'].dtype, pd.CategoricalDtype)
+        self.assertTrue(pd.api.types.is_string_dtype(df['foglio']))
+        self.assertEqual(df['foglio'].iloc[0], '3')
+
+    def test_leading_zeros_are_kept(self):
+        """
+        Test that a VAT code keeps its leading zeros.
+        """
+        for engine in ['pyarrow', 'c']:
+            csv_file = io.BytesIO(b"entity_id,taxCode,vatCode\ne_1,,01234567890\n")
+            df = load_csv(csv_file, ENTITY_SCHEMA, engine)
+            self.assertEqual(df['vatCode'].iloc[0], '01234567890')
+
+    def test_bad_rows_are_skipped(self):
+        """
+        Test that rows with more fields than the header are skipped.
+        """
+        csv_file = io.BytesIO(b"entity_id,taxCode,vatCode\ne_1,T1,\ne_2,T2,,extra\ne_3,T3,\n")
+        df = load_csv(csv_file, ENTITY_SCHEMA)
+        self.assertEqual(list(df['entity_id']), ['e_1', 'e_3'])
+
+    def test_undeclared_columns_are_not_read(self):
+        """
+        Test that only the columns of the schema are read.
+        """
+        csv_file = io.BytesIO(b"entity_id,note,taxCode,vatCode\ne_1,x,T1,\n")
+        df = load_csv(csv_file, ENTITY_SCHEMA)
+        self.assertEqual(list(df.columns), list(ENTITY_SCHEMA))
+
+    def test_pyarrow_engine_matches_c_engine(self):
+        """
+        Test that both parsers read the same values, the categories being in a different order.
+        """
+        file_path = "dataset/data engineer 2023 - input - assets.csv"
+        assert_frame_equal(load_csv(file_path, ASSET_SCHEMA, 'pyarrow'), load_csv(file_path, ASSET_SCHEMA, 'c'),
+                           check_categorical=False)
+
+    def test_chunks_read_categoricals_as_text(self):
+        """
+        Test that chunked reading does not produce categoricals whose categories differ between chunks.
+        """
+        chunks = list(extract_data("dataset/data engineer 2023 - input - assets.csv", 10, ASSET_SCHEMA))
+        self.assertTrue(all(pd.api.types.is_string_dtype(chunk['cityCode']) for chunk in chunks))
+
+    def test_empty_file(self):
+        """
+        Test that load_csv returns a pd.errors.EmptyDataError for an empty file with a schema.
+        """
+        self.assertIsInstance(load_csv("dataset/data.csv", ASSET_SCHEMA), pd.errors.EmptyDataError)
+
+    def test_unknown_engine(self):
+        """
+        Test that an unknown parser is refused.
+        """
+        with self.assertRaises(ValueError):
+            extract_data("dataset/data engineer 2023 - input - assets.csv", schema=ASSET_SCHEMA, engine='python')
+
+
+class TestShards(unittest.TestCase):
+    """Unit tests for the sharded and compressed inputs."""
+
+    def setUp(self):
+        self.file_path = "dataset/data engineer 2023 - input - assets.csv"
+        self.directory = tempfile.TemporaryDirectory()
+        with open(self.file_path) as file:
+            lines = file.read().splitlines(keepends=True)
+        header, rows = lines[0], lines[1:]
+        # Three shards: plain, gzip and zstd compressed, plus an empty one
+        parts = [rows[:30], rows[30:70], rows[70:]]
+        self.shards = [os.path.join(self.directory.name, name)
+                       for name in ['assets-1.csv', 'assets-2.csv.gz', 'assets-3.csv.zst', 'assets-4.csv']]
+        with open(self.shards[0], 'w') as file:
+            file.write(header + ''.join(parts[0]))
+        with gzip.open(self.shards[1], 'wt') as file:
+            file.write(header + ''.join(parts[1]))
+        with pa.CompressedOutputStream(self.shards[2], 'zstd') as file:
+            file.write((header + ''.join(parts[2])).encode())
+        open(self.shards[3], 'w').close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resolve_shards(self):
+        """
+        Test that glob patterns and manifests are resolved into the sorted shard paths.
+        """
+        pattern = os.path.join(self.directory.name, 'assets-*')
+        self.assertEqual(resolve_shards(pattern), self.shards)
+        manifest = os.path.join(self.directory.name, 'assets.manifest')
+        with open(manifest, 'w') as file:
+            file.write('# daily shards\nassets-2.csv.gz\n\nassets-1.csv\n')
+        self.assertEqual(resolve_shards(manifest), [self.shards[1], self.shards[0]])
+
+    def test_shards_match_single_file(self):
+        """
+        Test that the shards are read, decompressed and concatenated like the single file, with every engine.
+        """
+        pattern = os.path.join(self.directory.name, 'assets-*')
+        for engine in ['pyarrow', 'c']:
+            expected = load_csv(self.file_path, ASSET_SCHEMA, engine)
+            result = extract_data(pattern, schema=ASSET_SCHEMA, engine=engine, workers=3)
+            self.assertIsInstance(result['cityCode'].dtype, pd.CategoricalDtype)
+            assert_frame_equal(result, expected, check_categorical=False)
+        # Without a schema, the dtypes are inferred per shard: a shard without any 'sezione' reads it as float
+        assert_frame_equal(extract_data(pattern), load_csv(self.file_path), check_dtype=False)
+
+    def test_shard_chunks_match_single_file(self):
+        """
+        Test that streaming the shards yields the rows of the single file, indexed in a single sequence.
+        """
+        chunks = list(extract_data(self.shards, chunksize=25, schema=ASSET_SCHEMA))
+        expected = pd.concat(extract_data(self.file_path, chunksize=25, schema=ASSET_SCHEMA))
+        assert_frame_equal(pd.concat(chunks), expected)
+
+    def test_missing_shards(self):
+        """
+        Test that a missing shard, or a pattern matching nothing, returns a FileNotFoundError.
+        """
+        self.assertIsInstance(extract_data(self.shards + ['missing.csv']), FileNotFoundError)
+        self.assertIsInstance(extract_data(os.path.join(self.directory.name, 'nothing-*.csv')), FileNotFoundError)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+import time
+import threading
+import unittest
+from app.jobs import JobRunner
+
+
+def wait_for(runner, run_id, timeout=5):
+    """Wait until a run has finished and return its final status."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        run = runner.get(run_id)
+        if run['status'] in ('succeeded', 'failed'):
+            return run
+        time.sleep(0.01)
+    raise AssertionError(f"Run {run_id} did not finish")
+
+
+class TestJobRunner(unittest.TestCase):
+    """Unit tests for the background ETL job runner."""
+
+    def test_run_reports_stages_and_counts(self):
+        """Test that a finished run exposes its stage timings and load counts."""
+        def target(stages, spans):
+            stages['extract'] = 0.5
+            return {'inserted': 3}
+
+        runner = JobRunner(target)
+        run = wait_for(runner, runner.trigger()['id'])
+        self.assertEqual(run['status'], 'succeeded')
+        self.assertEqual(run['stages'], {'extract': 0.5})
+        self.assertEqual(run['counts'], {'inserted': 3})
+        self.assertIsNotNone(run['finished_at'])
+
+    def test_concurrent_triggers_share_one_run(self):
+        """Test that triggers received while a run is in flight are coalesced into it."""
+        release = threading.Event()
+        calls = []
+
+        def target(stages, spans):
+            calls.append(1)
+            release.wait(5)
+            return {}
+
+        runner = JobRunner(target)
+        ids = {runner.trigger()['id'] for _ in range(5)}
+        self.assertEqual(len(ids), 1)
+        release.set()
+        wait_for(runner, ids.pop())
+        self.assertEqual(len(calls), 1)
+
+        second = runner.trigger()
+        wait_for(runner, second['id'])
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_run(self):
+        """Test that an exception in the pipeline marks the run as failed."""
+        def target(stages, spans):
+            raise RuntimeError("boom")
+
+        runner = JobRunner(target)
+        run = wait_for(runner, runner.trigger()['id'])
+        self.assertEqual(run['status'], 'failed')
+        self.assertEqual(run['error'], 'boom')
+
+    def test_finished_runs_are_reported(self):
+        """Test that on_finish receives every finished run with its spans."""
+        finished = []
+
+        def target(stages, spans):
+            spans['load'] = {'seconds': 0.1, 'rows_in': 2, 'rows_out': 2, 'rejected': {}, 'peak_rss_bytes': 1}
+            return {'inserted': 2}
+
+        runner = JobRunner(target, on_finish=finished.append)
+        run = wait_for(runner, runner.trigger()['id'])
+        deadline = time.monotonic() + 5
+        while not finished and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(finished[0]['id'], run['id'])
+        self.assertEqual(finished[0]['spans']['load']['rows_out'], 2)
+
+    def test_unknown_run(self):
+        """Test that an unknown run id is not found."""
+        self.assertIsNone(JobRunner(lambda stages, spans: {}).get('missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
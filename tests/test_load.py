@@ -18,4 +18,342 @@ class TestInsertRecords(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main()
-'''
\ No newline at end of file
+'''
+import os
+import unittest
+from unittest.mock import patch
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+import app.load as load
+from app.load import document_key, fingerprint_record, assign_document_ids, sync_records
+from app.load import make_loader, rollback_collection, bulk_insert, BulkLoadError, stats_name, write_stats
+import mongomock
+
+# Set MONGODB_TEST_URI to run the MongoDB tests against a local mongod instead of mongomock
+test_uri = os.getenv("MONGODB_TEST_URI")
+
+
+def make_test_database():
+    """Return an empty database on the test mongod, or a mongomock stand-in."""
+    if test_uri:
+        client = MongoClient(test_uri)
+        client.drop_database('etl_pipeline_test')
+        return client['etl_pipeline_test']
+    return mongomock.MongoClient().db
+
+
+def make_record(asset_id, entity_id, share=1.0):
+    """Build a record shaped like the output of convert_df_to_json."""
+    return {'cherry_asset_id': f'{asset_id}-A024-F-3-203', 'cityCode': 'A024', 'catasto': 'F', 'sezione': '',
+            'foglio': '3', 'particella': '203', 'subalterno': '',
+            'ownerships': {'entity_id': entity_id, 'vatCode': '', 'taxCode': 'T', 'ownershipShare': share}}
+
+
+class TestDocumentIds(unittest.TestCase):
+    """Unit tests for the deterministic document keys and fingerprints."""
+
+    def test_document_key(self):
+        """Test that the key combines the asset and the owner, or the asset alone for aggregated records."""
+        record = make_record('a_1', 'e_1')
+        self.assertEqual(document_key(record), 'a_1-A024-F-3-203|e_1')
+        record['ownerships'] = [record['ownerships']]
+        self.assertEqual(document_key(record), 'a_1-A024-F-3-203')
+
+    def test_fingerprint_ignores_id(self):
+        """Test that the fingerprint depends on the content only."""
+        record = make_record('a_1', 'e_1')
+        fingerprint = fingerprint_record(record)
+        record['_id'] = 'anything'
+        self.assertEqual(fingerprint_record(record), fingerprint)
+        self.assertNotEqual(fingerprint_record(make_record('a_1', 'e_1', 0.5)), fingerprint)
+
+    def test_assign_document_ids_disambiguates_duplicate_keys(self):
+        """Test that records sharing a key still get distinct ids."""
+        records = assign_document_ids([make_record('a_1', 'e_1', 0.5), make_record('a_1', 'e_1', 0.25),
+                                       make_record('a_2', 'e_1')])
+        ids = [record['_id'] for record in records]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(ids[2], 'a_2-A024-F-3-203|e_1')
+
+    def test_assign_document_ids_across_batches(self):
+        """Test that a key repeated in a later batch of the run gets a distinct id."""
+        assigned = set()
+        first = assign_document_ids([make_record('a_1', 'e_1', 0.5)], assigned)
+        second = assign_document_ids([make_record('a_1', 'e_1', 0.25), make_record('a_1', 'e_1', 0.25)], assigned)
+        ids = [record['_id'] for record in first + second]
+        self.assertEqual(ids[0], 'a_1-A024-F-3-203|e_1')
+        self.assertEqual(len(set(ids)), 3)
+
+
+class TestSyncRecords(unittest.TestCase):
+    """Unit tests for the incremental loader."""
+
+    def setUp(self):
+        self.collection = make_test_database().collection
+
+    def test_sync_records_reports_changes(self):
+        """Test that a second run only applies the differences."""
+        counts = sync_records(self.collection, [make_record('a_1', 'e_1'), make_record('a_2', 'e_2')])
+        self.assertEqual(counts, {'unchanged': 0, 'changed': 0, 'added': 2, 'removed': 0})
+
+        counts = sync_records(self.collection, [make_record('a_1', 'e_1'), make_record('a_2', 'e_2', 0.5),
+                                                make_record('a_3', 'e_3')])
+        self.assertEqual(counts, {'unchanged': 1, 'changed': 1, 'added': 1, 'removed': 0})
+
+        counts = sync_records(self.collection, [make_record('a_3', 'e_3')])
+        self.assertEqual(counts, {'unchanged': 1, 'changed': 0, 'added': 0, 'removed': 2})
+        self.assertEqual([document['_id'] for document in self.collection.find({})], ['a_3-A024-F-3-203|e_3'])
+
+    def test_sync_records_updates_changed_content(self):
+        """Test that a changed record replaces the loaded document."""
+        sync_records(self.collection, [make_record('a_1', 'e_1')])
+        sync_records(self.collection, [make_record('a_1', 'e_1', 0.5)])
+        document = self.collection.find_one({'_id': 'a_1-A024-F-3-203|e_1'})
+        self.assertEqual(document['ownerships']['ownershipShare'], 0.5)
+
+
+class TestSwapLoader(unittest.TestCase):
+    """Unit tests for the staging collection and the atomic swap."""
+
+    def setUp(self):
+        self.database = make_test_database()
+        self.collection = self.database.collection
+        self.collection.insert_many([make_record('a_1', 'e_1'), make_record('a_2', 'e_2')])
+
+    def test_collection_is_untouched_until_finish(self):
+        """Test that readers keep seeing the current generation while the staging collection loads."""
+        loader = make_loader(self.collection, 'swap')
+        loader.apply([make_record('a_3', 'e_3')])
+        self.assertEqual(self.collection.count_documents({}), 2)
+
+        counts = loader.finish()
+        self.assertEqual(counts, {'inserted': 1})
+        self.assertEqual([document['cherry_asset_id'] for document in self.collection.find({})],
+                         ['a_3-A024-F-3-203'])
+        self.assertNotIn('collection_staging', self.database.list_collection_names())
+        self.assertIn('cherry_asset_id_1', self.collection.index_information())
+
+    def test_key_split_across_batches(self):
+        """Test that the records of a key split across batches are all loaded and counted once."""
+        for mode in ('swap', 'full'):
+            loader = make_loader(self.collection, mode, batch_size=1)
+            for records in ([make_record('a_1', 'e_1', 0.5)], [make_record('a_2', 'e_2')],
+                            [make_record('a_1', 'e_1', 0.25)]):
+                loader.apply(records)
+            self.assertEqual(loader.finish(), {'inserted': 3})
+            self.assertEqual(self.collection.count_documents({}), 3)
+
+    def test_deterministic_ids_only_for_resumable_loads(self):
+        """Test that only a resumable load keeps the ids of the run, while the others get the driver's ObjectIds."""
+        records = [make_record('a_3', 'e_3'), make_record('a_3', 'e_3', 0.5)]
+        for mode in ('swap', 'full'):
+            loader = make_loader(self.collection, mode)
+            loader.apply(records)
+            loader.finish()
+            self.assertIsNone(loader.assigned)
+            self.assertTrue(all(isinstance(document['_id'], ObjectId) for document in self.collection.find({})))
+
+            loader = make_loader(self.collection, mode, resumable=True)
+            loader.skip(records[:1])
+            loader.apply(records[1:])
+            loader.finish()
+            self.assertEqual([document['_id'] for document in self.collection.find({})],
+                             [f"a_3-A024-F-3-203|e_3#{fingerprint_record(records[1])[:12]}"])
+        self.assertNotIn('_id', records[0])
+
+    def test_abort_keeps_current_generation(self):
+        """Test that a failed load leaves the served collection unchanged."""
+        loader = make_loader(self.collection, 'swap')
+        loader.apply([make_record('a_3', 'e_3')])
+        loader.abort()
+        self.assertEqual(self.collection.count_documents({}), 2)
+        self.assertNotIn('collection_staging', self.database.list_collection_names())
+
+    def test_rollback_restores_previous_generation(self):
+        """Test that the previous generation is kept and can be swapped back."""
+        loader = make_loader(self.collection, 'swap')
+        loader.apply([make_record('a_3', 'e_3')])
+        loader.finish()
+        self.assertEqual(self.database.collection_previous.count_documents({}), 2)
+
+        rollback_collection(self.database, 'collection', 'collection_previous')
+        self.assertEqual(self.collection.count_documents({}), 2)
+
+    def test_rollback_does_not_rebuild_indexes(self):
+        """Test that the previous generation keeps its indexes, so that the rollback only renames it."""
+        for asset_id in ['a_3', 'a_4']:
+            loader = make_loader(self.collection, 'swap')
+            loader.apply([make_record(asset_id, 'e_3')])
+            loader.finish()
+        self.assertIn('cityCode_1__id_1', self.database.collection_previous.index_information())
+
+        with patch.object(load, 'create_indexes', side_effect=AssertionError('indexes rebuilt')):
+            rollback_collection(self.database, 'collection', 'collection_previous')
+        self.assertEqual([document['cherry_asset_id'] for document in self.collection.find({})],
+                         ['a_3-A024-F-3-203'])
+        self.assertIn('cityCode_1__id_1', self.collection.index_information())
+
+    def test_stats_are_swapped_with_the_records(self):
+        """Test that the statistics are staged and swapped together with the records, and rolled back with them."""
+        write_stats(self.database[stats_name('collection')], [{'_id': 'A024', 'assets': 2}])
+        loader = make_loader(self.collection, 'swap')
+        loader.apply([make_record('a_3', 'e_3')])
+        loader.finish([{'_id': 'L263', 'assets': 1}])
+        self.assertEqual(list(self.database.collection_stats.find({})), [{'_id': 'L263', 'assets': 1}])
+        self.assertNotIn('collection_staging_stats', self.database.list_collection_names())
+
+        rollback_collection(self.database, 'collection', 'collection_previous')
+        self.assertEqual(list(self.database.collection_stats.find({})), [{'_id': 'A024', 'assets': 2}])
+
+    @unittest.skipIf(test_uri, "needs mongomock to fail a rename")
+    def test_failed_stats_swap_restores_both(self):
+        """Test that a failed rename of the statistics undoes the swap of the records, and the reverse."""
+        write_stats(self.database[stats_name('collection')], [{'_id': 'A024', 'assets': 2}])
+        rename = mongomock.collection.Collection.rename
+
+        def failing_rename(collection, new_name, **kwargs):
+            if collection.name == 'collection_staging_stats':
+                raise OperationFailure('rename failed')
+            return rename(collection, new_name, **kwargs)
+
+        loader = make_loader(self.collection, 'swap')
+        loader.apply([make_record('a_3', 'e_3')])
+        with patch.object(mongomock.collection.Collection, 'rename', failing_rename):
+            with self.assertRaises(OperationFailure):
+                loader.finish([{'_id': 'L263', 'assets': 1}])
+        self.assertEqual(self.collection.count_documents({}), 2)
+        self.assertEqual(list(self.database.collection_stats.find({})), [{'_id': 'A024', 'assets': 2}])
+        self.assertEqual(self.database.collection_staging.count_documents({}), 1)
+
+    @unittest.skipIf(test_uri, "needs mongomock to observe every step")
+    def test_target_exists_at_every_step(self):
+        """Test that readers find the served collection and its statistics before and after every step of the swap."""
+        write_stats(self.database[stats_name('collection')], [{'_id': 'A024', 'assets': 2}])
+        for asset_id in ['a_3', 'a_4']:
+            loader = make_loader(self.collection, 'swap')
+            loader.apply([make_record(asset_id, 'e_3')])
+            steps = []
+
+            def observed(method):
+                def step(collection, *args, **kwargs):
+                    names = self.database.list_collection_names()
+                    self.assertTrue({'collection', 'collection_stats'} <= set(names), method.__name__)
+                    steps.append(method.__name__)
+                    return method(collection, *args, **kwargs)
+                return step
+
+            methods = {name: observed(getattr(mongomock.collection.Collection, name))
+                       for name in ['aggregate', 'create_index', 'drop', 'rename']}
+            with patch.multiple(mongomock.collection.Collection, **methods):
+                loader.finish([{'_id': 'L263', 'assets': 1}])
+            self.assertIn('rename', steps)
+            self.assertEqual(self.collection.count_documents({}), 1)
+        self.assertEqual(self.database.collection_previous.find_one({})['cherry_asset_id'], 'a_3-A024-F-3-203')
+
+    def test_abort_discards_staged_stats(self):
+        """Test that a failed load leaves the served statistics unchanged."""
+        loader = make_loader(self.collection, 'swap')
+        write_stats(self.database[stats_name('collection_staging')], [{'_id': 'L263'}])
+        loader.abort()
+        self.assertNotIn('collection_staging_stats', self.database.list_collection_names())
+
+    def test_in_place_loads_replace_stats(self):
+        """Test that the full and incremental loads replace the statistics as well."""
+        for mode in ['full', 'incremental']:
+            loader = make_loader(self.collection, mode)
+            loader.apply([make_record('a_3', 'e_3')])
+            loader.finish([{'_id': mode}])
+            self.assertEqual(list(self.database.collection_stats.find({})), [{'_id': mode}])
+
+
+class TestBulkInsert(unittest.TestCase):
+    """Unit tests for the batched bulk loader."""
+
+    def setUp(self):
+        self.collection = make_test_database().collection
+
+    def test_batches_and_throughput(self):
+        """Test that a record generator is written in fixed-size batches with a throughput per batch."""
+        records = (make_record(f'a_{number}', 'e_1') for number in range(25))
+        result = bulk_insert(self.collection, records, batch_size=10, workers=3, max_pending=2)
+        self.assertEqual(result['inserted'], 25)
+        self.assertEqual([report['size'] for report in result['batches']], [10, 10, 5])
+        self.assertTrue(all(report['docs_per_second'] > 0 for report in result['batches']))
+        self.assertEqual(self.collection.count_documents({}), 25)
+
+    def test_records_are_not_modified(self):
+        """Test that the inserted '_id' does not leak into the caller's records."""
+        records = [make_record('a_1', 'e_1')]
+        bulk_insert(self.collection, records)
+        self.assertNotIn('_id', records[0])
+
+    def test_partial_failure_is_reported(self):
+        """Test that a failed batch raises with the partial results, after every other document is written."""
+        self.collection.insert_one({'_id': 'duplicate'})
+        records = [dict(make_record(f'a_{number}', 'e_1'), _id=f'id_{number}') for number in range(6)]
+        records[1]['_id'] = 'duplicate'
+        with self.assertRaises(BulkLoadError) as context:
+            bulk_insert(self.collection, records, batch_size=3, workers=2)
+        result = context.exception.result
+        self.assertEqual(result['inserted'], 5)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertEqual(result['errors'][0]['batch'], 0)
+        self.assertEqual(result['errors'][0]['writeErrors'][0]['code'], 11000)
+        self.assertEqual(self.collection.count_documents({}), 6)
+
+
+def plan_stages(plan):
+    """Collect the stage names of a query plan tree returned by explain."""
+    plan = plan.get('queryPlan', plan)
+    stages = [plan['stage']]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+
+class TestIndexes(unittest.TestCase):
+    """Unit tests for the indexes built at load time."""
+
+    def test_loaders_build_the_lookup_indexes(self):
+        """Test that every load mode leaves the lookup indexes on the served collection."""
+        for mode in ('swap', 'full', 'incremental'):
+            collection = make_test_database().collection
+            loader = make_loader(collection, mode)
+            loader.apply([make_record('a_1', 'e_1')])
+            loader.finish()
+            self.assertTrue({'cherry_asset_id_1', 'cityCode_1__id_1', 'ownerships.taxCode_1__id_1',
+                             'ownerships.vatCode_1__id_1'} <= set(collection.index_information()), mode)
+
+
+@unittest.skipIf(not test_uri, "explain needs a real mongod, set MONGODB_TEST_URI")
+class TestIndexedLookups(unittest.TestCase):
+    """Check with explain that the paginated lookups are index scans."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.collection = make_test_database().collection
+        loader = make_loader(cls.collection, 'swap')
+        loader.apply([make_record(f'a_{number}', f'e_{number % 7}') for number in range(200)])
+        loader.finish()
+
+    def assert_index_scan(self, query):
+        explanation = self.collection.find(query).sort('_id', 1).limit(10).explain()
+        stages = plan_stages(explanation['queryPlanner']['winningPlan'])
+        self.assertIn('IXSCAN', stages)
+        self.assertNotIn('COLLSCAN', stages)
+        self.assertNotIn('SORT', stages)
+
+    def test_city_lookup_uses_index(self):
+        """Test that the city lookup is served by the (cityCode, _id) index."""
+        self.assert_index_scan({'cityCode': 'A024'})
+
+    def test_owner_lookups_use_index(self):
+        """Test that the owner lookups are served by the ownership indexes."""
+        self.assert_index_scan({'ownerships.taxCode': 'T'})
+        self.assert_index_scan({'ownerships.vatCode': 'V'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -38,4 +38,339 @@ class TestMain(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main()
-'''
\ No newline at end of file
+'''
+import os
+import sys
+import json
+import time
+import unittest
+import threading
+import subprocess
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import app.main as main
+from app.jobs import JobRunner
+from app.load import mark_generation
+import mongomock
+
+FOLDER = "dataset/data engineer 2023 - input - "
+
+# Modules that only an ETL run needs, and that importing the API must not load
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'app.pipeline', 'app.transform']
+
+
+def imported_modules(statement, settings=None):
+    """Run a statement in a fresh interpreter with only the given MongoDB settings, and return the modules it loaded."""
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('CLUSTER_URI', 'MONGODB_DATABASE', 'MONGODB_COLLECTION')}
+    env.update(settings or {})
+    code = f"{statement}\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+class TestStartup(unittest.TestCase):
+    """Import-time tests keeping the start of the API and of the command line fast."""
+
+    def test_import_main_is_lazy(self):
+        """Test that importing the API needs no settings, and neither loads pandas nor connects to MongoDB."""
+        modules = imported_modules("import app.main\nassert not hasattr(app.main, 'client')")
+        self.assertEqual([module for module in HEAVY_MODULES if module in modules], [])
+
+    def test_lifespan_connects(self):
+        """Test that the clients are created when the application starts, without connecting yet."""
+        modules = imported_modules(
+            "from fastapi.testclient import TestClient\n"
+            "from app.main import app\n"
+            "with TestClient(app):\n"
+            "    assert app.state.etl_collection.full_name == 'etl.assets'\n"
+            "    assert app.state.stats_collection.name == 'assets_stats'",
+            {'CLUSTER_URI': 'mongodb://localhost:1', 'MONGODB_DATABASE': 'etl', 'MONGODB_COLLECTION': 'assets'}
+        )
+        self.assertNotIn('pandas', modules)
+
+    def test_cli_does_not_import_the_api(self):
+        """Test that the command line entry point loads neither FastAPI nor uvicorn."""
+        modules = imported_modules("import app.__main__")
+        self.assertEqual([module for module in ['fastapi', 'starlette', 'uvicorn', 'pandas'] if module in modules], [])
+
+
+
+class AsyncCursor:
+    """Asynchronous stand-in for the AsyncCursor of pymongo, over a mongomock cursor."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit):
+        self.cursor = self.cursor.limit(limit)
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        return list(self.cursor)
+
+
+class AsyncCollection:
+    """Asynchronous stand-in for the AsyncCollection of pymongo, over a mongomock collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+
+class AsyncDatabase:
+    """Asynchronous stand-in for the AsyncDatabase of pymongo, over a mongomock database."""
+
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, collection_name):
+        return AsyncCollection(self.database[collection_name])
+
+
+class AsyncClient:
+    """Asynchronous stand-in for the AsyncMongoClient of pymongo, sharing the data of a mongomock client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getitem__(self, database_name):
+        return AsyncDatabase(self.client[database_name])
+
+    async def close(self):
+        pass
+
+
+def make_record(asset_id, city_code, entity_id, tax_code='T', vat_code=''):
+    """Build a loaded document shaped like the output of convert_df_to_json."""
+    return {'_id': f'{asset_id}|{entity_id}', 'cherry_asset_id': asset_id, 'cityCode': city_code, 'catasto': 'F',
+            'sezione': '', 'foglio': '3', 'particella': '203', 'subalterno': '', '_fingerprint': 'f',
+            'ownerships': {'entity_id': entity_id, 'vatCode': vat_code, 'taxCode': tax_code, 'ownershipShare': 1.0}}
+
+
+class ApiTestCase(unittest.TestCase):
+    """Run the application on a mongomock client, read by the endpoints through the asynchronous wrapper."""
+
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        self.database = self.client.etl
+        settings = {'CLUSTER_URI': 'mongodb://localhost:1', 'MONGODB_DATABASE': 'etl', 'MONGODB_COLLECTION': 'assets',
+                    'ETL_INTERVAL_SECONDS': '0', 'RESPONSE_CACHE_CHECK_SECONDS': '0'}
+        for patcher in [patch.dict(os.environ, settings),
+                        patch.object(main, 'create_client', lambda uri: self.client),
+                        patch.object(main, 'create_async_client', lambda uri: AsyncClient(self.client))]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.api = TestClient(main.app)
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__, None, None, None)
+
+
+class TestDataEndpoints(ApiTestCase):
+    """Endpoint tests for /data and /data/{citycode}."""
+
+    def setUp(self):
+        super().setUp()
+        self.database.assets.insert_many([make_record(f'a_{number}', 'A024' if number % 2 else 'L263', 'e_1')
+                                          for number in range(5)])
+
+    def test_data_pages(self):
+        """Test that following the X-Next-After header returns every record once, without internal fields."""
+        seen, after = [], ''
+        while True:
+            response = self.api.get(f'/data?limit=2&after={after}')
+            self.assertEqual(response.status_code, 200)
+            seen.extend(record['_id'] for record in response.json())
+            if 'x-next-after' not in response.headers:
+                break
+            after = response.headers['x-next-after']
+        self.assertEqual(seen, [f'a_{number}|e_1' for number in range(5)])
+        self.assertNotIn('_fingerprint', response.json()[0])
+
+    def test_data_streams(self):
+        """Test the streamed JSON array and NDJSON outputs and the projection of the fields."""
+        response = self.api.get('/data')
+        self.assertEqual(len(response.json()), 5)
+        self.assertNotIn('x-next-after', response.headers)
+        response = self.api.get('/data?format=ndjson&fields=cityCode')
+        self.assertEqual(response.headers['content-type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(lines[0], {'_id': 'a_0|e_1', 'cityCode': 'L263'})
+        self.assertEqual(len(lines), 5)
+
+    def test_load_of_another_process_replaces_cached_responses(self):
+        """Test that a cached response is served until a load committed elsewhere marks a new generation."""
+        self.assertEqual(len(self.api.get('/data').json()), 5)
+        self.database.assets.insert_one(make_record('a_5', 'A024', 'e_1'))
+        self.assertEqual(len(self.api.get('/data').json()), 5)
+        mark_generation(self.database.assets)
+        self.assertEqual(len(self.api.get('/data').json()), 6)
+
+    def test_invalid_parameters(self):
+        """Test that an unknown format or an out of range page size is refused."""
+        self.assertEqual(self.api.get('/data?format=xml').status_code, 422)
+        self.assertEqual(self.api.get('/data?limit=0').status_code, 422)
+
+    def test_city(self):
+        """Test the records of a city, page by page, and the 404 of a city without record."""
+        response = self.api.get('/data/A024?limit=1')
+        self.assertEqual(response.json()[0]['_id'], 'a_1|e_1')
+        response = self.api.get(f"/data/A024?limit=1&after={response.headers['x-next-after']}")
+        self.assertEqual([record['_id'] for record in response.json()], ['a_3|e_1'])
+        response = self.api.get('/data/Z999')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'message': 'Record not found'})
+
+
+class TestOwnerEndpoints(ApiTestCase):
+    """Endpoint tests for /owners/{taxcode} and /owners/vat/{vatcode}."""
+
+    def setUp(self):
+        super().setUp()
+        self.database.assets.insert_many([make_record(f'a_{number}', 'A024', 'e_1', 'T1', 'V1') for number in range(3)]
+                                         + [make_record('a_3', 'L263', 'e_2', 'T2')])
+
+    def test_tax_code(self):
+        """Test the records of an owner by tax code, page by page."""
+        response = self.api.get('/owners/T1?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([record['_id'] for record in response.json()], ['a_0|e_1', 'a_1|e_1'])
+        self.assertEqual(response.headers['x-next-after'], 'a_1|e_1')
+        response = self.api.get('/owners/T1?limit=2&after=a_1|e_1')
+        self.assertEqual([record['_id'] for record in response.json()], ['a_2|e_1'])
+        self.assertNotIn('x-next-after', response.headers)
+        self.assertEqual([record['_id'] for record in self.api.get('/owners/T2').json()], ['a_3|e_2'])
+
+    def test_vat_code(self):
+        """Test the records of an owner by VAT code, page by page."""
+        response = self.api.get('/owners/vat/V1?limit=1')
+        self.assertEqual([record['_id'] for record in response.json()], ['a_0|e_1'])
+        response = self.api.get(f"/owners/vat/V1?limit=2&after={response.headers['x-next-after']}")
+        self.assertEqual([record['_id'] for record in response.json()], ['a_1|e_1', 'a_2|e_1'])
+        self.assertEqual(response.headers['x-next-after'], 'a_2|e_1')
+
+    def test_unknown_owner(self):
+        """Test the 404 of an owner without record."""
+        for path in ('/owners/T9', '/owners/vat/V9', '/owners/T9?limit=2'):
+            response = self.api.get(path)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json(), {'message': 'Record not found'})
+
+    def test_cached_responses(self):
+        """Test that a repeated request is served from the response cache until a new generation is marked."""
+        for path in ('/owners/T2', '/owners/vat/V1?limit=5'):
+            expected = self.api.get(path).json()
+            hits = main.response_cache.stats()['hits']
+            self.database.assets.insert_one(make_record(f'a_{len(expected) + 10}', 'L263', 'e_3', 'T2', 'V1'))
+            self.assertEqual(self.api.get(path).json(), expected)
+            self.assertEqual(main.response_cache.stats()['hits'], hits + 1)
+        mark_generation(self.database.assets)
+        self.assertEqual(len(self.api.get('/owners/T2').json()), 3)
+
+
+class TestRunEndpoints(ApiTestCase):
+    """Endpoint tests for the ETL runs, read back by the endpoints through the asynchronous client."""
+
+    def wait_for(self, run_id):
+        """Poll the status of a run until it finished."""
+        for _ in range(200):
+            run = self.api.get(f'/etl/runs/{run_id}').json()
+            if run['status'] in ('succeeded', 'failed'):
+                return run
+            time.sleep(0.05)
+        self.fail(f'Run {run_id} did not finish.')
+
+    def test_triggers_are_single_flight(self):
+        """Test that a trigger during a run is accepted and joins the run in flight."""
+        release = threading.Event()
+        runner = JobRunner(lambda stages, spans: release.wait(5) and {'inserted': 0})
+        with patch.object(main.app.state, 'runner', runner):
+            first = self.api.post('/etl/runs')
+            second = self.api.post('/etl/runs')
+            self.assertEqual((first.status_code, second.status_code), (202, 202))
+            self.assertEqual(first.json()['id'], second.json()['id'])
+            self.assertIn(self.api.get(f"/etl/runs/{first.json()['id']}").json()['status'], ('queued', 'running'))
+            release.set()
+            self.assertEqual(self.wait_for(first.json()['id'])['status'], 'succeeded')
+            self.assertNotEqual(self.api.post('/etl/runs').json()['id'], first.json()['id'])
+
+    def test_unknown_run(self):
+        """Test the 404 of an unknown run."""
+        response = self.api.get('/etl/runs/unknown')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'message': 'Run not found'})
+
+    def test_run_loads_the_served_collection(self):
+        """Test that a run loads the records and statistics the endpoints read, replacing the cached responses."""
+        self.assertEqual(self.api.get('/data').json(), [])
+        sources = {'ETL_ASSETS_SOURCE': FOLDER + "assets.csv", 'ETL_ENTITIES_SOURCE': FOLDER + "entities.csv",
+                   'ETL_JOIN_SOURCE': FOLDER + "assets_entities_join.csv"}
+        with patch.dict(os.environ, sources):
+            run = self.wait_for(self.api.post('/etl/runs').json()['id'])
+        self.assertEqual(run['status'], 'succeeded')
+        self.assertEqual(len(self.api.get('/data').json()), run['counts']['inserted'])
+        self.assertGreater(len(self.api.get('/stats').json()), 0)
+
+    def test_restarted_application_runs_again(self):
+        """Test that the shutdown closes both clients, and that the application runs the ETL again once restarted."""
+        with patch.object(mongomock.MongoClient, 'close') as close, patch.object(AsyncClient, 'close') as async_close:
+            self.api.__exit__(None, None, None)
+        close.assert_called_once_with()
+        async_close.assert_called_once_with()
+        self.api.__enter__()
+        sources = {'ETL_ASSETS_SOURCE': FOLDER + "assets.csv", 'ETL_ENTITIES_SOURCE': FOLDER + "entities.csv",
+                   'ETL_JOIN_SOURCE': FOLDER + "assets_entities_join.csv"}
+        with patch.dict(os.environ, sources):
+            self.assertEqual(self.wait_for(self.api.post('/etl/runs').json()['id'])['status'], 'succeeded')
+
+
+class TestStatsEndpoints(ApiTestCase):
+    """Endpoint tests for /stats and /stats/{citycode}."""
+
+    def setUp(self):
+        super().setUp()
+        self.documents = [{'_id': 'L263', 'cityCode': 'L263', 'assets': 1, 'owners': 1, 'ownershipShare': 1.0,
+                           'catasto': [{'catasto': 'F', 'assets': 1, 'owners': 1, 'ownershipShare': 1.0}]},
+                          {'_id': 'A024', 'cityCode': 'A024', 'assets': 2, 'owners': 1, 'ownershipShare': 2.0,
+                           'catasto': [{'catasto': 'F', 'assets': 2, 'owners': 1, 'ownershipShare': 2.0}]}]
+        self.database.assets_stats.insert_many([dict(document) for document in self.documents])
+
+    def test_stats(self):
+        """Test that every city is returned in city code order."""
+        response = self.api.get('/stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [self.documents[1], self.documents[0]])
+
+    def test_city_stats(self):
+        """Test the statistics of a city and the 404 of a city without statistics."""
+        self.assertEqual(self.api.get('/stats/L263').json(), self.documents[0])
+        response = self.api.get('/stats/Z999')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'message': 'Statistics not found'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import pandas as pd
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.metrics import PipelineMetrics, RequestMetricsMiddleware, Histogram, stage_span, peak_rss_bytes
+from app.transform import validate_assets, validate_entities
+
+
+class TestStageSpan(unittest.TestCase):
+    """Unit tests for the pipeline stage spans."""
+
+    def test_span_accumulates(self):
+        """Test that a stage entered once per chunk accumulates its rows in one span."""
+        spans = {}
+        for rows in [3, 4]:
+            with stage_span(spans, 'transform') as span:
+                span['rows_out'] += rows
+        self.assertEqual(list(spans), ['transform'])
+        self.assertEqual(spans['transform']['rows_out'], 7)
+        self.assertGreater(spans['transform']['peak_rss_bytes'], 0)
+
+    def test_peak_rss(self):
+        """Test that the peak resident memory is available."""
+        self.assertGreater(peak_rss_bytes(), 0)
+
+    def test_validation_rejections(self):
+        """Test that every validation rule counts the rows it rejected."""
+        assets = pd.DataFrame({'asset_id': ['a_1', 'a_2', 'a_3', 'a_3'], 'particella': ['1', '2', '3', '3'],
+                               'subalterno': ['1', '-', '3', '3']})
+        entities = pd.DataFrame({'entity_id': ['e_1', None, 'e_3'], 'vatCode': [None, '1', None],
+                                 'taxCode': ['T1', None, None]})
+        rejections = {}
+        validate_assets(assets, rejections)
+        validate_entities(entities, rejections)
+        self.assertEqual(rejections['assets.invalid_characters.subalterno'], 1)
+        self.assertEqual(rejections['assets.duplicate'], 1)
+        self.assertEqual(rejections['entities.missing.entity_id'], 1)
+        self.assertEqual(rejections['entities.missing.vatCode_and_taxCode'], 1)
+
+
+class TestPrometheusMetrics(unittest.TestCase):
+    """Unit tests for the Prometheus text rendering."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that the buckets count the observations below their bound."""
+        histogram = Histogram('latency_seconds', 'Latency.', ('route',), (0.1, 1.0))
+        for value in [0.05, 0.5, 5.0]:
+            histogram.observe(value, '/data')
+        lines = histogram.render()
+        self.assertIn('latency_seconds_bucket{route="/data",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="/data",le="1.0"} 2', lines)
+        self.assertIn('latency_seconds_bucket{route="/data",le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_count{route="/data"} 3', lines)
+
+    def test_record_run(self):
+        """Test that the spans of a finished run are exposed."""
+        metrics = PipelineMetrics()
+        spans = {'validate': {'seconds': 0.2, 'rows_in': 10, 'rows_out': 8, 'rejected': {'join.duplicate': 2},
+                              'peak_rss_bytes': 1024}}
+        metrics.record_run({'status': 'succeeded', 'spans': spans})
+        text = metrics.render({'hits': 1, 'size': 2})
+        self.assertIn('etl_runs_total{status="succeeded"} 1', text)
+        self.assertIn('etl_stage_rows_total{stage="validate",direction="out"} 8', text)
+        self.assertIn('etl_rejected_rows_total{rule="join.duplicate"} 2', text)
+        self.assertIn('etl_stage_peak_rss_bytes{stage="validate"} 1024', text)
+        self.assertIn('response_cache_hits_total 1', text)
+        self.assertIn('response_cache_size 2', text)
+
+    def test_request_latency_by_route(self):
+        """Test that requests are observed by route template, not by path."""
+        metrics = PipelineMetrics()
+        app = FastAPI()
+        app.add_middleware(RequestMetricsMiddleware, metrics=metrics)
+
+        @app.get("/data/{citycode}")
+        def read(citycode: str):
+            return {}
+
+        client = TestClient(app)
+        client.get('/data/A024')
+        client.get('/data/L263')
+        client.get('/missing')
+        text = metrics.render()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/data/{citycode}",status="200"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+import pandas as pd
+from app.extract import extract_data
+from app.load import convert_df_to_json
+from app.parallel import split_partitions, parallel_transform
+from app.schema import ASSET_SCHEMA, ENTITY_SCHEMA, JOIN_SCHEMA
+from app.transform import validate_assets, validate_entities, validate_join, transform_data
+from benchmarks.generate import generate_dataset
+
+ASSET_FILE = "dataset/data engineer 2023 - input - assets.csv"
+ENTITY_FILE = "dataset/data engineer 2023 - input - entities.csv"
+JOIN_FILE = "dataset/data engineer 2023 - input - assets_entities_join.csv"
+
+
+def read_inputs(asset_file, entity_file, join_file):
+    """Read the three input files with their declared schemas."""
+    return (extract_data(asset_file, schema=ASSET_SCHEMA), extract_data(entity_file, schema=ENTITY_SCHEMA),
+            extract_data(join_file, schema=JOIN_SCHEMA))
+
+
+def serial_transform(asset_data, entity_data, join_data, rejections=None):
+    """Validate and transform the data in process, as etl_pipeline does with a single worker."""
+    return transform_data(validate_assets(asset_data, rejections), validate_entities(entity_data, rejections),
+                          validate_join(join_data, rejections))
+
+
+class TestParallelTransform(unittest.TestCase):
+    """Unit tests for the partitioned multi-process transform."""
+
+    def test_split_partitions_covers_every_row(self):
+        """Test that every row lands in exactly one partition, with equal keys together."""
+        df = pd.DataFrame({'asset_id': ['a_1', 'a_2', 'a_1', 'a_3'], 'value': [1, 2, 3, 4]})
+        parts = split_partitions(df, 'asset_id', 3)
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(sorted(pd.concat(parts)['value']), [1, 2, 3, 4])
+        self.assertEqual(sum(part['asset_id'].eq('a_1').any() for part in parts), 1)
+
+    def test_parallel_transform_matches_serial(self):
+        """Test that the parallel transform outputs the same records, in the same order, as the serial one."""
+        expected_rejections, rejections = {}, {}
+        expected = serial_transform(*read_inputs(ASSET_FILE, ENTITY_FILE, JOIN_FILE), expected_rejections)
+        result = parallel_transform(*read_inputs(ASSET_FILE, ENTITY_FILE, JOIN_FILE), workers=2,
+                                    rejections=rejections)
+        self.assertEqual(convert_df_to_json(result), convert_df_to_json(expected))
+        self.assertEqual(rejections, expected_rejections)
+
+    def test_parallel_transform_matches_serial_with_invalid_rows(self):
+        """Test the equivalence on generated data with duplicates, invalid rows and unreferenced entities."""
+        with tempfile.TemporaryDirectory() as directory:
+            generate_dataset(directory, 2000, invalid_rate=0.1, duplicate_rate=0.05)
+            files = [f"{directory}/data engineer 2023 - input - {name}.csv"
+                     for name in ['assets', 'entities', 'assets_entities_join']]
+            expected = serial_transform(*read_inputs(*files))
+            result = parallel_transform(*read_inputs(*files), workers=2, partitions=5)
+        self.assertEqual(convert_df_to_json(result), convert_df_to_json(expected))
+
+    def test_parallel_transform_of_validated_data(self):
+        """Test that already validated data is only merged and transformed."""
+        asset_data, entity_data, join_data = read_inputs(ASSET_FILE, ENTITY_FILE, JOIN_FILE)
+        asset_data, entity_data, join_data = (validate_assets(asset_data), validate_entities(entity_data),
+                                              validate_join(join_data))
+        expected = transform_data(asset_data.copy(), entity_data.copy(), join_data.copy())
+        rejections = {}
+        result = parallel_transform(asset_data, entity_data, join_data, workers=2, rejections=rejections,
+                                    validated=True)
+        self.assertEqual(convert_df_to_json(result), convert_df_to_json(expected))
+        self.assertEqual(rejections, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
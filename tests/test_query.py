@@ -0,0 +1,94 @@
+import json
+import unittest
+from bson import ObjectId
+from app import query
+from app.query import parse_cursor, build_projection, find_documents, iter_json_array, iter_ndjson
+import mongomock
+
+
+class TestSerialization(unittest.TestCase):
+    """Unit tests for the streamed serializers."""
+
+    def setUp(self):
+        self.documents = [{'_id': ObjectId(), 'cityCode': 'A024', 'ownerships': {'entity_id': 'e_1', 'share': 0.5}},
+                          {'_id': 'a_2|e_2', 'cityCode': 'L263', 'ownerships': [{'entity_id': 'e_2'}]}]
+
+    def expected_documents(self):
+        return [dict(document, _id=str(document['_id'])) for document in self.documents]
+
+    def test_iter_json_array_matches_json_dumps(self):
+        """Test that the streamed array is byte for byte the indented JSON of the whole list."""
+        expected = json.dumps(self.expected_documents(), indent=4, default=str)
+        self.assertEqual(''.join(iter_json_array(self.documents)), expected)
+
+    def test_iter_json_array_in_several_batches(self):
+        """Test that batching does not change the serialized text."""
+        original = query.BATCH_SIZE
+        query.BATCH_SIZE = 1
+        try:
+            expected = json.dumps(self.expected_documents(), indent=4, default=str)
+            self.assertEqual(''.join(iter_json_array(self.documents)), expected)
+        finally:
+            query.BATCH_SIZE = original
+
+    def test_iter_json_array_empty(self):
+        """Test that no documents serialize to an empty array."""
+        self.assertEqual(''.join(iter_json_array([])), '[]')
+
+    def test_iter_ndjson(self):
+        """Test that every document is written on its own line."""
+        lines = ''.join(iter_ndjson(self.documents)).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected_documents())
+
+
+class TestQueryParameters(unittest.TestCase):
+    """Unit tests for the pagination and projection parameters."""
+
+    def test_parse_cursor(self):
+        """Test that ObjectId strings are converted back and other ids are kept as strings."""
+        object_id = ObjectId()
+        self.assertEqual(parse_cursor(str(object_id)), object_id)
+        self.assertEqual(parse_cursor('a_1|e_1'), 'a_1|e_1')
+
+    def test_build_projection(self):
+        """Test that the requested fields are projected and internal fields stay hidden."""
+        self.assertEqual(build_projection(None), {'_fingerprint': 0})
+        self.assertEqual(build_projection('cityCode, ownerships,_fingerprint'), {'cityCode': 1, 'ownerships': 1})
+
+
+class TestFindDocuments(unittest.TestCase):
+    """Unit tests for the keyset pagination."""
+
+    def test_pages_cover_the_collection(self):
+        """Test that following the 'after' cursor returns every document exactly once."""
+        collection = mongomock.MongoClient().db.collection
+        collection.insert_many([{'_id': f'id_{number:02d}', 'value': number, '_fingerprint': 'x'}
+                                for number in range(25)])
+        seen, after = [], None
+        while True:
+            page = list(find_documents(collection, {}, limit=10, after=after, fields='value'))
+            seen.extend(document['value'] for document in page)
+            if len(page) < 10:
+                break
+            after = page[-1]['_id']
+        self.assertEqual(seen, list(range(25)))
+        self.assertNotIn('_fingerprint', page[0])
+
+    def test_owner_lookup_pages(self):
+        """Test that the owner filter of /owners matches single owners and aggregated ownerships, page by page."""
+        collection = mongomock.MongoClient().db.collection
+        collection.insert_many([
+            {'_id': 'a_1|e_1', 'ownerships': {'entity_id': 'e_1', 'taxCode': 'T1', 'vatCode': ''}},
+            {'_id': 'a_2', 'ownerships': [{'entity_id': 'e_2', 'taxCode': 'T2', 'vatCode': 'V2'},
+                                          {'entity_id': 'e_1', 'taxCode': 'T1', 'vatCode': ''}]},
+            {'_id': 'a_3|e_2', 'ownerships': {'entity_id': 'e_2', 'taxCode': 'T2', 'vatCode': 'V2'}},
+        ])
+        first = list(find_documents(collection, {'ownerships.taxCode': 'T1'}, limit=1))
+        second = list(find_documents(collection, {'ownerships.taxCode': 'T1'}, limit=1, after=first[-1]['_id']))
+        self.assertEqual([document['_id'] for document in first + second], ['a_1|e_1', 'a_2'])
+        self.assertEqual([document['_id'] for document in find_documents(collection, {'ownerships.vatCode': 'V2'})],
+                         ['a_2', 'a_3|e_2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
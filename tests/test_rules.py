@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from app.rules import (required, at_least_one, matches, unique, apply_rules, rejection_report,
+                       write_rejection_report, ALPHANUMERIC, ENTITY_RULES)
+
+
+class TestRules(unittest.TestCase):
+    """Unit tests for the declarative validation rules."""
+
+    def setUp(self):
+        self.entities = pd.DataFrame({
+            'entity_id': ['e_1', None, 'e_3', 'e_1', 'e_5'],
+            'taxCode': ['T1', 'T2', None, 'T1', None],
+            'vatCode': [None, None, None, None, 'V5'],
+        })
+
+    def test_apply_rules_filters_once_and_counts(self):
+        """Test that every rejected row is counted against the first rule it breaks."""
+        rejections = {}
+        result = apply_rules(self.entities, ENTITY_RULES, rejections)
+        self.assertEqual(list(result.index), [0, 4])
+        self.assertEqual(rejections, {'entities.missing.entity_id': 1, 'entities.missing.vatCode_and_taxCode': 1,
+                                      'entities.duplicate': 1})
+
+    def test_apply_rules_report(self):
+        """Test that the report lists the row and the reason code of every rejected row."""
+        report = []
+        apply_rules(self.entities, ENTITY_RULES, report=report)
+        rejected = rejection_report(report)
+        self.assertEqual(list(rejected['row']), [1, 2, 3])
+        self.assertEqual(list(rejected['rule']), ['entities.missing.entity_id',
+                                                  'entities.missing.vatCode_and_taxCode', 'entities.duplicate'])
+
+    def test_unique_ignores_rejected_rows(self):
+        """Test that a row is not a duplicate of an earlier row rejected by another rule."""
+        df = pd.DataFrame({'key': ['a', 'a', 'b'], 'code': ['1-2', '3', '4']})
+        result = apply_rules(df, [('invalid', matches('code', ALPHANUMERIC)), ('duplicate', unique('key'))])
+        self.assertEqual(list(result['code']), ['3', '4'])
+
+    def test_matches_converts_to_text(self):
+        """Test that a non-text column checked against a pattern is converted to text."""
+        result = apply_rules(pd.DataFrame({'code': [1, 2]}), [('invalid', matches('code', ALPHANUMERIC))])
+        self.assertEqual(list(result['code']), ['1', '2'])
+
+    def test_required_and_at_least_one(self):
+        """Test the missing value rules."""
+        df = pd.DataFrame({'a': ['x', None, None], 'b': ['y', 'z', None]})
+        self.assertEqual(len(apply_rules(df, [('missing', required('a', 'b'))])), 1)
+        self.assertEqual(len(apply_rules(df, [('missing', at_least_one('a', 'b'))])), 2)
+
+    def test_write_rejection_report(self):
+        """Test that the report is written as a compressed CSV file."""
+        report = []
+        apply_rules(self.entities, ENTITY_RULES, report=report)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'rejections.csv.gz')
+            self.assertEqual(write_rejection_report(report, file_path), 3)
+            self.assertEqual(list(pd.read_csv(file_path)['rule']), list(rejection_report(report)['rule']))
+        self.assertEqual(len(rejection_report([])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
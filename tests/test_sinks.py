@@ -0,0 +1,137 @@
+import os
+import json
+import tempfile
+import unittest
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.load import convert_df_to_json
+from app.sinks import NdjsonSink, ParquetSink, FanOutSink, make_sink, parse_sinks, record_batches
+import mongomock
+
+
+def make_record(asset_id, entity_id, share=1.0):
+    """Build a record shaped like the output of convert_df_to_json."""
+    return {'cherry_asset_id': f'{asset_id}-A024-F-3-203', 'cityCode': 'A024', 'catasto': 'F', 'sezione': '',
+            'foglio': '3', 'particella': '203', 'subalterno': '',
+            'ownerships': {'entity_id': entity_id, 'vatCode': '', 'taxCode': 'T', 'ownershipShare': share}}
+
+
+def read_ndjson(file_path):
+    """Read back the records of a possibly compressed NDJSON file."""
+    with pa.input_stream(file_path, compression='detect') as stream:
+        return [json.loads(line) for line in stream.read().decode('utf-8').splitlines()]
+
+
+class TestFileSinks(unittest.TestCase):
+    """Unit tests for the NDJSON and Parquet sinks."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.records = [make_record('a_1', 'e_1', 0.5), make_record('a_1', 'e_2', ''), make_record('a_2', 'e_1')]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_ndjson_sink_compresses_by_extension(self):
+        """Test that the records are written batch by batch, compressed according to the file extension."""
+        for name in ['records.ndjson', 'records.ndjson.gz', 'records.ndjson.zst']:
+            sink = NdjsonSink(self.path(name))
+            sink.apply(self.records[:2])
+            self.assertFalse(os.path.exists(self.path(name)))
+            sink.apply(self.records[2:])
+            self.assertEqual(sink.finish()['written'], 3)
+            self.assertEqual(read_ndjson(self.path(name)), self.records)
+
+    def test_ndjson_sink_ignores_loader_fields(self):
+        """Test that the fields added by a loader, such as '_id', are not written."""
+        sink = NdjsonSink(self.path('records.ndjson'))
+        sink.apply([dict(record, _id='id', _fingerprint='f') for record in self.records])
+        sink.finish()
+        self.assertEqual(read_ndjson(self.path('records.ndjson')), self.records)
+
+    def test_parquet_sink(self):
+        """Test that the owners are written as structs, with nulls for the missing shares."""
+        sink = ParquetSink(self.path('records.parquet'))
+        sink.apply(self.records[:1])
+        sink.apply(self.records[1:])
+        sink.finish()
+        table = pq.read_table(self.path('records.parquet'))
+        self.assertEqual(table.column('cherry_asset_id').to_pylist(),
+                         [record['cherry_asset_id'] for record in self.records])
+        self.assertEqual([owner['ownershipShare'] for owner in table.column('ownerships').to_pylist()],
+                         [0.5, None, 1.0])
+
+    def test_parquet_sink_of_aggregated_records(self):
+        """Test that the owners aggregated per asset are written as lists of structs."""
+        sink = ParquetSink(self.path('assets.parquet'))
+        sink.apply([dict(self.records[0], ownerships=[self.records[0]['ownerships'], self.records[1]['ownerships']])])
+        sink.finish()
+        ownerships = pq.read_table(self.path('assets.parquet')).column('ownerships').to_pylist()
+        self.assertEqual([owner['entity_id'] for owner in ownerships[0]], ['e_1', 'e_2'])
+
+    def test_abort_leaves_no_file(self):
+        """Test that an aborted write leaves neither the file nor its partial copy."""
+        for sink in [NdjsonSink(self.path('records.ndjson.gz')), ParquetSink(self.path('records.parquet'))]:
+            sink.apply(self.records)
+            sink.abort()
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+class TestFanOut(unittest.TestCase):
+    """Unit tests for the sink settings and the fan-out to several sinks."""
+
+    def test_parse_sinks(self):
+        """Test the parsing of ETL_SINKS and the refusal of invalid sinks."""
+        self.assertEqual(parse_sinks('mongo, ndjson:/out/a.ndjson.gz'),
+                         [('mongo', None), ('ndjson', '/out/a.ndjson.gz')])
+        for spec in ['', 'csv:/out/a.csv', 'parquet', 'mongo:/out']:
+            with self.assertRaises(ValueError):
+                parse_sinks(spec)
+
+    def test_record_batches_keep_assets_together(self):
+        """Test that the batches of records never split the rows of an asset."""
+        df = pd.DataFrame([make_record('a_1', 'e_1'), make_record('a_1', 'e_2'), make_record('a_1', 'e_3'),
+                           make_record('a_2', 'e_1'), make_record('a_3', 'e_1')])
+        batches = list(record_batches(df, 2))
+        self.assertEqual([len(batch) for batch in batches], [3, 2])
+        self.assertEqual(sum(batches, []), convert_df_to_json(df))
+
+    def test_record_batches_split_entities_without_assets(self):
+        """Test that the rows of the entities owning no asset, which share an empty asset, are still batched."""
+        df = pd.DataFrame([dict(make_record('', f'e_{number}'), asset_id='', cherry_asset_id='----')
+                           for number in range(5)])
+        self.assertEqual([len(batch) for batch in record_batches(df, 2)], [2, 2, 1])
+
+    def test_fan_out_writes_every_sink(self):
+        """Test that one stream of batches is written to the collection and to the files."""
+        collection = mongomock.MongoClient().db.collection
+        records = [make_record('a_1', 'e_1'), make_record('a_2', 'e_2')]
+        with tempfile.TemporaryDirectory() as directory:
+            ndjson, parquet = os.path.join(directory, 'a.ndjson.gz'), os.path.join(directory, 'a.parquet')
+            sink = make_sink(collection, f'mongo,ndjson:{ndjson},parquet:{parquet}', 'incremental')
+            self.assertIsInstance(sink, FanOutSink)
+            sink.apply(records)
+            counts = sink.finish()
+            self.assertEqual(counts['sinks']['mongo']['added'], 2)
+            self.assertEqual(counts['sinks'][f'parquet:{parquet}']['written'], 2)
+            # The incremental load adds '_id' to the records it is given, which the file never sees
+            self.assertEqual(read_ndjson(ndjson), [make_record('a_1', 'e_1'), make_record('a_2', 'e_2')])
+        self.assertEqual(collection.count_documents({}), 2)
+
+    def test_fan_out_abort(self):
+        """Test that aborting a fan-out aborts every sink."""
+        collection = mongomock.MongoClient().db.collection
+        with tempfile.TemporaryDirectory() as directory:
+            sink = make_sink(collection, f"mongo,ndjson:{os.path.join(directory, 'a.ndjson')}")
+            sink.apply([make_record('a_1', 'e_1')])
+            sink.abort()
+            self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(collection.database.list_collection_names(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from pandas.testing import assert_frame_equal
+from app.extract import extract_data
+from app.pipeline import etl_pipeline
+from app.snapshot import SnapshotCache
+from app.transform import validate_assets, validate_entities, validate_join, transform_data
+
+ASSET_FILE = "dataset/data engineer 2023 - input - assets.csv"
+ENTITY_FILE = "dataset/data engineer 2023 - input - entities.csv"
+JOIN_FILE = "dataset/data engineer 2023 - input - assets_entities_join.csv"
+
+
+class TestSnapshotCache(unittest.TestCase):
+    """Unit tests for the snapshot cache of the validated inputs."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'assets.csv')
+        shutil.copy(ASSET_FILE, self.source)
+        self.snapshots = SnapshotCache(os.path.join(self.directory, 'snapshots'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, path):
+        return validate_assets(extract_data(path))
+
+    def test_unchanged_file_is_not_parsed_again(self):
+        """Test that the second load of an unchanged file is read from its snapshot."""
+        build = Mock(side_effect=self.build)
+        first = self.snapshots.load('assets', self.source, build)
+        second = self.snapshots.load('assets', self.source, build)
+        self.assertEqual(build.call_count, 1)
+        assert_frame_equal(first, second)
+
+    def test_changed_file_is_parsed_again(self):
+        """Test that a snapshot is not used once its source file changed."""
+        build = Mock(side_effect=self.build)
+        self.snapshots.load('assets', self.source, build)
+        with open(self.source, 'a') as file:
+            file.write('\na_new,A024,F,,1,2,3')
+        changed = self.snapshots.load('assets', self.source, build)
+        self.assertEqual(build.call_count, 2)
+        self.assertIn('a_new', set(changed['asset_id']))
+
+    def test_refresh_rebuilds_the_snapshot(self):
+        """Test that refresh parses the file again even if it is unchanged."""
+        build = Mock(side_effect=self.build)
+        self.snapshots.load('assets', self.source, build)
+        self.snapshots.load('assets', self.source, build, refresh=True)
+        self.assertEqual(build.call_count, 2)
+
+    def test_content_hash_is_reused_for_unchanged_files(self):
+        """Test that the content hash is only computed again when the size or modification time changes."""
+        first = self.snapshots.fingerprint(self.source)
+        os.utime(self.source, ns=(first['mtime_ns'], first['mtime_ns'] + 1))
+        second = self.snapshots.fingerprint(self.source)
+        self.assertEqual(first['sha256'], second['sha256'])
+        self.assertNotEqual(first['mtime_ns'], second['mtime_ns'])
+
+    def test_least_recently_used_snapshots_are_evicted(self):
+        """Test that the cache keeps at most 'max_entries' snapshots."""
+        snapshots = SnapshotCache(self.snapshots.directory, max_entries=2)
+        for age, name in [(20, 'a'), (10, 'b')]:
+            snapshots.load(name, self.source, self.build)
+            path = snapshots.snapshot_path(name, self.source)
+            os.utime(path, (os.stat(path).st_atime - age, os.stat(path).st_mtime - age))
+        snapshots.load('c', self.source, self.build)
+        remaining = [os.path.basename(path).split('-')[0] for path, _, _ in snapshots.entries()]
+        self.assertEqual(remaining, ['b', 'c'])
+
+    def test_snapshots_preserve_the_transform_output(self):
+        """Test that transforming the snapshotted inputs gives the same output as transforming the CSV files."""
+        inputs = [('assets', ASSET_FILE, validate_assets), ('entities', ENTITY_FILE, validate_entities),
+                  ('join', JOIN_FILE, validate_join)]
+        expected = transform_data(*[validate(extract_data(path)) for _, path, validate in inputs])
+        for _ in range(2):
+            frames = [self.snapshots.load(name, path, lambda path, validate=validate: validate(extract_data(path)))
+                      for name, path, validate in inputs]
+        assert_frame_equal(transform_data(*frames), expected)
+
+
+    def test_snapshot_hit_keeps_the_rejection_report(self):
+        """Test that a run reading every input from its snapshot writes the same rejection report and counts."""
+        report_file = os.path.join(self.directory, 'rejections.csv')
+        environment = {'ETL_ASSETS_SOURCE': ASSET_FILE, 'ETL_ENTITIES_SOURCE': ENTITY_FILE,
+                       'ETL_JOIN_SOURCE': JOIN_FILE, 'ETL_SNAPSHOT_DIR': self.snapshots.directory,
+                       'ETL_REJECTION_REPORT': report_file,
+                       'ETL_SINKS': 'ndjson:' + os.path.join(self.directory, 'records.ndjson')}
+        runs = []
+        with patch.dict(os.environ, environment):
+            for _ in range(2):
+                spans = {}
+                etl_pipeline(None, spans=spans)
+                with open(report_file) as file:
+                    runs.append((file.read(), spans['validate']['rejected']))
+        self.assertEqual(runs[1], runs[0])
+        self.assertGreater(len(runs[0][0].splitlines()), 1)
+        self.assertTrue(any(runs[0][1].values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
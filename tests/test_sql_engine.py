@@ -0,0 +1,83 @@
+import tempfile
+import unittest
+import pandas as pd
+from app.extract import extract_data
+from app.load import convert_df_to_json
+from app.schema import ASSET_SCHEMA, ENTITY_SCHEMA, JOIN_SCHEMA
+from app.sql_engine import sql_transform
+from app.transform import validate_assets, validate_entities, validate_join, transform_data, aggregate_ownerships
+from app.transform import JoinCardinalityError
+from benchmarks.generate import generate_dataset
+
+ASSET_FILE = "dataset/data engineer 2023 - input - assets.csv"
+ENTITY_FILE = "dataset/data engineer 2023 - input - entities.csv"
+JOIN_FILE = "dataset/data engineer 2023 - input - assets_entities_join.csv"
+
+
+def run_both(asset_file, entity_file, join_file, chunksize, batch_size=1000):
+    """Transform the files with pandas and with the SQLite engine, returning both outputs and their rejections."""
+    expected_rejections, rejections = {}, {}
+    expected = transform_data(validate_assets(extract_data(asset_file, schema=ASSET_SCHEMA), expected_rejections),
+                              validate_entities(extract_data(entity_file, schema=ENTITY_SCHEMA), expected_rejections),
+                              validate_join(extract_data(join_file, schema=JOIN_SCHEMA), expected_rejections))
+    entity_data = validate_entities(extract_data(entity_file, schema=ENTITY_SCHEMA), rejections)
+    batches = list(sql_transform(extract_data(asset_file, chunksize, ASSET_SCHEMA), entity_data,
+                                 extract_data(join_file, chunksize, JOIN_SCHEMA), batch_size, rejections=rejections))
+    return expected, batches, expected_rejections, rejections
+
+
+class TestSqlTransform(unittest.TestCase):
+    """Unit tests for the SQLite transform engine."""
+
+    def test_sql_transform_matches_transform_data(self):
+        """Test that the engine yields the records of transform_data, in the same order, in batches."""
+        expected, batches, expected_rejections, rejections = run_both(ASSET_FILE, ENTITY_FILE, JOIN_FILE, 7, 30)
+        self.assertGreater(len(batches), 1)
+        result = pd.concat(batches, ignore_index=True)
+        self.assertEqual(list(result.columns), list(expected.columns))
+        self.assertEqual(convert_df_to_json(result), convert_df_to_json(expected))
+        self.assertEqual(rejections, expected_rejections)
+
+    def test_sql_transform_with_duplicates_across_chunks(self):
+        """Test the equivalence on generated data with invalid rows and rows duplicated across chunks."""
+        with tempfile.TemporaryDirectory() as directory:
+            generate_dataset(directory, 2000, invalid_rate=0.1, duplicate_rate=0.05)
+            files = [f"{directory}/data engineer 2023 - input - {name}.csv"
+                     for name in ['assets', 'entities', 'assets_entities_join']]
+            expected, batches, expected_rejections, rejections = run_both(*files, chunksize=500)
+        self.assertEqual(convert_df_to_json(pd.concat(batches)), convert_df_to_json(expected))
+        self.assertEqual(rejections, expected_rejections)
+
+    def test_batches_hold_whole_assets(self):
+        """Test that the batches aggregated per asset give the documents of the in-memory asset output mode."""
+        expected, batches, _, _ = run_both(ASSET_FILE, ENTITY_FILE, JOIN_FILE, 7, 5)
+        aggregated = pd.concat([aggregate_ownerships(batch) for batch in batches], ignore_index=True)
+        self.assertEqual(convert_df_to_json(aggregated), convert_df_to_json(aggregate_ownerships(expected)))
+
+    def test_entities_without_assets_are_batched(self):
+        """Test that the entities owning no asset are split into batches instead of being held in a single one."""
+        entity_data = pd.DataFrame({'entity_id': [f'e_{number}' for number in range(12)],
+                                    'taxCode': [f'T{number}' for number in range(12)], 'vatCode': [None] * 12})
+        asset_data = pd.DataFrame({'asset_id': ['a_1'], 'cityCode': ['A024'], 'catasto': ['F'], 'sezione': [None],
+                                   'foglio': ['3'], 'particella': ['203'], 'subalterno': ['3']})
+        join_data = pd.DataFrame({'asset_id': ['a_1'], 'entity_id': ['e_0'], 'ownershipShare': ['1']})
+        batches = list(sql_transform([asset_data], entity_data, [join_data], 5))
+        self.assertEqual([len(batch) for batch in batches], [5, 5, 2])
+        aggregated = pd.concat([aggregate_ownerships(batch) for batch in batches], ignore_index=True)
+        self.assertEqual(aggregated['cherry_asset_id'].tolist(), ['a_1-A024-F-3-203'])
+
+    def test_sql_transform_join_options(self):
+        """Test that repeated lookup keys are refused when validated, and that only the outer join is supported."""
+        entity_data = pd.DataFrame({'entity_id': ['e_1', 'e_1'], 'taxCode': ['T1', 'T2'], 'vatCode': [None, None]})
+        asset_data = pd.DataFrame({'asset_id': ['a_1'], 'cityCode': ['A024'], 'catasto': ['F'], 'sezione': [None],
+                                   'foglio': ['3'], 'particella': ['203'], 'subalterno': ['3']})
+        join_data = pd.DataFrame({'asset_id': ['a_1'], 'entity_id': ['e_1'], 'ownershipShare': ['1/2']})
+        self.assertEqual(len(pd.concat(sql_transform([asset_data], entity_data, [join_data]))), 2)
+        with self.assertRaises(JoinCardinalityError):
+            list(sql_transform([asset_data], entity_data, [join_data], join_options={'validate': True}))
+        with self.assertRaises(ValueError):
+            list(sql_transform([asset_data], entity_data, [join_data], join_options={'how': 'inner'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
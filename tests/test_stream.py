@@ -0,0 +1,65 @@
+import unittest
+import pandas as pd
+from app.extract import extract_data
+from app.stream import partition_ids, stream_transform
+from app.transform import validate_assets, validate_entities, validate_join, transform_data
+
+ASSET_FILE = "dataset/data engineer 2023 - input - assets.csv"
+ENTITY_FILE = "dataset/data engineer 2023 - input - entities.csv"
+JOIN_FILE = "dataset/data engineer 2023 - input - assets_entities_join.csv"
+
+
+def sort_rows(df):
+    """Sort a transformed DataFrame into a canonical row order for comparison."""
+    columns = [column for column in df.columns if column != 'ownerships']
+    return df.sort_values(columns).reset_index(drop=True)[sorted(df.columns)]
+
+
+class TestStreamTransform(unittest.TestCase):
+    """Unit tests for the chunked streaming transform."""
+
+    def test_extract_data_yields_chunks(self):
+        """Test that extract_data streams a file in chunks of the requested size."""
+        chunks = list(extract_data(ASSET_FILE, chunksize=10))
+        self.assertTrue(all(len(chunk) <= 10 for chunk in chunks))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(pd.read_csv(ASSET_FILE)))
+
+    def test_extract_data_chunks_of_empty_file(self):
+        """Test that streaming an empty file yields no chunks."""
+        self.assertEqual(list(extract_data("dataset/data.csv", chunksize=10)), [])
+
+    def test_partition_ids_are_stable_across_chunks(self):
+        """Test that equal keys are assigned to the same partition."""
+        first = partition_ids(pd.DataFrame({'asset_id': ['a_1', 'a_2']}), 'asset_id', 4)
+        second = partition_ids(pd.DataFrame({'asset_id': ['a_2', 'a_1']}), 'asset_id', 4)
+        self.assertEqual(list(first), list(second[::-1]))
+
+    def test_stream_transform_matches_transform_data(self):
+        """Test that the streamed output contains exactly the rows of the in-memory transform."""
+        entity_data = validate_entities(pd.read_csv(ENTITY_FILE, dtype=str))
+        expected = transform_data(
+            validate_assets(pd.read_csv(ASSET_FILE, dtype=str)),
+            entity_data.copy(),
+            validate_join(pd.read_csv(JOIN_FILE, dtype=str)),
+        )
+        result = pd.concat(stream_transform(
+            extract_data(ASSET_FILE, chunksize=7),
+            entity_data,
+            extract_data(JOIN_FILE, chunksize=7),
+            partitions=3,
+        ))
+        pd.testing.assert_frame_equal(sort_rows(result), sort_rows(expected))
+
+    def test_stream_transform_keeps_unreferenced_entities(self):
+        """Test that entities without join rows are emitted like the outer merge does."""
+        asset_data = pd.DataFrame({'asset_id': ['a_1'], 'cityCode': ['A024'], 'catasto': ['F'], 'sezione': [None],
+                                   'foglio': ['3'], 'particella': ['203'], 'subalterno': ['3']})
+        entity_data = pd.DataFrame({'entity_id': ['e_1', 'e_2'], 'taxCode': ['T1', None], 'vatCode': [None, 'V2']})
+        join_data = pd.DataFrame({'asset_id': ['a_1'], 'entity_id': ['e_1'], 'ownershipShare': ['1/2']})
+        expected = transform_data(asset_data.copy(), entity_data.copy(), join_data.copy())
+        result = pd.concat(stream_transform([asset_data], entity_data, [join_data], partitions=2))
+        pd.testing.assert_frame_equal(sort_rows(result), sort_rows(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,24 @@ import unittest
 import pandas as pd
 from app.transform import drop_columns, remove_duplicates, validate_assets, validate_entities, validate_join
 from app.transform import remove_invalid_characters, remove_invalid_records, fill_missing_values, delete_nan_rows,create_cherry_asset_id
+from app.transform import create_ownerships, convert_ownership_share_to_float, merge_data, transform_data
+from app.transform import create_cherry_asset_ids, create_ownerships_column, convert_ownership_shares_to_float
+from app.transform import aggregate_ownerships, encode_keys, estimate_join_size, JoinCardinalityError, JOIN_TYPES
+from app.transform import city_stats, city_statistics
+
+
+def row_wise_transform_data(asset_data, entity_data, join_data):
+    """Reference implementation of transform_data built from the row-wise helpers."""
+    join_data['ownershipShare'] = join_data['ownershipShare'].apply(convert_ownership_share_to_float)
+    merged_data = merge_data(asset_data, entity_data, join_data)
+    merged_data = delete_nan_rows(merged_data, ['vatCode', 'taxCode'])
+    merged_data = remove_duplicates(merged_data)
+    merged_data = fill_missing_values(merged_data)
+    merged_data['foglio'] = merged_data['foglio'].astype(str)
+    merged_data['cherry_asset_id'] = merged_data.apply(create_cherry_asset_id, axis=1)
+    merged_data['ownerships'] = merged_data.apply(create_ownerships, axis=1)
+    return merged_data
+
 
 class TestTransformFunctions(unittest.TestCase):
     """Unit tests for the Transform class."""
@@ -57,5 +75,165 @@ class TestTransformFunctions(unittest.TestCase):
         expected = pd.DataFrame({'A': ['123abc', '456def'], 'B': ['abc', 'def456']})
         pd.testing.assert_frame_equal(result, expected)
 
+
+class TestVectorizedTransform(unittest.TestCase):
+    """Equivalence tests between the vectorized transform and the row-wise helpers."""
+
+    def test_convert_ownership_shares_to_float(self):
+        """Test that the column-wise conversion matches the per-value conversion."""
+        values = ['1', '0.5', '1/3', '1000/1000', '01', 'A', '1,', None, ' 2/3']
+        result = convert_ownership_shares_to_float(pd.Series(values, dtype=object))
+        expected = [convert_ownership_share_to_float(value) for value in values]
+        self.assertEqual(result.tolist(), expected)
+
+    def test_convert_ownership_shares_to_float_invalid_fractions(self):
+        """Test that malformed fractions and divisions by zero become None."""
+        result = convert_ownership_shares_to_float(pd.Series(['1/0', '1/2/3', 'a/b']))
+        self.assertEqual(result.tolist(), [None, None, None])
+
+    def test_create_cherry_asset_ids(self):
+        """Test that the concatenated identifiers match the row-wise identifiers."""
+        df = pd.DataFrame({'asset_id': ['a_1', 'a_2'], 'cityCode': ['A024', ''], 'catasto': ['F', 'T'],
+                           'foglio': ['3.0', ''], 'particella': ['203', '7']})
+        expected = df.apply(create_cherry_asset_id, axis=1)
+        pd.testing.assert_series_equal(create_cherry_asset_ids(df), expected, check_dtype=False)
+
+    def test_create_ownerships_column(self):
+        """Test that the column-wise ownerships match the row-wise ownerships."""
+        df = pd.DataFrame({'entity_id': ['e_1', 'e_2'], 'vatCode': ['', 123.0], 'taxCode': ['T1', ''],
+                           'ownershipShare': [1.0, 0.33]})
+        expected = df.apply(create_ownerships, axis=1)
+        self.assertEqual(create_ownerships_column(df).tolist(), expected.tolist())
+
+    def test_transform_data_matches_row_wise_transform(self):
+        """Test that transform_data produces exactly the output of the row-wise implementation."""
+        folder = "dataset/data engineer 2023 - input - "
+        asset_data = validate_assets(pd.read_csv(folder + "assets.csv"))
+        entity_data = validate_entities(pd.read_csv(folder + "entities.csv"))
+        join_data = validate_join(pd.read_csv(folder + "assets_entities_join.csv"))
+        expected = row_wise_transform_data(asset_data.copy(), entity_data.copy(), join_data.copy())
+        result = transform_data(asset_data.copy(), entity_data.copy(), join_data.copy())
+        pd.testing.assert_frame_equal(result, expected)
+
+
+class TestMergeData(unittest.TestCase):
+    """Unit tests for the guarded merge_data function."""
+
+    def setUp(self):
+        self.asset_data = pd.DataFrame({'asset_id': ['a_2', 'a_1', 'a_3'], 'foglio': ['2', '1', '3']})
+        self.entity_data = pd.DataFrame({'entity_id': ['e_3', 'e_1', 'e_2'], 'taxCode': ['T3', 'T1', None]})
+        self.join_data = pd.DataFrame({'asset_id': ['a_1', 'a_2', 'a_2', None, 'a_9'],
+                                       'entity_id': ['e_1', 'e_1', 'e_2', 'e_2', None]})
+
+    def test_merge_data_matches_pandas_merge(self):
+        """Test that every join type returns the rows of pd.merge, in the same order."""
+        for how in JOIN_TYPES:
+            expected = pd.merge(self.join_data, self.entity_data, on='entity_id', how=how)
+            expected = pd.merge(expected, self.asset_data, on='asset_id', how=how)
+            result = merge_data(self.asset_data, self.entity_data, self.join_data, how=how)
+            pd.testing.assert_frame_equal(result, expected)
+
+    def test_estimate_join_size(self):
+        """Test that the estimated size of every join type is its exact number of rows."""
+        left_codes, right_codes, _ = encode_keys(self.join_data, self.entity_data, 'entity_id')
+        for how in JOIN_TYPES:
+            expected = len(pd.merge(self.join_data, self.entity_data, on='entity_id', how=how))
+            self.assertEqual(estimate_join_size(left_codes, right_codes, how), expected)
+
+    def test_merge_data_fails_fast(self):
+        """Test that an oversized join or a repeated lookup key raises JoinCardinalityError."""
+        with self.assertRaises(JoinCardinalityError):
+            merge_data(self.asset_data, self.entity_data, self.join_data, max_rows=5)
+        repeated = pd.concat([self.entity_data, self.entity_data.iloc[:1].assign(taxCode='T4')])
+        with self.assertRaises(JoinCardinalityError):
+            merge_data(self.asset_data, repeated, self.join_data, validate=True)
+        self.assertEqual(len(merge_data(self.asset_data, self.entity_data, self.join_data, validate=True,
+                                        max_rows=7)), 7)
+        with self.assertRaises(ValueError):
+            merge_data(self.asset_data, self.entity_data, self.join_data, how='cross')
+
+
+class TestAggregateOwnerships(unittest.TestCase):
+    """Unit tests for the aggregate_ownerships function."""
+
+    def test_aggregate_ownerships(self):
+        """Test that co-owners of an asset are grouped into a single row."""
+        df = pd.DataFrame({
+            'asset_id': ['a_1', 'a_2', 'a_1'],
+            'cherry_asset_id': ['a_1-A-F-3-1', 'a_2-B-F-4-2', 'a_1-A-F-3-1'],
+            'cityCode': ['A', 'B', 'A'], 'catasto': ['F', 'F', 'F'], 'sezione': ['', '', ''],
+            'foglio': ['3', '4', '3'], 'particella': ['1', '2', '1'], 'subalterno': ['', '1', ''],
+            'ownerships': [{'entity_id': 'e_1'}, {'entity_id': 'e_2'}, {'entity_id': 'e_3'}],
+        })
+        result = aggregate_ownerships(df)
+        self.assertEqual(result['cherry_asset_id'].tolist(), ['a_1-A-F-3-1', 'a_2-B-F-4-2'])
+        self.assertEqual(result['ownerships'].tolist(),
+                         [[{'entity_id': 'e_1'}, {'entity_id': 'e_3'}], [{'entity_id': 'e_2'}]])
+        self.assertEqual(result.loc[1, 'subalterno'], '1')
+
+    def test_aggregate_ownerships_keeps_every_owner(self):
+        """Test that aggregating the sample dataset keeps every ownership."""
+        folder = "dataset/data engineer 2023 - input - "
+        transformed = transform_data(validate_assets(pd.read_csv(folder + "assets.csv")),
+                                     validate_entities(pd.read_csv(folder + "entities.csv")),
+                                     validate_join(pd.read_csv(folder + "assets_entities_join.csv")))
+        result = aggregate_ownerships(transformed)
+        self.assertEqual(len(result), transformed['cherry_asset_id'].nunique())
+        self.assertEqual(result['ownerships'].str.len().sum(), len(transformed))
+
+    def test_entities_without_assets_are_left_out(self):
+        """Test that the owners of no asset are not merged into one document of empty asset fields."""
+        entity_data = pd.DataFrame({'entity_id': ['e_1', 'e_2', 'e_3'], 'taxCode': ['T1', 'T2', 'T3'],
+                                    'vatCode': [None, None, None]})
+        asset_data = pd.DataFrame({'asset_id': ['a_1'], 'cityCode': ['A024'], 'catasto': ['F'], 'sezione': [None],
+                                   'foglio': ['3'], 'particella': ['203'], 'subalterno': ['3']})
+        join_data = pd.DataFrame({'asset_id': ['a_1'], 'entity_id': ['e_1'], 'ownershipShare': ['1']})
+        transformed = transform_data(asset_data, entity_data, join_data)
+        self.assertEqual(len(transformed), 3)
+        result = aggregate_ownerships(transformed)
+        self.assertEqual(result['cherry_asset_id'].tolist(), ['a_1-A024-F-3-203'])
+        self.assertEqual([owner['entity_id'] for owner in result.loc[0, 'ownerships']], ['e_1'])
+
+
+class TestCityStatistics(unittest.TestCase):
+    """Unit tests for the per-city statistics."""
+
+    def setUp(self):
+        self.merged = pd.DataFrame({
+            'asset_id': ['a_1', 'a_1', 'a_2', 'a_3', None],
+            'cityCode': ['A024', 'A024', 'A024', 'L263', None],
+            'catasto': ['F', 'F', 'T', 'F', None],
+            'entity_id': ['e_1', 'e_2', 'e_1', 'e_3', 'e_4'],
+            'ownershipShare': [0.5, 0.5, 1.0, None, None],
+        })
+
+    def test_city_statistics(self):
+        """Test the counts and shares of every city and catasto, without the entities owning no asset."""
+        stats = city_statistics([city_stats(self.merged)])
+        self.assertEqual(stats, [
+            {'_id': 'A024', 'cityCode': 'A024', 'assets': 2, 'owners': 2, 'ownershipShare': 2.0,
+             'catasto': [{'catasto': 'F', 'assets': 1, 'owners': 2, 'ownershipShare': 1.0},
+                         {'catasto': 'T', 'assets': 1, 'owners': 1, 'ownershipShare': 1.0}]},
+            {'_id': 'L263', 'cityCode': 'L263', 'assets': 1, 'owners': 1, 'ownershipShare': 0.0,
+             'catasto': [{'catasto': 'F', 'assets': 1, 'owners': 1, 'ownershipShare': 0.0}]},
+        ])
+        self.assertEqual(city_statistics([]), [])
+
+    def test_partial_statistics_combine(self):
+        """Test that the statistics of row sets split by asset combine into those of all the rows."""
+        parts = [city_stats(self.merged.iloc[:2]), city_stats(self.merged.iloc[2:])]
+        self.assertEqual(city_statistics(parts), city_statistics([city_stats(self.merged)]))
+
+    def test_transform_data_collects_statistics(self):
+        """Test that transform_data computes the statistics of the rows it outputs."""
+        folder = "dataset/data engineer 2023 - input - "
+        stats = []
+        transformed = transform_data(validate_assets(pd.read_csv(folder + "assets.csv")),
+                                     validate_entities(pd.read_csv(folder + "entities.csv")),
+                                     validate_join(pd.read_csv(folder + "assets_entities_join.csv")), stats=stats)
+        self.assertEqual(city_statistics(stats), city_statistics([city_stats(transformed)]))
+        located = transformed[transformed['cityCode'] != '']
+        self.assertEqual(sum(city['assets'] for city in city_statistics(stats)), located['asset_id'].nunique())
+
 if __name__ == '__main__':
     unittest.main()